@@ -0,0 +1,224 @@
+"""
+JSON API to read and edit the collections in the db, for scripts and integrations
+that don't need the HTML pages.
+
+GET /api/<collection> (any collection in `database.colls`, e.g. /api/student)
+- Returns the records matching the filter in the query string, one page at a time.
+  The query string takes the same filters as the view and edit pages, as well as
+  - fields: comma separated names of the fields to return (default: all)
+  - limit: the max number of records in the page (default 100, max 1000)
+  - after: the `next` cursor returned with the previous page
+  - format: `records` (default) or `compact`
+```
+{"records": [{"student_name": "OBAMA", ...}, ...], "next": "WzYsIDFd"}
+{"columns": ["student_name", ...], "rows": [["OBAMA", ...], ...], "next": "WzYsIDFd"}
+```
+  `next` is null on the last page.
+
+POST /api/<junction collection> (membership or participation)
+- Makes a batch of changes, given as a JSON body in the format
+```
+{
+    "changes": [
+        {"method": "INSERT", "new": {...}},
+        {"method": "UPDATE", "old": {...}, "new": {...}},
+        {"method": "DELETE", "old": {...}}
+    ]
+}
+```
+  where each record has all the fields of the collection's Entity (e.g. `MembershipRecord`).
+  An UPDATE or DELETE may also give the `key` of the record it changes, e.g.
+  `"key": [student_id, club_id]` for membership (as returned by GET), to change it by its key
+  instead of finding it by the names in `old`.
+  Every change is validated before any of them are made.
+"""
+
+import base64
+import binascii
+import json
+from typing import Any, List, Optional
+from flask import jsonify, request
+
+import data
+import model
+from database import colls
+from database.db_utils import edit_jt_coll
+from model import ENTITIES
+
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+RESERVED_PARAMS = ('fields', 'limit', 'after', 'format')
+FORMATS = ('records', 'compact')
+EDITABLE_COLLECTIONS = ('membership', 'participation')
+ACCEPTED_METHODS = ('UPDATE', 'DELETE', 'INSERT')
+
+
+class InvalidRequestError(Exception):
+    pass
+
+
+def __error(msg: str, status: int):
+    return jsonify({'error': msg}), status
+
+
+def __encode_cursor(key: Optional[list]) -> Optional[str]:
+    if key is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def __decode_cursor(cursor: Optional[str]) -> Optional[list]:
+    if cursor is None:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError) as err:
+        raise InvalidRequestError(f'Invalid cursor `{cursor}`') from err
+    # its values are the key of the last record of a page, given to the db as they are
+    if not isinstance(key, list) or not all(isinstance(value, (int, str, float)) for value in key):
+        raise InvalidRequestError(f'Invalid cursor `{cursor}`')
+    return key
+
+
+def __parse_limit(limit: Optional[str]) -> int:
+    if limit is None:
+        return DEFAULT_LIMIT
+    if not limit.isdecimal() or not 0 < int(limit) <= MAX_LIMIT:
+        raise InvalidRequestError(f'`limit` must be a number from 1 to {MAX_LIMIT}')
+    return int(limit)
+
+
+def __parse_fields(fields: Optional[str], column_names: List[str]) -> Optional[List[str]]:
+    if fields is None:
+        return None
+    fields = [field for field in fields.split(',') if field != '']
+    for field in fields:
+        if field not in column_names:
+            raise InvalidRequestError(f'Invalid field `{field}`')
+    return fields
+
+
+def read(coll_name: str):
+    if coll_name not in colls:
+        return __error(f'No collection `{coll_name}`', 404)
+    coll = colls[coll_name]
+    db_fields = model.db_fields(coll.found_column_names)  # e.g. dates
+
+    args = request.args.to_dict()
+    record_filter = {
+        key: value for key, value in args.items()
+        if key not in RESERVED_PARAMS and value != ''
+    }
+    try:
+        for key in record_filter:
+            if key not in coll.found_column_names:
+                raise InvalidRequestError(f'Invalid filter `{key}`')
+        record_filter = model.to_db(record_filter, db_fields)
+        fields = __parse_fields(args.get('fields'), coll.found_column_names)
+        limit = __parse_limit(args.get('limit'))
+        after = __decode_cursor(args.get('after'))
+        format_ = args.get('format', 'records')
+        if format_ not in FORMATS:
+            raise InvalidRequestError(f'`format` must be one of {FORMATS}')
+        records, next_key = coll.find_page(record_filter, after, limit)
+        model.from_db(records, db_fields)
+    except InvalidRequestError as err:
+        return __error(str(err), 400)
+    except (KeyError, ValueError) as err:  # invalid filter value or cursor
+        return __error(str(err), 400)
+
+    next_cursor = __encode_cursor(next_key)
+    if format_ == 'compact':
+        columns = fields if fields is not None else list(records[0].keys()) if records else []
+        rows = [[record.get(column) for column in columns] for record in records]
+        return jsonify({'columns': columns, 'rows': rows, 'next': next_cursor})
+
+    if fields is not None:
+        records = [{field: record.get(field) for field in fields} for record in records]
+    else:
+        records = [dict(record) for record in records]
+    return jsonify({'records': records, 'next': next_cursor})
+
+
+def __parse_record(entity: Any, record: dict) -> dict:
+    """Return a copy of `record` with its values converted by the parsers of the entity's fields"""
+    parsed = dict(record)
+    for field, parse in zip(entity.fields, entity.field_parsers):
+        if parse is data.parse_as_submitted or field.name not in parsed:
+            continue
+        try:
+            parsed[field.name] = parse(field, parsed[field.name])
+        except ValueError as err:
+            raise InvalidRequestError(f'field `{field.name}`: {err}') from err
+    return parsed
+
+
+def __validate_change(entity: Any, change: Any) -> dict:
+    """
+    Validate a change in a batch, returning it in the format used by `db_utils.edit_jt_coll`
+
+    Raises
+    ------
+    `InvalidRequestError`
+    - if the change is not in the right format
+    `ValidationFailedError`
+    - if any record in the change is invalid
+    """
+    if not isinstance(change, dict):
+        raise InvalidRequestError('Each change must be an object')
+    method = change.get('method')
+    if method not in ACCEPTED_METHODS:
+        raise InvalidRequestError(f'`method` must be one of {ACCEPTED_METHODS}')
+
+    old_record = change.get('old', {})
+    new_record = change.get('new', {})
+    if method == 'DELETE':
+        new_record = old_record
+    elif method == 'INSERT':
+        old_record = {}
+    if not isinstance(old_record, dict) or not isinstance(new_record, dict):
+        raise InvalidRequestError('`old` and `new` must be objects')
+    key = change.get('key') if method != 'INSERT' else None
+    if key is not None and not (
+        isinstance(key, list) and all(isinstance(value, int) for value in key)
+    ):
+        raise InvalidRequestError('`key` must be a list of ids')
+
+    old_record = __parse_record(entity, old_record)
+    new_record = __parse_record(entity, new_record)
+    try:
+        if method != 'INSERT':
+            entity.from_dict(old_record)
+        entity.from_dict(new_record)
+    except KeyError as err:
+        raise InvalidRequestError(f'Missing field {err}') from err
+
+    return {'old': old_record, 'new': new_record, 'method': method, 'key': key}
+
+
+def write(coll_name: str):
+    if coll_name not in EDITABLE_COLLECTIONS:
+        return __error(f'Collection `{coll_name}` can\'t be edited', 404)
+    entity = ENTITIES[coll_name]
+
+    payload = request.get_json(silent=True)
+    changes = payload.get('changes') if isinstance(payload, dict) else None
+    if not isinstance(changes, list):
+        return __error('Body must be a JSON object with a list of `changes`', 400)
+
+    record_deltas = []
+    for idx, change in enumerate(changes):
+        try:
+            record_deltas.append(__validate_change(entity, change))
+        except (InvalidRequestError, data.ValidationFailedError) as err:
+            return __error(f'Change {idx}: {err}', 400)
+
+    results = edit_jt_coll(coll_name, record_deltas)
+    errors = [
+        {'index': idx, 'error': res.msg}
+        for idx, res in enumerate(results)
+        if not res.is_ok
+    ]
+    status = 409 if errors else 200
+    return jsonify({'edits': len(results), 'errors': errors}), status
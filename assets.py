@@ -0,0 +1,225 @@
+"""
+Fingerprinted static files, which browsers cache for good.
+
+`build()` copies every file in static/ to static/dist/, with the hash of its content in its
+name (e.g. css/index.css -> css/index.3f2a1b9c.css), and writes the names to a manifest.
+The `url()`s in CSS files (e.g. `url("../fonts/dankmono_normal.otf")`) are rewritten to the
+fingerprinted names of the files they refer to. Files that gzip well are also precompressed
+(e.g. css/index.3f2a1b9c.css.gz), so they are never compressed per request.
+```
+python assets.py          # build static/dist, also done by server.py before it starts
+python assets.py --clean  # and remove the files no longer in the manifest
+```
+
+`init_app(app)` makes `url_for('static', filename=...)` return the fingerprinted url of each
+file in the manifest, served from /static/dist/ with `Cache-Control: immutable` for a year
+(a changed file gets a new url), precompressed to the requests accepting gzip. A page
+loaded again then only revalidates its HTML. It never builds (the static dir may be read
+only): without a manifest, or with one older than a static file, the static files are
+served from their usual urls instead.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+from flask import Flask, Response, abort, request, send_file
+from werkzeug.security import safe_join
+
+import compression
+
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = 'dist'  # in the static dir
+MANIFEST = 'manifest.json'  # in the dist dir
+HASH_LENGTH = 8  # hex digits of the hash in the fingerprinted names
+MAX_AGE = 365 * 24 * 60 * 60  # seconds the fingerprinted files are cached for
+MAX_GZIP_RATIO = 0.9  # files are only precompressed to at most this fraction of their size
+
+# url(...) in CSS, with the url in group 2
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+Manifest = Dict[str, str]  # {name: fingerprinted name}, relative to the static and dist dirs
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprinted_name(name: str, content: bytes) -> str:
+    """Return the `name` of a file with the hash of its `content`, e.g. css/index.3f2a1b9c.css"""
+    root, ext = posixpath.splitext(name)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{ext}'
+
+
+def rewrite_css_urls(name: str, css: str, manifest: Manifest) -> str:
+    """
+    Return the `css` of the file `name` with its relative `url()`s to the files in the `manifest`
+    replaced by their fingerprinted names, e.g. `url("../fonts/a.otf")` -> `url("../fonts/a.1f2e3d4c.otf")`
+    """
+    directory = posixpath.dirname(name)
+
+    def replace(match: re.Match) -> str:
+        quote, url = match.groups()
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()  # e.g. a.svg, #icon
+        if not path or path.startswith('/') or ':' in path:  # absolute, or e.g. data:
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(directory, path))
+        if target not in manifest:
+            return match.group(0)
+        # the fingerprinted files keep their directories, so relative urls still work
+        new_path = posixpath.relpath(manifest[target], directory or '.')
+        return f'url({quote}{new_path}{suffix}{quote})'
+
+    return CSS_URL.sub(replace, css)
+
+
+def source_files(static_dir: str = STATIC_DIR) -> Iterator[Tuple[str, str]]:
+    """Yield the (name, path) of every file in `static_dir` (except the dist dir), names use /"""
+    for directory, dirnames, filenames in os.walk(static_dir):
+        if directory == static_dir and DIST_DIR in dirnames:
+            dirnames.remove(DIST_DIR)
+        for filename in sorted(filenames):
+            path = os.path.join(directory, filename)
+            yield os.path.relpath(path, static_dir).replace(os.sep, '/'), path
+
+
+def _write(path: str, content: bytes) -> None:
+    """Write the file at `path`, so it is never seen half written"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def build(static_dir: str = STATIC_DIR, clean: bool = False) -> Manifest:
+    """
+    Copy every file in `static_dir` to its dist dir with a fingerprinted name (see `assets`),
+    precompressing those worth it, and write the manifest of their names last. The files
+    of previous builds are kept for the pages still referring to them, unless `clean`.
+
+    Return
+    - the manifest
+    """
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    contents = {}
+    for name, path in source_files(static_dir):
+        with open(path, 'rb') as f:
+            contents[name] = f.read()
+
+    manifest: Manifest = {}
+    # CSS last, as its urls are rewritten to the fingerprinted names of the other files
+    for name in sorted(contents, key=lambda name: name.endswith('.css')):
+        content = contents[name]
+        if name.endswith('.css'):
+            content = rewrite_css_urls(name, content.decode('utf-8'), manifest).encode('utf-8')
+        manifest[name] = fingerprinted_name(name, content)
+
+        path = os.path.join(dist_dir, *manifest[name].split('/'))
+        if not os.path.exists(path):  # a fingerprinted file never changes
+            _write(path, content)
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) <= len(content) * MAX_GZIP_RATIO and not os.path.exists(path + '.gz'):
+            _write(path + '.gz', compressed)
+
+    _write(os.path.join(dist_dir, MANIFEST), json.dumps(manifest, indent=2).encode('utf-8'))
+    logger.info('Built %d static files into %s', len(manifest), dist_dir)
+
+    if clean:
+        for name in _clean(dist_dir, manifest):
+            logger.info('Removed %s', name)
+    return manifest
+
+
+def _clean(dist_dir: str, manifest: Manifest) -> List[str]:
+    """Remove the files in `dist_dir` not in the `manifest` (nor their .gz), returning their names"""
+    keep = {MANIFEST, *manifest.values()}
+    keep |= {name + '.gz' for name in keep}
+    removed = []
+    for name, path in source_files(dist_dir):
+        if name not in keep:
+            os.remove(path)
+            removed.append(name)
+    return removed
+
+
+def load(static_dir: str = STATIC_DIR) -> Optional[Manifest]:
+    """
+    Return the manifest of the last build of `static_dir`, or None if there is none
+    or any file in `static_dir` changed since (see `build`)
+    """
+    manifest_path = os.path.join(static_dir, DIST_DIR, MANIFEST)
+    try:
+        built_at = os.path.getmtime(manifest_path)
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if any(os.path.getmtime(path) > built_at for _, path in source_files(static_dir)):
+        return None
+    return manifest
+
+
+def serve(dist_dir: str, filename: str) -> Response:
+    """
+    Send the fingerprinted file `filename` in `dist_dir` (precompressed if the request
+    accepts gzip), cached by browsers and proxies for `MAX_AGE` without revalidating it
+    """
+    path = safe_join(dist_dir, filename)
+    if path is None or filename.endswith('.gz') or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if compression.accepts_gzip(request.environ) and os.path.isfile(path + '.gz'):
+        response = send_file(path + '.gz', mimetype=mimetype, max_age=MAX_AGE)
+        response.content_encoding = 'gzip'
+    else:
+        response = send_file(path, mimetype=mimetype, max_age=MAX_AGE)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app: Flask) -> None:
+    """
+    Serve the static files of `app` fingerprinted, from the urls returned by
+    `url_for('static', filename=...)`, if they were built since they last changed (see `build`)
+    """
+    manifest = load(app.static_folder)
+    if manifest is None:
+        logger.warning(
+            'The static files are not fingerprinted, as %s is missing or stale (run `python assets.py`)',
+            os.path.join(app.static_folder, DIST_DIR, MANIFEST))
+        return
+    dist_dir = os.path.join(app.static_folder, DIST_DIR)
+
+    def fingerprinted_url(endpoint: str, values: dict) -> None:
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = f'{DIST_DIR}/{manifest[values["filename"]]}'
+
+    def serve_fingerprinted(filename: str) -> Response:
+        return serve(dist_dir, filename)
+
+    app.url_defaults(fingerprinted_url)
+    app.add_url_rule(f'{app.static_url_path}/{DIST_DIR}/<path:filename>', 'assets', serve_fingerprinted)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Fingerprint and precompress the static files.')
+    parser.add_argument('--static-dir', default=STATIC_DIR, help='the static files to build')
+    parser.add_argument(
+        '--clean', action='store_true', help='remove the files of previous builds from the dist dir')
+    args = parser.parse_args()
+
+    manifest = build(args.static_dir, args.clean)
+    for name, fingerprinted in manifest.items():
+        print(f'{name} -> {DIST_DIR}/{fingerprinted}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+"""
+Benchmarks of the core operations of the app on a synthetic school (see `bench.generate`).
+
+```
+python -m bench                          # run every benchmark, compare with bench/baseline.json
+python -m bench --only find,render       # only some of them
+python -m bench --scale small --repeat 3 # a quick run
+python -m bench --out results.json       # also save the results
+python -m bench --save-baseline          # make the results the new baseline
+```
+
+A run prints the median time of each benchmark next to the baseline's, and exits with an
+error if any got slower than `--tolerance` allows (with `--check`). Timings depend on the
+machine, so only compare runs made on the same machine, at the same scale.
+
+To find how many users at once the app handles, load test it with `python -m bench.load`.
+"""
@@ -0,0 +1,243 @@
+"""
+Synthetic school datasets for the benchmarks, shaped like `database/csv_data`.
+
+`generate` writes the CSVs read by `database.init_db_from_csvs` into `<directory>/database/csv_data`,
+and builds the db `<directory>/database/nyjc.db` with every table filled in, including the
+activities, memberships and participations that are otherwise only added through the app.
+The same `seed` always generates the same dataset.
+```
+python -m bench.generate /tmp/school                            # the `school` scale
+python -m bench.generate /tmp/school --students 5000 --participations 50000
+```
+"""
+
+import argparse
+import contextlib
+import csv
+import os
+import random
+import shutil
+import tempfile
+from typing import Dict, Iterator, List, Sequence, Tuple, TypedDict
+
+import database
+from database.connection import connect
+
+
+class Scale(TypedDict):
+    students: int
+    clubs: int
+    activities: int
+    memberships: int  # rows in Student_club
+    participations: int  # rows in Student_activity
+    subjects_per_student: int
+
+
+SCALES: Dict[str, Scale] = {
+    # a large school, the size the app must stay fast at
+    'school': {
+        'students': 20_000,
+        'clubs': 300,
+        'activities': 2_000,
+        'memberships': 40_000,
+        'participations': 200_000,
+        'subjects_per_student': 4,
+    },
+    # quick runs, e.g. to check the benchmarks themselves
+    'small': {
+        'students': 1_000,
+        'clubs': 60,
+        'activities': 100,
+        'memberships': 2_000,
+        'participations': 10_000,
+        'subjects_per_student': 4,
+    },
+}
+
+STUDENTS_PER_CLASS = 25
+SURNAMES = [
+    'TAN', 'LIM', 'LEE', 'NG', 'ONG', 'WONG', 'GOH', 'CHUA', 'CHAN', 'KOH', 'TEO', 'ANG', 'YEO',
+    'TAY', 'HO', 'LOW', 'TOH', 'SIM', 'CHONG', 'CHIA', 'SEAH', 'PHUA', 'QUEK', 'FOO', 'YAP',
+    'KUMAR', 'RAJ', 'SINGH', 'ISMAIL', 'RAHMAN',
+]
+GIVEN_NAMES = [
+    'WEI', 'MING', 'JUN', 'HUI', 'YI', 'XIN', 'JIA', 'KAI', 'EN', 'QI', 'ZHI', 'HAO', 'LING',
+    'YU', 'SHAN', 'WEN', 'JIE', 'RUI', 'XUAN', 'TING', 'AIDAN', 'AMOS', 'ALYSA', 'RACHEL',
+    'DANIEL', 'SARAH', 'RYAN', 'CHLOE', 'ETHAN', 'NICOLE', 'AARON', 'CHARMAINE', 'DARREN',
+    'FAITH', 'GABRIEL', 'HANNAH', 'IAN', 'JOEL', 'KAYLA', 'MARCUS',
+]
+CLUB_NAMES = [
+    'Badminton', 'Basketball', 'Dragonboat Team', 'Floorball', 'Netball', 'Soccer', 'Squash',
+    'Table Tennis', 'Tennis', 'Volleyball', 'Chinese Orchestra', 'Choir', 'Dance Society',
+    'English Drama Club', 'Photographic Society', 'Symphonic Band', 'Interact Club',
+    'Robotics Club', 'Mathematics Club', 'NY Chess Club',
+]
+ACTIVITY_NAMES = [
+    'Open House', 'Sports Carnival', 'Math Olympiad', 'Community Service', 'Leadership Camp',
+    'Arts Festival', 'Science Fair', 'Model UN', 'Overseas Trip', 'Charity Run',
+]
+CATEGORIES = ['Achievement', 'Enrichment', 'Leadership', 'Service']
+CLUB_ROLES = ['member'] * 8 + ['vice-captain', 'captain']
+AWARDS = [None] * 6 + ['Gold', 'Silver', 'Bronze', 'Merit']
+
+
+def student_names(count: int, rng: random.Random) -> List[str]:
+    """Return `count` different student names, e.g. `TAN WEI MING`"""
+    names = set()
+    while len(names) < count:
+        given = rng.sample(GIVEN_NAMES, rng.choice((2, 3)))
+        names.add(' '.join([rng.choice(SURNAMES), *given]))
+    return sorted(names, key=lambda _: rng.random())
+
+
+def numbered_names(names: Sequence[str], count: int) -> List[str]:
+    """Return `count` different names, the `names` followed by numbered copies of them"""
+    return [
+        names[i % len(names)] if i < len(names) else f'{names[i % len(names)]} {i // len(names) + 1}'
+        for i in range(count)
+    ]
+
+
+def spread_pairs(count: int, lefts: int, rights: int, rng: random.Random) -> List[Tuple[int, int]]:
+    """
+    Return `count` different (left index, right index) pairs, spread evenly over the `lefts`
+    (e.g. every student gets about `count / lefts` clubs)
+    """
+    if count > lefts * rights:
+        raise ValueError(f'Can\'t make {count} pairs out of {lefts} x {rights}')
+    pairs = []
+    for left in range(lefts):
+        per_left = count // lefts + (1 if left < count % lefts else 0)
+        pairs += [(left, right) for right in rng.sample(range(rights), per_left)]
+    return pairs
+
+
+def read_subjects() -> List[List[str]]:
+    """Return the subjects of the real dataset, which don't change with the size of the school"""
+    with open(os.path.join(os.path.dirname(database.__file__), 'csv_data', 'subject.csv')) as f:
+        return [row for row in csv.reader(f)][1:]
+
+
+def write_csv(path: str, header: Sequence[str], rows: Sequence[Sequence]) -> None:
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def generate(directory: str, scale: Scale, seed: int = 0) -> str:
+    """
+    Generate a dataset of the size `scale` in `directory` (see the module docstring),
+    return the path to its db
+    """
+    rng = random.Random(seed)
+    csv_dir = os.path.join(directory, 'database', 'csv_data')
+    os.makedirs(csv_dir, exist_ok=True)
+    db_path = os.path.join(directory, 'database', 'nyjc.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    students = scale['students']
+    class_count = max(1, -(-students // STUDENTS_PER_CLASS))
+    classes = []
+    for i in range(class_count):  # e.g. 21001 for the 1st JC2 class, as in 2113
+        level, number = ('JC1', i + 1) if i < class_count // 2 else ('JC2', i - class_count // 2 + 1)
+        class_id = int(f'{22 if level == "JC1" else 21}{number:03d}')
+        classes.append([class_id, str(class_id), level])
+
+    student_rows = []
+    for i, name in enumerate(student_names(students, rng)):
+        class_id, _, level = classes[i // STUDENTS_PER_CLASS]
+        enrolled = 2022 if level == 'JC1' else 2021
+        student_rows.append([i + 1, name, 17 if level == 'JC1' else 18, class_id, enrolled, enrolled + 1])
+
+    subjects = read_subjects()
+    student_subjects = [
+        [student + 1, int(subjects[subject][0])]
+        for student, subject in spread_pairs(
+            students * scale['subjects_per_student'], students, len(subjects), rng)
+    ]
+
+    clubs = [[i + 1, name] for i, name in enumerate(numbered_names(CLUB_NAMES, scale['clubs']))]
+    memberships = [
+        [student + 1, club + 1, rng.choice(CLUB_ROLES)]
+        for student, club in spread_pairs(scale['memberships'], students, scale['clubs'], rng)
+    ]
+
+    activities = []
+    for i, name in enumerate(numbered_names(ACTIVITY_NAMES, scale['activities'])):
+        start = 20210101 + rng.randrange(12) * 100 + rng.randrange(28)
+        end = start + rng.randrange(3) if rng.random() < 0.8 else start  # as stored by the app
+        activities.append([i + 1, start, end, name])
+    participations = [
+        [
+            student + 1, activity + 1, rng.choice(CATEGORIES), 'participant',
+            rng.choice(AWARDS), rng.choice((None, 1, 2, 4, 8, 12.5)),
+        ]
+        for student, activity in spread_pairs(
+            scale['participations'], students, scale['activities'], rng)
+    ]
+
+    write_csv(os.path.join(csv_dir, 'class.csv'), ['id', 'class_name', 'level'], classes)
+    write_csv(
+        os.path.join(csv_dir, 'student.csv'),
+        ['id', 'student_name', 'age', 'class_id', 'year_enrolled', 'graduating_year'],
+        student_rows,
+    )
+    write_csv(os.path.join(csv_dir, 'subject.csv'), ['id', 'subject_name', 'subject_level'], subjects)
+    write_csv(os.path.join(csv_dir, 'club.csv'), ['id', 'club_name'], clubs)
+    write_csv(os.path.join(csv_dir, 'student_subject.csv'), ['student_id', 'subject_id'], student_subjects)
+
+    database.init_schema(db_path)
+    with connect(db_path) as conn:
+        conn.executemany('INSERT INTO Class VALUES (?, ?, ?)', classes)
+        conn.executemany(
+            'INSERT INTO Student (id, student_name, age, class_id, year_enrolled, graduating_year) '
+            'VALUES (?, ?, ?, ?, ?, ?)', student_rows)
+        conn.executemany('INSERT INTO Subject VALUES (?, ?, ?)', subjects)
+        conn.executemany('INSERT INTO Club VALUES (?, ?)', clubs)
+        conn.executemany('INSERT INTO Student_subject VALUES (?, ?)', student_subjects)
+        conn.executemany('INSERT INTO Activity VALUES (?, ?, ?, ?)', activities)
+        conn.executemany('INSERT INTO Student_club VALUES (?, ?, ?)', memberships)
+        conn.executemany('INSERT INTO Student_activity VALUES (?, ?, ?, ?, ?, ?)', participations)
+    conn.close()
+    return db_path
+
+
+@contextlib.contextmanager
+def generated(scale: Scale, seed: int = 0) -> Iterator[str]:
+    """
+    Generate a dataset of the size `scale` in a temporary directory and work from it
+    (so the app finds it at `database.DB_PATH`), removing it when done
+    """
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix='nyjc-bench-')
+    try:
+        generate(directory, scale, seed)
+        os.chdir(directory)
+        yield directory
+    finally:
+        database.writer.close(database.DB_PATH)  # before its db is removed
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Generate a synthetic school dataset.')
+    parser.add_argument('directory', help='where to write database/csv_data and database/nyjc.db')
+    parser.add_argument('--scale', choices=SCALES, default='school', help='size of the school')
+    for name in Scale.__annotations__:
+        parser.add_argument(f'--{name.replace("_", "-")}', type=int, help=f'override the {name} of the scale')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    for name in Scale.__annotations__:
+        if getattr(args, name) is not None:
+            scale[name] = getattr(args, name)
+    print(generate(args.directory, scale, args.seed))
+
+
+if __name__ == '__main__':
+    main()
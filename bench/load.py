@@ -0,0 +1,351 @@
+"""
+Load test of the dashboard workflows, with many simulated users at once.
+
+Each user repeats the workflow of editing a membership, as fast as it can (or pausing
+`--think` seconds between steps):
+1. view: search a student at /dashboard/view/student
+2. edit: open the members of a club at /dashboard/edit/membership
+3. confirm: change the role of one of them
+4. result: save the change
+
+The users are threads, either requesting the app in this process through the Flask test
+client, on a generated dataset (see `bench.generate`), or requesting a running server
+with `--url`. The load is stepped through each number of `--users` for `--duration`
+seconds, reporting the throughput, the latency percentiles of each step, and the errors,
+counting the requests which failed because the db stayed locked by other writers
+(503 Database Busy, see `frontend.database_busy`) apart from the others.
+```
+python -m bench.load                                  # in this process, on the `small` scale
+python -m bench.load --users 1,8,32 --duration 5 --out load.json
+
+python -m bench.generate /tmp/school                  # or against server.py, on a copy
+(cd /tmp/school && python /path/to/server.py --port 8000 &)
+python -m bench.load --url http://127.0.0.1:8000
+```
+Saving changes the roles of memberships, so never point it at the real db.
+In this process, the users share a GIL, so a server (with several workers) handles more.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Sequence, Tuple, TypedDict
+from urllib.parse import urlencode
+
+import logs
+import main as app_main
+from .generate import SCALES, generated
+
+
+USERS = (1, 2, 4, 8, 16, 32, 64)
+DURATION = 10.0  # seconds of load at each number of users
+TIMEOUT = 30.0  # seconds to wait for each response from a server
+MAX_ERROR_RATE = 0.01  # fraction of failed requests beyond which the app is falling over
+STEPS = ('view', 'edit', 'confirm', 'result')
+ROLES = ('member', 'vice-captain', 'captain', 'treasurer', 'secretary')
+LOCKED = 'database is locked'
+
+
+class StepStats(TypedDict):
+    requests: int
+    errors: int
+    p50: Optional[float]  # ms
+    p95: Optional[float]
+    p99: Optional[float]
+    max: Optional[float]
+
+
+class LevelResult(TypedDict):
+    users: int
+    seconds: float
+    requests: int
+    workflows: int  # completed, i.e. changes saved
+    errors: Dict[str, int]  # {kind of error: count}, e.g. {'database is locked': 3, '500': 1}
+    error_rate: float
+    throughput: float  # requests per second
+    workflows_per_second: float
+    steps: Dict[str, StepStats]
+
+
+class TestClientTransport:
+    """Requests to the Flask `app` in this process, with a test client per thread"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self.__local = threading.local()
+
+    def request(self, method: str, path: str, data: Optional[dict] = None) -> Tuple[int, bytes]:
+        client = getattr(self.__local, 'client', None)
+        if client is None:
+            client = self.__local.client = self.app.test_client()
+        response = client.open(path, method=method, data=data)
+        return response.status_code, response.get_data()
+
+
+class HTTPTransport:
+    """Requests to the server at `url`"""
+
+    def __init__(self, url: str, timeout: float = TIMEOUT) -> None:
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, data: Optional[dict] = None) -> Tuple[int, bytes]:
+        body = urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.url + path, data=body, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as err:
+            return err.code, err.read()
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> Optional[float]:
+    """Return the value `fraction` of the way through `sorted_values` (nearest rank)"""
+    if not sorted_values:
+        return None
+    rank = min(max(math.ceil(fraction * len(sorted_values)), 1), len(sorted_values))
+    return sorted_values[rank - 1]
+
+
+def row_keys(html: bytes) -> List[list]:
+    """Return the keys of the rows of the edit table in the `html` of an edit page"""
+    keys = re.findall(rb'data-key="([^"]+)"', html)
+    if keys:
+        return [json.loads(key.replace(b'&quot;', b'"')) for key in keys]
+    # a virtual table, with its rows and keys as JSON (see `myhtml.VirtualEditableRecordTable`)
+    rows = re.search(rb'<script type="application/json" id="[^"]*-rows">(.*?)</script>', html, re.S)
+    return json.loads(rows.group(1))['keys'] if rows else []
+
+
+def error_kind(status: int, body: bytes) -> Optional[str]:
+    """Return the kind of error of a response, or None if it succeeded"""
+    if status == 200:
+        return None
+    if status == 503 or LOCKED.encode() in body:
+        return LOCKED
+    return str(status)
+
+
+class User:
+    """A simulated user, repeating the workflow until the `deadline`"""
+
+    def __init__(self, transport, students: List[str], clubs: List[str], seed: str, think: float) -> None:
+        self.seed = seed
+        self.transport = transport
+        self.students = students
+        self.clubs = clubs
+        self.rng = random.Random(seed)
+        self.think = think
+        self.samples: List[Tuple[str, float, Optional[str]]] = []  # (step, seconds, error kind)
+        self.workflows = 0
+        self.changes = 0
+
+    def run(self, deadline: float) -> None:
+        while time.monotonic() < deadline:
+            self.workflow()
+
+    def step(self, name: str, method: str, path: str, data: Optional[dict] = None) -> Optional[bytes]:
+        """Make the request of the step `name`, return its body, or None if it failed"""
+        if self.think:
+            time.sleep(self.think)
+        start = time.perf_counter()
+        try:
+            status, body = self.transport.request(method, path, data)
+            error = error_kind(status, body)
+        except Exception as err:  # pylint: disable=broad-except
+            body = None
+            error = LOCKED if LOCKED in str(err) else type(err).__name__
+        self.samples.append((name, time.perf_counter() - start, error))
+        return body if error is None else None
+
+    def workflow(self) -> None:
+        student = self.rng.choice(self.students)
+        if self.step('view', 'GET', '/dashboard/view/student?' + urlencode({'student_name': student})) is None:
+            return
+
+        club = self.rng.choice(self.clubs)
+        page = self.step('edit', 'GET', '/dashboard/edit/membership?' + urlencode({'club_name': club}))
+        if page is None:
+            return
+        keys = row_keys(page)
+        if not keys:  # a club without members
+            return
+
+        # a role never given before, so the change is never a no-op
+        self.changes += 1
+        role = f'{self.rng.choice(ROLES)} ({self.seed}/{self.changes})'
+        changes = [{'method': 'UPDATE', 'key': self.rng.choice(keys), 'new': {'role': role}}]
+        page = self.step(
+            'confirm', 'POST', '/dashboard/edit/membership?confirm', {'changes': json.dumps(changes)})
+        if page is None:
+            return
+        token = re.search(rb'name="token" value="([^"]+)"', page)
+        if token is None:
+            self.samples.append(('confirm', 0.0, 'no token'))
+            return
+
+        if self.step('result', 'POST', '/dashboard/edit/membership/result',
+                     {'token': token.group(1).decode()}) is not None:
+            self.workflows += 1
+
+
+def fetch_names(transport, coll_name: str, field: str) -> List[str]:
+    """Return the `field` of every record of the collection, through the JSON API"""
+    names = []
+    after = None
+    while True:
+        params = {'fields': field, 'format': 'compact', 'limit': 1000}
+        if after is not None:
+            params['after'] = after
+        status, body = transport.request('GET', f'/api/{coll_name}?{urlencode(params)}')
+        if status != 200:
+            raise RuntimeError(f'Unable to list the {coll_name}s: {status} {body[:200]!r}')
+        page = json.loads(body)
+        names += [row[0] for row in page['rows']]
+        after = page['next']
+        if after is None:
+            return names
+
+
+def run_level(transport, users: int, duration: float, students: List[str], clubs: List[str],
+              think: float = 0.0, seed: int = 0) -> LevelResult:
+    """Run `users` users for `duration` seconds, return how the app held up"""
+    simulated = [User(transport, students, clubs, f'{seed}.{users}.{i}', think) for i in range(users)]
+    start = time.monotonic()
+    deadline = start + duration
+    threads = [threading.Thread(target=user.run, args=(deadline,), daemon=True) for user in simulated]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.monotonic() - start
+
+    samples = [sample for user in simulated for sample in user.samples]
+    errors: Dict[str, int] = {}
+    steps: Dict[str, StepStats] = {}
+    for name in STEPS:
+        step_samples = [sample for sample in samples if sample[0] == name]
+        latencies = sorted(seconds * 1000 for _, seconds, error in step_samples if error is None)
+        for _, _, error in step_samples:
+            if error is not None:
+                errors[error] = errors.get(error, 0) + 1
+        steps[name] = {
+            'requests': len(step_samples),
+            'errors': sum(1 for sample in step_samples if sample[2] is not None),
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else None,
+        }
+
+    requests = len(samples)
+    workflows = sum(user.workflows for user in simulated)
+    error_count = sum(errors.values())
+    return {
+        'users': users,
+        'seconds': seconds,
+        'requests': requests,
+        'workflows': workflows,
+        'errors': errors,
+        'error_rate': error_count / requests if requests else 0.0,
+        'throughput': requests / seconds,
+        'workflows_per_second': workflows / seconds,
+        'steps': steps,
+    }
+
+
+def report(result: LevelResult) -> str:
+    def ms(value: Optional[float]) -> str:
+        return f'{value:.0f}' if value is not None else '-'
+
+    line = (
+        f'{result["users"]:>5} {result["throughput"]:>8.1f} {result["workflows_per_second"]:>7.1f} '
+        f'{result["error_rate"]:>6.1%} {result["errors"].get(LOCKED, 0):>6}'
+    )
+    for name in STEPS:
+        step = result['steps'][name]
+        line += f'  {ms(step["p50"]):>5}/{ms(step["p95"]):>5}/{ms(step["p99"]):>5}'
+    return line
+
+
+def verdict(results: List[LevelResult], max_error_rate: float = MAX_ERROR_RATE) -> str:
+    """Summarize the number of users the app handles before its throughput or errors give out"""
+    peak = max(results, key=lambda result: result['throughput'])
+    summary = f'Throughput peaks at {peak["users"]} users ({peak["throughput"]:.1f} requests/s).'
+    for result in results:
+        if result['error_rate'] > max_error_rate:
+            kinds = ', '.join(f'{count} {kind}' for kind, count in sorted(result['errors'].items()))
+            return summary + (
+                f' Falls over at {result["users"]} users: '
+                f'{result["error_rate"]:.1%} of requests failed ({kinds}).')
+    return summary + f' No errors beyond {max_error_rate:.0%} of requests up to {results[-1]["users"]} users.'
+
+
+def load_test(transport, levels: Sequence[int], duration: float, think: float = 0.0,
+              seed: int = 0, max_error_rate: float = MAX_ERROR_RATE) -> List[LevelResult]:
+    """Step through each number of users in `levels`, printing how the app held up"""
+    students = fetch_names(transport, 'student', 'student_name')
+    clubs = fetch_names(transport, 'club', 'club_name')
+    print(f'{"users":>5} {"req/s":>8} {"saves/s":>7} {"errors":>6} {"locked":>6}  '
+          + '  '.join(f'{name + " p50/95/99 ms":>17}' for name in STEPS), flush=True)
+    results = []
+    for users in levels:
+        result = run_level(transport, users, duration, students, clubs, think, seed)
+        print(report(result), flush=True)
+        results.append(result)
+    print(verdict(results, max_error_rate))
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Load test the dashboard workflows.')
+    parser.add_argument('--url', help='server to load test (default: the app in this process)')
+    parser.add_argument(
+        '--scale', choices=SCALES, default='small',
+        help='size of the dataset generated to load test the app in this process')
+    parser.add_argument(
+        '--users', default=','.join(map(str, USERS)),
+        help='comma separated numbers of concurrent users to step through')
+    parser.add_argument(
+        '--duration', type=float, default=DURATION, help='seconds of load at each number of users')
+    parser.add_argument('--think', type=float, default=0.0, help='seconds each user pauses between steps')
+    parser.add_argument(
+        '--max-error-rate', type=float, default=MAX_ERROR_RATE,
+        help='fraction of failed requests beyond which the app is falling over')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='save the results as JSON to this file')
+    args = parser.parse_args(argv)
+    try:
+        levels = [int(users) for users in args.users.split(',')]
+    except ValueError:
+        parser.error('--users must be comma separated numbers')
+
+    def run(transport) -> List[LevelResult]:
+        return load_test(transport, levels, args.duration, args.think, args.seed, args.max_error_rate)
+
+    if args.url is not None:
+        results = run(HTTPTransport(args.url))
+    else:
+        # still logging every change saved, as the app would, but not into the report
+        with generated(SCALES[args.scale], args.seed), open(os.devnull, 'w', encoding='utf-8') as devnull:
+            logs.setup(stream=devnull)
+            try:
+                results = run(TestClientTransport(app_main.create_app()))
+            finally:
+                logs.shutdown()  # writing the records still queued, before devnull is closed
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'url': args.url, 'scale': args.scale, 'levels': results}, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
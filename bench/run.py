@@ -0,0 +1,322 @@
+"""
+Runs the benchmarks (see `bench`) against a freshly generated dataset.
+
+Each benchmark is a function in `BENCHMARKS`, which runs its operations `repeat` times
+on the dataset in the current directory, timing each with `Timings.time(name)`.
+The db is found at the relative `database.DB_PATH`, so the benchmarks are run from the
+directory the dataset was generated into, and use the same code paths as the app.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import re
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, TypedDict
+
+import convert
+import database
+import logs
+import main as app_main
+from database import colls, db_utils
+from database.slow_queries import explain
+from model import ENTITIES
+from .generate import SCALES, Scale, generated
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+REPEAT = 5  # runs of each operation, the median is compared
+TOLERANCE = 0.25  # fraction a median may grow by before it counts as slower
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Result(TypedDict):
+    runs: int
+    min: float  # seconds
+    median: float
+    mean: float
+
+
+class Timings:
+    """The times taken by each run of each benchmarked operation"""
+
+    def __init__(self) -> None:
+        self.runs: Dict[str, List[float]] = {}
+
+    @contextlib.contextmanager
+    def time(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        yield
+        self.runs.setdefault(name, []).append(time.perf_counter() - start)
+
+    def results(self) -> Dict[str, Result]:
+        return {
+            name: {
+                'runs': len(runs),
+                'min': min(runs),
+                'median': statistics.median(runs),
+                'mean': statistics.fmean(runs),
+            }
+            for name, runs in self.runs.items()
+        }
+
+
+def bench_find(timings: Timings, repeat: int) -> None:
+    """`Collection.find` of every record of each collection, and the searches of the edit pages"""
+    for name, coll in colls.items():
+        for _ in range(repeat):
+            with timings.time(f'find.{name}'):
+                coll.find({})
+
+    club_names = [club['club_name'] for club in colls['club'].find({})]
+    student_names = [student['student_name'] for student in colls['student'].find({})]
+    for i in range(repeat):
+        with timings.time('find.membership.by_club'):
+            colls['membership'].find({'club_name': club_names[i % len(club_names)]})
+        with timings.time('find.participation.by_student'):
+            colls['participation'].find({'student_name': student_names[i % len(student_names)]})
+
+    activities = colls['activity']
+    plan = explain(activities.db_path, *activities.active_between_sql(20210601, 20210630))
+    if not any('USING INDEX Activity_dates' in line for line in plan):  # e.g. SCAN Activity
+        raise BenchmarkError('The activities active between dates are not searched by index:\n'
+                             + '\n'.join(plan))
+    for i in range(repeat):
+        with timings.time('find.activity.active_on'):
+            activities.find_active_on(20210101 + i % 12 * 100 + 15)
+        with timings.time('find.activity.active_between'):
+            activities.find_active_between(20210601, 20210630)  # a month
+
+
+def bench_render(timings: Timings, repeat: int) -> None:
+    """`myhtml` tables of every membership, as rendered by the view and edit pages"""
+    entity = ENTITIES['membership']
+    keys, records = colls['membership'].find_keyed({})
+    for _ in range(repeat):
+        with timings.time('render.table'):
+            ''.join(convert.records_to_table(records, entity.fields).iter_html())
+        with timings.time('render.editable_table'):
+            table = convert.records_to_editable_table(
+                records, entity.fields, keys=keys, action='?confirm', method='post')
+            ''.join(table.iter_html())
+        with timings.time('render.virtual_table'):
+            table = convert.records_to_editable_table(
+                records, entity.fields, virtual=True, keys=keys, action='?confirm', method='post')
+            ''.join(table.iter_html())
+
+
+def _students_without(jt_table: str, column: str, value: int, count: int) -> List[str]:
+    """Return the names of `count` students without a row in `jt_table` where `column` = `value`"""
+    with database.connect(database.DB_PATH) as conn:
+        rows = conn.execute(
+            f'SELECT student_name FROM Student WHERE id NOT IN '
+            f'(SELECT student_id FROM {jt_table} WHERE {column} = ?) ORDER BY id LIMIT ?',
+            (value, count)).fetchall()
+    conn.close()
+    if len(rows) < count:
+        raise BenchmarkError(f'Not enough students to benchmark {jt_table}')
+    return [row[0] for row in rows]
+
+
+def bench_db_utils(timings: Timings, repeat: int) -> None:
+    """
+    `insert_into_jt_coll`, `update_jt_coll` and `delete_from_jt_coll` of expanded records,
+    each new record being deleted again so the dataset is left as it was
+    """
+    club = colls['club'].find({'id': 1})[0]
+    activity = colls['activity'].find({'id': 1})[0]
+    records = {
+        'membership': [
+            {'student_name': name, 'club_name': club['club_name'], 'role': 'member'}
+            for name in _students_without('Student_club', 'club_id', 1, repeat)
+        ],
+        'participation': [
+            {
+                'student_name': name, 'desc': activity['desc'], 'category': 'Service',
+                'role': 'participant', 'award': '', 'hours': 2,
+            }
+            for name in _students_without('Student_activity', 'activity_id', 1, repeat)
+        ],
+    }
+
+    for jt_coll_name, new_records in records.items():
+        for record in new_records:
+            updated = {**record, 'role': 'helper'}
+            with timings.time(f'db_utils.insert.{jt_coll_name}'):
+                results = [db_utils.insert_into_jt_coll(jt_coll_name, record)]
+            with timings.time(f'db_utils.update.{jt_coll_name}'):
+                results.append(db_utils.update_jt_coll(jt_coll_name, record, updated))
+            with timings.time(f'db_utils.delete.{jt_coll_name}'):
+                results.append(db_utils.delete_from_jt_coll(jt_coll_name, updated))
+            for res in results:
+                if not res.is_ok:
+                    raise BenchmarkError(f'{jt_coll_name}: {res.msg}')
+
+
+def bench_init_db_from_csvs(timings: Timings, repeat: int) -> None:
+    """`init_db_from_csvs` into an empty db, from the generated CSVs (only run once, it is slow)"""
+    database.writer.close(database.DB_PATH)  # its connection is to the db removed
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(database.DB_PATH + suffix):
+            os.remove(database.DB_PATH + suffix)
+    with timings.time('init_db_from_csvs'):
+        database.init_db_from_csvs()
+
+
+def bench_http(timings: Timings, repeat: int) -> None:
+    """The view, edit, confirm and result pages, requested through the Flask test client"""
+    client = app_main.create_app().test_client()
+
+    def request(page: str, timed: bool, method: str, url: str, **kwargs) -> bytes:
+        """Request the `url`, timed as `http.<page>` if `timed`"""
+        with timings.time(f'http.{page}') if timed else contextlib.nullcontext():
+            response = client.open(url, method=method, **kwargs)
+            body = response.get_data()
+        if response.status_code != 200:
+            raise BenchmarkError(f'{method} {url}: {response.status}\n{body[:500]!r}')
+        return body
+
+    students = colls['student'].find({})
+    clubs = colls['club'].find({})
+    membership_keys, memberships = colls['membership'].find_keyed({})
+    for i in range(-1, repeat):  # an untimed run first, to compile the templates
+        timed = i >= 0
+        # a different search each run, so no run is served from the view cache
+        request('view.student', timed, 'GET', '/dashboard/view/student',
+                query_string={'student_name': students[i % len(students)]['student_name']})
+        request('edit.membership.by_club', timed, 'GET', '/dashboard/edit/membership',
+                query_string={'club_name': clubs[i % len(clubs)]['club_name']})
+        request('edit.membership', timed, 'GET', '/dashboard/edit/membership')
+
+        key = membership_keys[i % len(membership_keys)]
+        role = memberships[i % len(memberships)]['role']
+        changes = [{'method': 'UPDATE', 'key': list(key), 'new': {'role': f'{role} ({i})'}}]
+        body = request('edit_confirm.membership', timed, 'POST', '/dashboard/edit/membership?confirm',
+                       data={'changes': json.dumps(changes)})
+        token = re.search(rb'name="token" value="([^"]+)"', body)
+        if token is None:
+            raise BenchmarkError(f'No token to save the changes in\n{body[:500]!r}')
+        request('edit_result.membership', timed, 'POST', '/dashboard/edit/membership/result',
+                data={'token': token.group(1).decode()})
+
+
+BENCHMARKS: Dict[str, Callable[[Timings, int], None]] = {
+    'find': bench_find,
+    'render': bench_render,
+    'db_utils': bench_db_utils,
+    'http': bench_http,
+    'init_db_from_csvs': bench_init_db_from_csvs,  # last, it replaces the db
+}
+
+
+def run(scale: Scale, names: List[str], repeat: int = REPEAT, seed: int = 0) -> dict:
+    """
+    Generate a dataset of the size `scale` (see `generated`), run the benchmarks `names`
+    on it, and return the results with the conditions they were taken in
+    """
+    timings = Timings()
+    # only time the operations, not the query plans of the slow ones
+    threshold, database.slow_queries.threshold = database.slow_queries.threshold, float('inf')
+    try:
+        # still logging what db_utils does, as the app would, but not into the results
+        with generated(scale, seed), open(os.devnull, 'w', encoding='utf-8') as devnull:
+            logs.setup(stream=devnull)
+            try:
+                for name in names:
+                    print(f'Running {name}...', file=sys.stderr, flush=True)
+                    BENCHMARKS[name](timings, repeat)
+            finally:
+                logs.shutdown()  # writing the records still queued, before devnull is closed
+    finally:
+        database.slow_queries.threshold = threshold
+
+    return {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'scale': scale,
+            'seed': seed,
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': f'{platform.system()} {platform.machine()} ({os.cpu_count()} cores)',
+        },
+        'results': timings.results(),
+    }
+
+
+def compare(results: dict, baseline: Optional[dict], tolerance: float = TOLERANCE) -> List[str]:
+    """
+    Print the median of each result next to the `baseline`'s, and
+    return the names of the results more than `tolerance` slower than it
+    """
+    baseline_results = baseline['results'] if baseline is not None else {}
+    if baseline is not None and baseline['meta']['scale'] != results['meta']['scale']:
+        print(f'Warning: the baseline is at another scale ({baseline["meta"]["scale"]})')
+
+    slower = []
+    print(f'{"benchmark":<36} {"median ms":>10} {"baseline":>10} {"change":>8}')
+    for name, result in results['results'].items():
+        line = f'{name:<36} {result["median"] * 1000:>10.2f}'
+        if name in baseline_results:
+            before = baseline_results[name]['median']
+            change = result['median'] / before - 1 if before > 0 else 0.0
+            line += f' {before * 1000:>10.2f} {change:>+8.0%}'
+            if change > tolerance:
+                line += '  SLOWER'
+                slower.append(name)
+            elif change < -tolerance:
+                line += '  faster'
+        print(line)
+    return slower
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the app on a synthetic school.')
+    parser.add_argument('--scale', choices=SCALES, default='school', help='size of the school')
+    parser.add_argument(
+        '--only', help=f'comma separated benchmarks to run (default: all of {", ".join(BENCHMARKS)})')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='runs of each operation')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated dataset')
+    parser.add_argument('--out', help='save the results as JSON to this file')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='results to compare with')
+    parser.add_argument(
+        '--save-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument(
+        '--tolerance', type=float, default=TOLERANCE,
+        help='fraction a median may grow by before it counts as slower')
+    parser.add_argument(
+        '--check', action='store_true', help='exit with an error if any benchmark got slower')
+    args = parser.parse_args(argv)
+
+    names = list(BENCHMARKS) if args.only is None else args.only.split(',')
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name!r}, choose from {", ".join(BENCHMARKS)}')
+
+    results = run(SCALES[args.scale], names, args.repeat, args.seed)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    slower = compare(results, baseline, args.tolerance)
+
+    outs = [args.out] if args.out else []
+    if args.save_baseline:
+        outs.append(args.baseline)
+    for out in outs:
+        with open(out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+
+    if args.check and slower:
+        sys.exit(f'Slower than the baseline: {", ".join(slower)}')
@@ -0,0 +1,166 @@
+"""
+Compression of the responses of the app, with gzip.
+
+`init_app(app)` compresses every response to a request accepting gzip (`Accept-Encoding`)
+whose content is text (see `COMPRESSIBLE_TYPES`) and at least `MIN_SIZE` bytes long.
+Streamed responses (e.g. the tables of `frontend._helpers.stream_template`) have no length
+and are always compressed, as they are streamed: the first chunk (the top of the page) is
+sent straight away, then the compressed chunks at least every `FLUSH_SIZE` bytes of HTML.
+
+Responses already compressed (e.g. the precompressed static files, see `assets`) are left
+as they are. The ETags of compressed responses are made weak, as the bytes sent differ
+from the uncompressed response's, which the app compares weakly (see `not_modified`).
+"""
+
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+from flask import Flask
+from werkzeug.http import parse_accept_header
+
+
+MIN_SIZE = 1024  # bytes, smaller responses gain less than the time it takes
+LEVEL = 6  # zlib compression level, 1 (fastest) to 9 (smallest)
+FLUSH_SIZE = 32 * 1024  # bytes of a streamed response compressed before sending them
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+)
+
+Headers = List[Tuple[str, str]]
+
+
+def accepts_gzip(environ: dict) -> bool:
+    """Whether the request accepts gzip compressed responses"""
+    return parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING')).quality('gzip') > 0
+
+
+def _header(headers: Headers, name: str) -> Optional[str]:
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def is_compressible(headers: Headers, min_size: int = MIN_SIZE) -> bool:
+    """Whether a response with the `headers` is worth compressing"""
+    content_type = (_header(headers, 'Content-Type') or '').lower()
+    if not content_type.startswith(COMPRESSIBLE_TYPES) or content_type.startswith('text/event-stream'):
+        return False
+    if _header(headers, 'Content-Encoding') not in (None, 'identity'):
+        return False
+    length = _header(headers, 'Content-Length')
+    return length is None or int(length) >= min_size
+
+
+def weak_etag(etag: str) -> str:
+    return etag if etag.startswith('W/') else 'W/' + etag
+
+
+def compressed_headers(headers: Headers) -> Headers:
+    """The `headers` of a response, once compressed"""
+    new_headers = []
+    vary = None
+    for key, value in headers:
+        name = key.lower()
+        if name == 'content-length':
+            continue
+        if name == 'etag':
+            value = weak_etag(value)
+        if name == 'vary':
+            vary = value
+            continue
+        new_headers.append((key, value))
+    if vary is None:
+        vary = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower() and vary.strip() != '*':
+        vary += ', Accept-Encoding'
+    new_headers.append(('Vary', vary))
+    new_headers.append(('Content-Encoding', 'gzip'))
+    return new_headers
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = LEVEL, flush_size: int = FLUSH_SIZE) -> Iterator[bytes]:
+    """
+    Compress the `chunks` of a response as a gzip stream, flushing what was compressed
+    after the first chunk and then at least every `flush_size` bytes
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: with a gzip header
+    pending = 0  # bytes compressed since the last flush
+    first = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if first or pending >= flush_size:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+            first = False
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class GzipMiddleware:
+    """WSGI middleware compressing the responses of `wsgi_app` (see `compression`)"""
+
+    def __init__(self, wsgi_app, min_size: int = MIN_SIZE, level: int = LEVEL) -> None:
+        self.wsgi_app = wsgi_app
+        self.min_size = min_size
+        self.level = level
+
+    def __call__(self, environ, start_response):
+        gzip_ok = environ.get('REQUEST_METHOD') != 'HEAD' and accepts_gzip(environ)
+        compress = [False]
+        started = [False]
+
+        def _start_response(status_line, headers, exc_info=None):
+            started[0] = True
+            status = int(status_line.split(' ', 1)[0])
+            compressible = status not in (204, 206, 304) and is_compressible(headers, self.min_size)
+            compress[0] = compressible and gzip_ok
+            if compress[0]:
+                headers = compressed_headers(headers)
+            elif status == 304 and gzip_ok:  # with the ETag of the compressed response it revalidates
+                headers = [(key, weak_etag(value) if key.lower() == 'etag' else value) for key, value in headers]
+            elif compressible and _header(headers, 'Vary') is None:  # compressed for other requests
+                headers = [*headers, ('Vary', 'Accept-Encoding')]
+            return start_response(status_line, headers, exc_info)
+
+        body = self.wsgi_app(environ, _start_response)
+        if started[0] and not compress[0]:  # e.g. a static file, sent as it is
+            return body
+        return _Body(body, compress, self.level)
+
+
+class _Body:
+    """The body of a response, compressed if `compress[0]` is set by the time it is sent"""
+
+    def __init__(self, body, compress: List[bool], level: int) -> None:
+        self.body = body
+        self.compress = compress
+        self.level = level
+
+    def __iter__(self):
+        chunks = iter(self.body)
+        first = next(chunks, None)  # start_response is called before the first chunk is sent
+        if first is not None:
+            chunks = _prepend(first, chunks)
+        if self.compress[0]:
+            yield from gzip_chunks(chunks, self.level)
+        else:
+            yield from chunks
+
+    def close(self) -> None:
+        if hasattr(self.body, 'close'):
+            self.body.close()
+
+
+def _prepend(first: bytes, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    yield first
+    yield from chunks
+
+
+def init_app(app: Flask, min_size: int = MIN_SIZE, level: int = LEVEL) -> None:
+    """Compress the responses of `app` to the requests accepting gzip"""
+    app.wsgi_app = GzipMiddleware(app.wsgi_app, min_size, level)
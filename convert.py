@@ -2,35 +2,162 @@
 Convert data to html
 """
 
-from typing import Any, Dict, List
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import data
 import model
 import myhtml as html
 
 
-def __add_input_by_field(
-    form: html.RecordForm,
-    field: data.Field,
-    value: str = ''
-) -> None:
-    """
-    Add an input of specific type to the `form` based on the `field` type
-    """
-    if isinstance(field, data.Date):
-        form.date_input(field.label, field.name, value=value)
-    elif isinstance(field, data.ConstrainedString):
-        options = field.constraints.copy()
-        options.insert(0, '')  # <- empty field
-        if value in options:
-            options.remove(value)
-            options.insert(0, value)
-        form.dropdown_input(field.label, field.name, options)
-    elif isinstance(field, data.String):
-        form.text_input(field.label, field.name, value=value)
-    elif isinstance(field, data.Number):
-        form.number_input(field.label, field.name, value=value)
-    else:  # fallback input type
-        form.text_input(field.label, field.name, value=value)
+# functions adding the input of a field to a `RecordForm`, by field type
+form_inputs = data.FieldRegistry('form input')
+
+
+@form_inputs.register(data.Field)
+def __add_text_input(form: html.RecordForm, field: data.Field, value: str = '') -> None:
+    form.text_input(field.label, field.name, value=value)  # fallback input type
+
+
+@form_inputs.register(data.Number)
+def __add_number_input(form: html.RecordForm, field: data.Field, value: str = '') -> None:
+    form.number_input(field.label, field.name, value=value)
+
+
+@form_inputs.register(data.Date)
+def __add_date_input(form: html.RecordForm, field: data.Field, value: str = '') -> None:
+    form.date_input(field.label, field.name, value=value)
+
+
+@form_inputs.register(data.ConstrainedString)
+def __add_dropdown_input(form: html.RecordForm, field: data.Field, value: str = '') -> None:
+    options = field.constraints.copy()
+    options.insert(0, '')  # <- empty field
+    if value in options:
+        options.remove(value)
+        options.insert(0, value)
+    form.dropdown_input(field.label, field.name, options)
+
+
+def __add_inputs(form: html.RecordForm, fields: List[data.Field], values: Dict[str, Any]) -> None:
+    """
+    Add an input of specific type to the `form` for each of the `fields`,
+    based on the field type
+    """
+    for add_input, field in zip(form_inputs.resolve_all(fields), fields):
+        add_input(form, field, values.get(field.name, ''))
+
+
+# ------------------------------
+# Cached forms
+# The forms in the dashboard are rendered on every request, so each form is compiled
+# once per (entity, action, method). The blank form is rendered up front, and forms
+# with values only need to substitute each field's value into its input.
+# ------------------------------
+InputTemplate = Callable[[Any], str]
+
+# functions compiling the labelled input that `form_inputs` adds for a field
+# into a template filled by the input's value, by field type
+input_templates = data.FieldRegistry('input template')
+
+
+@input_templates.register(data.Field)
+def __input_template(field: data.Field) -> InputTemplate:
+    label = html.label_tag(field.label, field.name)
+    before_value = (
+        f'{label}<input id="{field.name}" type="{field.html_input_type}" name="{field.name}"')
+
+    def input_template(value: Any) -> str:
+        return f'{before_value}{html.value_attr(value)}><br>'
+    return input_template
+
+
+@input_templates.register(data.ConstrainedString)
+def __dropdown_template(field: data.Field) -> InputTemplate:
+    label = html.label_tag(field.label, field.name)
+    options = ['', *field.constraints]  # <- empty field
+    blank_options = html.options_html(options)
+    # the selected value is moved to the front of the options
+    selected_options = {
+        value: html.options_html([value, *(opt for opt in options if opt != value)])
+        for value in options
+    }
+
+    def dropdown_template(value: Any) -> str:
+        return label + html.select_tag(field.name, selected_options.get(value, blank_options))
+    return dropdown_template
+
+
+class FormTemplate:
+    """
+    A compiled form, filled with the values of the fields named `names`.
+    The blank form (all values '') is pre-rendered.
+    """
+
+    def __init__(self, names: Tuple[str, ...], inputs: List[InputTemplate], start: str, end: str):
+        self.names = names
+        self.inputs = inputs
+        self.start = start
+        self.end = end
+        self.blank = self.render(('',) * len(names))
+
+    def render(self, values: Tuple[Any, ...]) -> str:
+        """Fill the form with `values`, in the same order as the fields"""
+        return ''.join([
+            self.start,
+            *[input_(value) for input_, value in zip(self.inputs, values)],
+            self.end,
+        ])
+
+
+@lru_cache(maxsize=None)
+def __form_template(entity: model.Entity, action: str, method: str, search: bool) -> FormTemplate:
+    """Compile the form of `entity_to_form_with_values` if `search` else `entity_to_new_form`"""
+    fields, submit = (entity.search_fields, 'Search') if search else (entity.fields, 'Submit')
+    return FormTemplate(
+        names=tuple(field.name for field in fields),
+        inputs=[
+            compile_input(field)
+            for compile_input, field in zip(input_templates.resolve_all(fields), fields)
+        ],
+        start=f'<form action="{action}" method="{method}">',
+        end=html.input_tag(type="submit", value=submit) + '<br></form>',
+    )
+
+
+@lru_cache(maxsize=1024)
+def __render_form(
+    entity: model.Entity,
+    action: str,
+    method: str,
+    values: Tuple[Any, ...],
+) -> str:
+    return __form_template(entity, action, method, True).render(values)
+
+
+def new_form_html(entity: model.Entity, action: str, method: str = 'get') -> str:
+    """
+    Return the HTML of the form generated by `entity_to_new_form`, for a `RecordForm`
+    with `action` and `method`. The form is only rendered once.
+    """
+    return __form_template(entity, action, method, False).blank
+
+
+def form_with_values_html(
+    entity: model.Entity,
+    action: str,
+    method: str = 'get',
+    values: Dict[str, Any] = None,
+) -> str:
+    """
+    Return the HTML of the form generated by `entity_to_form_with_values`, for a
+    `RecordForm` with `action` and `method`. Forms without values are only rendered
+    once, and recently used values are cached.
+    """
+    template = __form_template(entity, action, method, True)
+    values = tuple((values or {}).get(name, '') for name in template.names)
+    if not any(values):
+        return template.blank
+    return __render_form(entity, action, method, values)
 
 
 def entity_to_new_form(
@@ -45,8 +172,7 @@ def entity_to_new_form(
     Return:
     - form
     """
-    for field in entity.fields:
-        __add_input_by_field(form, field)
+    __add_inputs(form, entity.fields, {})
     form.submit_input()
     return form
 
@@ -56,9 +182,7 @@ def entity_to_form_with_values(
     form: html.RecordForm,
     values: Dict[str, Any],
 ) -> html.RecordForm:
-    for field in entity.search_fields:
-        value = values.get(field.name, '')
-        __add_input_by_field(form, field, value)
+    __add_inputs(form, entity.search_fields, values)
     form.submit_input('Search')
     return form
 
@@ -118,6 +242,8 @@ def records_to_table(records: List[dict], headers: List[data.Field]) -> html.Rec
 def records_to_editable_table(
     records: List[dict],
     headers: List[data.Field],
+    virtual: bool = False,
+    keys: Optional[List[tuple]] = None,
     **kwargs
 ) -> html.EditableRecordTable:
     """
@@ -127,9 +253,16 @@ def records_to_editable_table(
     (e.g. `records` are obtained from the database itself)
 
     ---------
-    Converts the `records` to `EditableRecordTable` using `**kwargs`
+    Converts the `records` to `EditableRecordTable` using `**kwargs`,
+    or a `VirtualEditableRecordTable` if `virtual`.
+    `keys` are the db keys of the `records` (see `Collection.find_keyed`), if any.
     """
-    table = html.EditableRecordTable(headers=headers, **kwargs)
-    for record in records:
-        table.add_row(record)
+    if virtual:
+        table = html.VirtualEditableRecordTable(headers=headers, **kwargs)
+    else:
+        table = html.EditableRecordTable(headers=headers, **kwargs)
+    if keys is None:
+        keys = [None] * len(records)
+    for record, key in zip(records, keys):
+        table.add_row(record, key)
     return table
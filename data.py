@@ -1,4 +1,5 @@
-from typing import Any, Callable, List, Optional
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Type
 import validate as valid
 
 
@@ -6,6 +7,66 @@ class ValidationFailedError(Exception):
     pass
 
 
+class FieldRegistry:
+    """
+    Handlers for each type of `Field` (e.g. the function rendering a field's input),
+    so that adding a field type only needs its handlers to be registered, e.g.
+    ```
+    input_renderers = FieldRegistry('input renderer')
+
+    @input_renderers.register(ConstrainedString)
+    def dropdown(field, value): ...
+
+    input_renderers.resolve(field)(field, value)
+    ```
+    The handler of a `Field` subclass is the one registered for its closest
+    base class, found once per subclass.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.__handlers: Dict[type, Callable] = {}
+        self.__resolved: Dict[type, Callable] = {}
+
+    def register(self, field_type: Type['Field']) -> Callable[[Callable], Callable]:
+        """Decorator registering the handler of `field_type` (and its subclasses)"""
+        def decorator(handler: Callable) -> Callable:
+            self.__handlers[field_type] = handler
+            self.__resolved.clear()
+            return handler
+        return decorator
+
+    def resolve(self, field: 'Field') -> Callable:
+        """
+        Raises
+        ------
+        `LookupError`
+        - if no handler is registered for the type of `field` or its base classes
+        """
+        field_type = type(field)
+        handler = self.__resolved.get(field_type)
+        if handler is None:
+            for base in field_type.__mro__:
+                if base in self.__handlers:
+                    handler = self.__handlers[base]
+                    break
+            else:
+                raise LookupError(f'No {self.name} registered for {field_type.__name__}')
+            self.__resolved[field_type] = handler
+        return handler
+
+    def resolve_all(self, fields: List['Field']) -> List[Callable]:
+        """Return the handler of each of the `fields`, in the same order"""
+        return [self.resolve(field) for field in fields]
+
+
+# the validator of each type of field, called with the field and the value to validate
+validators = FieldRegistry('validator')
+
+# the parser of each type of field, called with the field and a submitted value (see `Field.parse`)
+parsers = FieldRegistry('parser')
+
+
 class Field:
     """
     Base class which all subclasses must inherit.
@@ -14,19 +75,49 @@ class Field:
     Each field needs:
     - name
     - label
-    - validator
+    - validator (registered in `validators`)
+    - parser (registered in `parsers`, which leaves values as submitted by default)
 
     Each field generates:
     - formatted string
     - html <input> element
+
+    Renderers for each type of field are registered in a `FieldRegistry`
+    (see `convert.input_templates`, `myhtml.editable_cells`, `myhtml.new_row_cells`).
     """
-    validate: Callable = NotImplemented
     html_input_type: str = 'text'  # default <input type="text">
+    constraints: Optional[List[str]] = None  # the only values allowed, shown as a dropdown
+
+    @staticmethod
+    def to_db(value: Any) -> Any:
+        """Convert a valid `value` (or None) to the value stored in the db"""
+        return value
+
+    @staticmethod
+    def from_db(value: Any) -> Any:
+        """Convert a value found in the db back to the value of the field. See `to_db`"""
+        return value
 
     def __init__(self, name: str, label: str):
         self.name = name
         self.label = label
 
+    def validate(self, value: Any) -> bool:
+        """Whether `value` is valid, by the validator registered for the field's type"""
+        return validators.resolve(self)(self, value)
+
+    def parse(self, value: Any) -> Any:
+        """
+        Convert a submitted `value` (str) to the type stored in the db,
+        by the parser registered for the field's type
+
+        Raises
+        ------
+        `ValueError`
+        - if `value` can't be converted
+        """
+        return parsers.resolve(self)(self, value)
+
     def __repr__(self):
         return (
             f'{self.__class__.__name__}('
@@ -44,19 +135,20 @@ class Number(Field):
     - name: str
     - label: str
     """
-    validate: Callable = staticmethod(valid.number)
     html_input_type: str = 'number'
 
+    @staticmethod
+    def to_db(value: Any) -> Any:
+        if isinstance(value, str) and value.isdigit():
+            return int(value)
+        return value
+
 
 class OptionalNumber(Number):
     """
     An optional field of numerical type. See `Number`.
     """
 
-    @staticmethod
-    def validate(value: Any) -> bool:
-        return value is None or value == '' or valid.number(value)
-
 
 class String(Field):
     """
@@ -71,21 +163,12 @@ class String(Field):
 
     html_input_type: str = 'text'
 
-    @staticmethod
-    def validate(value: Any) -> bool:
-        return value != '' and valid.string(value)
-
 
 class ConstrainedString(String):
     """
     A field of string type which takes only certain values specified by `constraints`.
     """
 
-    def validate(self, value: Any):
-        if self.constraints is None:
-            return True
-        return value in self.constraints
-
     def __init__(self, name: str, label: str, constraints: Optional[List[str]] = None):
         super().__init__(name, label)
         self.constraints = constraints
@@ -95,7 +178,6 @@ class OptionalString(String):
     """
     An optional field of string type. See `String`
     """
-    validate: Callable = staticmethod(valid.string)
 
 
 class Date(String):
@@ -108,19 +190,28 @@ class Date(String):
     - (optional) validate: function
       Used to validate input values
     """
-    validate: Callable = staticmethod(valid.date)
     html_input_type: str = 'date'
 
+    @staticmethod
+    def to_db(value: Any) -> Any:
+        """Dates are stored as YYYYMMDD integers (e.g. 2022-04-13 -> 20220413), which sort by date"""
+        if isinstance(value, str):
+            return int(value.replace('-', '')) if value != '' else None
+        return value
+
+    @staticmethod
+    def from_db(value: Any) -> Any:
+        """YYYYMMDD integers are converted back to YYYY-MM-DD (e.g. 20220413 -> 2022-04-13)"""
+        if isinstance(value, int):
+            return f'{value // 10000:04}-{value // 100 % 100:02}-{value % 100:02}'
+        return value
+
 
 class OptionalDate(Date):
     """
     An optional field of date type. See `Date`.
     """
 
-    @staticmethod
-    def validate(value: str) -> bool:
-        return value == '' or valid.date(value)
-
 
 class Year(Number):
     """
@@ -132,4 +223,169 @@ class Year(Number):
     - (optional) validate: function
       Used to validate input values
     """
-    validate: Callable = staticmethod(valid.year)
+
+
+@parsers.register(Field)
+@parsers.register(OptionalNumber)
+def parse_as_submitted(field: Field, value: Any) -> Any:
+    """The parser of the fields whose submitted values are stored as they are"""
+    return value
+
+
+@parsers.register(Number)
+def _parse_number(field: Field, value: Any) -> Any:
+    if isinstance(value, int):
+        return value
+    if not isinstance(value, str) or not value.isdecimal():
+        raise ValueError(f'`{value}` is not a number.')
+    return int(value)
+
+
+@validators.register(Number)
+def _validate_number(field: Field, value: Any) -> bool:
+    return valid.number(value)
+
+
+@validators.register(OptionalNumber)
+def _validate_optional_number(field: Field, value: Any) -> bool:
+    return value is None or value == '' or valid.number(value)
+
+
+@validators.register(String)
+def _validate_string(field: Field, value: Any) -> bool:
+    return value != '' and valid.string(value)
+
+
+@validators.register(ConstrainedString)
+def _validate_constraints(field: Field, value: Any) -> bool:
+    if field.constraints is None:
+        return True
+    return value in field.constraints
+
+
+@validators.register(OptionalString)
+def _validate_optional_string(field: Field, value: Any) -> bool:
+    return valid.string(value)
+
+
+@validators.register(Date)
+def _validate_date(field: Field, value: Any) -> bool:
+    return valid.date(value)
+
+
+@validators.register(OptionalDate)
+def _validate_optional_date(field: Field, value: Any) -> bool:
+    return value == '' or valid.date(value)
+
+
+@validators.register(Year)
+def _validate_year(field: Field, value: Any) -> bool:
+    return valid.year(value)
+
+
+# ------------------------------
+# Batch validation
+# Validates many records at a time (e.g. all the rows submitted in an edit) given as
+# columns, 1 per field. The check of each field is compiled once, then run over its
+# whole column at a time.
+# ------------------------------
+ColumnCheck = Callable[[Sequence[Any]], List[int]]  # returns the indexes of the invalid values
+RowErrors = Dict[int, Dict[str, str]]  # {row index: {field name: error message}}
+
+# functions compiling the `ColumnCheck` of a field, by field type
+column_checks = FieldRegistry('column check')
+
+
+def invalid_field_msg(field: Field, value: Any) -> str:
+    return f'Invalid field, `{field.name}`: `{value}`'
+
+
+@column_checks.register(Field)
+def _check_distinct_values(field: Field) -> ColumnCheck:
+    """
+    Validate each distinct value in the column only once with the field's validator,
+    as most columns repeat values (e.g. the same dates, years or names in many rows)
+    """
+    validate = partial(validators.resolve(field), field)
+
+    def check(values: Sequence[Any]) -> List[int]:
+        results: Dict[Any, bool] = {}
+        invalid = []
+        for idx, value in enumerate(values):
+            key = (type(value), value)  # e.g. 1 and True are different values
+            try:
+                is_valid = results[key]
+            except KeyError:
+                is_valid = results[key] = bool(validate(value))
+            except TypeError:  # unhashable value
+                is_valid = validate(value)
+            if not is_valid:
+                invalid.append(idx)
+        return invalid
+    return check
+
+
+@column_checks.register(Number)
+def _check_numbers(field: Field) -> ColumnCheck:
+    """Inline `validate.number` (int, float or a str of digits) for the whole column"""
+    if validators.resolve(field) is not _validate_number:  # e.g. `Year`, `OptionalNumber`
+        return _check_distinct_values(field)
+
+    def check(values: Sequence[Any]) -> List[int]:
+        return [
+            idx for idx, value in enumerate(values)
+            if not (type(value) in (int, float) or (type(value) is str and value.isdigit()))
+        ]
+    return check
+
+
+@column_checks.register(ConstrainedString)
+def _check_constraints(field: Field) -> ColumnCheck:
+    """Check membership in a set of the constraints instead of the list"""
+    if validators.resolve(field) is not _validate_constraints:
+        return _check_distinct_values(field)
+    if field.constraints is None:
+        return lambda values: []
+    constraints = field.constraints
+    allowed = frozenset(constraints)
+
+    def check(values: Sequence[Any]) -> List[int]:
+        try:
+            return [idx for idx, value in enumerate(values) if value not in allowed]
+        except TypeError:  # unhashable value
+            return [idx for idx, value in enumerate(values) if value not in constraints]
+    return check
+
+
+@lru_cache(maxsize=None)
+def _column_check(field: Field) -> ColumnCheck:
+    return column_checks.resolve(field)(field)
+
+
+def validate_columns(fields: List[Field], columns: Dict[str, Sequence[Any]]) -> RowErrors:
+    """
+    Validate the values of each of the `fields` in `columns`, in the format
+    ```
+    {
+        "field_1": [<value of row 0>, <value of row 1>, ...],
+        "field_2": [...],
+    }
+    ```
+    Each value is valid if it passes its field's `validate` (the same as creating an `Entity`).
+
+    Raises
+    ------
+    `KeyError`
+    - if the column of a field is missing
+
+    Return
+    ------
+    The errors of each row with invalid values (none if all rows are valid), in the format
+    `{row index: {field name: error message}}`, with the fields in the same order as `fields`
+    """
+    errors: RowErrors = {}
+    for field in fields:
+        values = columns[field.name]
+        for idx in _column_check(field)(values):
+            errors.setdefault(idx, {})[field.name] = invalid_field_msg(field, values[idx])
+    return {idx: errors[idx] for idx in sorted(errors)}
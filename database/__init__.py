@@ -1,28 +1,68 @@
 import csv
+import logging
 import sqlite3
-from typing import Dict as __Dict
+from typing import Dict as __Dict, Type as __Type
 from .storage import *
+from .registry import CollectionRegistry
+from .pending import PendingChanges
+from .slow_queries import SlowQueryLog
+from . import migrations
+from . import writer
+from .connection import connect, enable_wal
+from . import schema as s
 
 
 DB_PATH = 'database/nyjc.db'
-colls: __Dict[str, Collection] = {
-    'student': Students(DB_PATH),
-    'club': Clubs(DB_PATH),
-    'class': Classes(DB_PATH),
-    'activity': Activities(DB_PATH),
-    'subject': Subjects(DB_PATH),
-    'membership': Membership(DB_PATH),
-    'participation': Participation(DB_PATH),
-    'student-subject': StudentSubject(DB_PATH),
+COLLECTION_TYPES: __Dict[str, __Type[Collection]] = {
+    'student': Students,
+    'club': Clubs,
+    'class': Classes,
+    'activity': Activities,
+    'subject': Subjects,
+    'membership': Membership,
+    'participation': Participation,
+    'student-subject': StudentSubject,
 }
 
 
+colls = CollectionRegistry(DB_PATH, COLLECTION_TYPES)
+pending_changes = PendingChanges(DB_PATH)
+slow_queries = SlowQueryLog()
+query_hooks.append(slow_queries.on_query)
+
+
+def init_schema(db_path: str = DB_PATH) -> None:
+    """
+    Create all the tables (and their indexes) in the db specified by `db_path` if they
+    don't exist yet, or migrate the tables of an existing db to the latest schema.
+    Only needs to be run once, before the collections in `colls` are first used.
+    Also switches the db to WAL mode, so several processes can use it at once.
+    """
+    with connect(db_path) as conn:
+        enable_wal(conn)
+        table_count = conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+        if table_count == 0:  # new db, created with the latest schema
+            migrations.set_version(conn, migrations.LATEST_VERSION)
+        else:
+            migrations.migrate(conn)
+
+        for coll_type in COLLECTION_TYPES.values():
+            conn.execute(coll_type.schema_sql)
+            for sql in coll_type.index_sql:
+                conn.execute(sql)
+        conn.execute(s.pending_change_sql)
+    conn.close()
+
+
 # funcs to init db from csvs
 # pylint: disable=unspecified-encoding
 __CSV_FOLDER = './database/csv_data'
+__logger = logging.getLogger(__name__)
 
 
 def init_db_from_csvs():
+    init_schema()
     __init_class_table()
     __init_student_table()
     __init_subject_table()
@@ -31,6 +71,7 @@ def init_db_from_csvs():
     __init_student_subject_table()
     __init_student_activity_table()
     __init_student_club_table()
+    __logger.info('Loaded the db from the CSVs in %s', __CSV_FOLDER)
 
 
 def __init_class_table():
@@ -43,8 +84,7 @@ def __init_class_table():
             try:
                 coll.insert(record)
             except sqlite3.IntegrityError as err:
-                # print(err)
-                ...
+                __logger.debug('Skipped a %s already in the db: %s', coll.table_name, err)
 
 
 def __init_student_table():
@@ -61,8 +101,7 @@ def __init_student_table():
             try:
                 coll.insert(record)
             except sqlite3.IntegrityError as err:
-                # print(err)
-                ...
+                __logger.debug('Skipped a %s already in the db: %s', coll.table_name, err)
 
 
 def __init_subject_table():
@@ -75,8 +114,7 @@ def __init_subject_table():
             try:
                 coll.insert(record)
             except sqlite3.IntegrityError as err:
-                # print(err)
-                ...
+                __logger.debug('Skipped a %s already in the db: %s', coll.table_name, err)
 
 
 def __init_club_table():
@@ -89,8 +127,7 @@ def __init_club_table():
             try:
                 coll.insert(record)
             except sqlite3.IntegrityError as err:
-                # print(err)
-                ...
+                __logger.debug('Skipped a %s already in the db: %s', coll.table_name, err)
 
 
 def __init_activity_table():
@@ -110,11 +147,9 @@ def __init_student_subject_table():
                 record['subject_id'] = None
 
             try:
-                print(record['student_id'])
                 coll.insert(record)
             except sqlite3.IntegrityError as err:
-                # print(err)
-                ...
+                __logger.debug('Skipped a %s already in the db: %s', coll.table_name, err)
 
 
 def __init_student_activity_table():
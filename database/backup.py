@@ -0,0 +1,267 @@
+"""
+Online backups of the db using the sqlite3 backup API.
+
+The db is copied a few pages at a time (see `sqlite3.Connection.backup`). The source
+is only locked while a step is being copied, so writers are never blocked for longer
+than one step. During school hours the steps are made smaller and spaced further apart
+so that backups don't cause latency spikes while the app is in use.
+
+Backups can be taken from inside the app process with a `BackupScheduler`, or from
+the command line against the same db, e.g.
+```
+python -m database.backup                 # take 1 backup now
+python -m database.backup --every 21600   # take a backup every 6 hours
+python -m database.backup --verify database/backups/nyjc-20220401-120000.db
+```
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+
+BACKUP_DIR = 'database/backups'
+BACKUP_PREFIX = 'nyjc-'
+BACKUP_SUFFIX = '.db'
+KEEP = 7  # number of backups to keep when rotating
+INTERVAL = 6 * 60 * 60  # seconds between scheduled backups
+
+# (first hour, last hour) during which the app is in use
+SCHOOL_HOURS = (7, 18)
+# pages copied per step and seconds slept between steps
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.0
+SCHOOL_HOURS_PAGES_PER_STEP = 16
+SCHOOL_HOURS_STEP_SLEEP = 0.05
+
+
+class BackupError(Exception):
+    pass
+
+
+def is_school_hours(now: Optional[datetime] = None) -> bool:
+    """
+    Return
+    - True if `now` (default: the current time) is a weekday within `SCHOOL_HOURS`
+    - False otherwise
+    """
+    now = now or datetime.now()
+    start, end = SCHOOL_HOURS
+    return now.weekday() < 5 and start <= now.hour <= end
+
+
+def backup(
+    db_path: str,
+    dest_path: str,
+    pages: int = PAGES_PER_STEP,
+    sleep: float = STEP_SLEEP,
+) -> str:
+    """
+    Copy the db at `db_path` to `dest_path`, `pages` pages at a time, sleeping for `sleep`
+    seconds between each step.
+
+    The backup is written to a temporary file first and only renamed to `dest_path`
+    once it is complete, so `dest_path` is never a torn copy.
+
+    Return
+    - `dest_path`
+    """
+    def progress(status: int, remaining: int, total: int) -> None:
+        # the source is unlocked between steps, let writers catch up
+        if sleep > 0 and remaining > 0:
+            time.sleep(sleep)
+
+    part_path = dest_path + '.part'
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+    src = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    dest = sqlite3.connect(part_path)
+    try:
+        src.backup(dest, pages=pages, progress=progress)
+        # the copy of a db in WAL mode is in WAL mode too, keep the backup a single file
+        dest.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        dest.close()
+        src.close()
+
+    os.replace(part_path, dest_path)
+    return dest_path
+
+
+def verify(backup_path: str) -> None:
+    """
+    Verify a backup by restoring it into an in-memory db and checking that
+    it passes an integrity check and that every table in it can be read.
+
+    Raises
+    ------
+    `BackupError`
+    - if the backup could not be restored or is corrupted
+    """
+    if not os.path.isfile(backup_path):
+        raise BackupError(f'Backup `{backup_path}` does not exist')
+
+    src = sqlite3.connect(f'file:{backup_path}?mode=ro', uri=True)
+    restored = sqlite3.connect(':memory:')
+    try:
+        src.backup(restored)
+        result = restored.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            raise BackupError(f'Backup `{backup_path}` failed integrity check: {result}')
+
+        tables = restored.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        if len(tables) == 0:
+            raise BackupError(f'Backup `{backup_path}` has no tables')
+        for (table,) in tables:
+            restored.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()
+    except sqlite3.DatabaseError as err:
+        raise BackupError(f'Unable to restore backup `{backup_path}`: {err}') from err
+    finally:
+        restored.close()
+        src.close()
+
+
+def list_backups(backup_dir: str = BACKUP_DIR) -> List[str]:
+    """Return the paths of the backups in `backup_dir`, oldest first"""
+    if not os.path.isdir(backup_dir):
+        return []
+    names = sorted(
+        name for name in os.listdir(backup_dir)
+        if name.startswith(BACKUP_PREFIX) and name.endswith(BACKUP_SUFFIX)
+    )
+    return [os.path.join(backup_dir, name) for name in names]
+
+
+def rotate(backup_dir: str = BACKUP_DIR, keep: int = KEEP) -> List[str]:
+    """
+    Delete all but the newest `keep` backups in `backup_dir`.
+
+    Return
+    - the paths of the deleted backups
+    """
+    backups = list_backups(backup_dir)
+    to_delete = backups[:-keep] if keep > 0 else backups
+    for path in to_delete:
+        os.remove(path)
+    return to_delete
+
+
+def run_backup(
+    db_path: str,
+    backup_dir: str = BACKUP_DIR,
+    keep: int = KEEP,
+) -> str:
+    """
+    Take a backup of the db at `db_path` into `backup_dir`, verify it,
+    then rotate out old backups. Backups taken during school hours are throttled.
+
+    Raises
+    ------
+    `BackupError`
+    - if the new backup fails verification (it is deleted, and no backups are rotated out)
+
+    Return
+    - the path of the new backup
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    dest_path = os.path.join(backup_dir, f'{BACKUP_PREFIX}{timestamp}{BACKUP_SUFFIX}')
+
+    if is_school_hours():
+        backup(db_path, dest_path, SCHOOL_HOURS_PAGES_PER_STEP, SCHOOL_HOURS_STEP_SLEEP)
+    else:
+        backup(db_path, dest_path, PAGES_PER_STEP, STEP_SLEEP)
+
+    try:
+        verify(dest_path)
+    except BackupError:
+        os.remove(dest_path)
+        raise
+
+    rotate(backup_dir, keep)
+    return dest_path
+
+
+class BackupScheduler(threading.Thread):
+    """
+    Background thread that takes a backup every `interval` seconds.
+
+    e.g. to take backups from inside the app process
+    ```
+    scheduler = BackupScheduler(DB_PATH)
+    scheduler.start()
+    ...
+    scheduler.stop()
+    ```
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        backup_dir: str = BACKUP_DIR,
+        keep: int = KEEP,
+        interval: float = INTERVAL,
+    ) -> None:
+        super().__init__(name='backup-scheduler', daemon=True)
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.interval = interval
+        self.last_backup: Optional[str] = None
+        self.last_error: Optional[Exception] = None
+        self.__stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.__stopped.is_set():
+            try:
+                self.last_backup = run_backup(self.db_path, self.backup_dir, self.keep)
+                self.last_error = None
+            except (BackupError, sqlite3.Error, OSError) as err:
+                self.last_error = err
+            self.__stopped.wait(self.interval)
+
+    def stop(self) -> None:
+        self.__stopped.set()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from . import DB_PATH
+
+    parser = argparse.ArgumentParser(description='Take online backups of the db.')
+    parser.add_argument('--db', default=DB_PATH, help='path of the db to back up')
+    parser.add_argument('--dir', default=BACKUP_DIR, help='directory to store backups in')
+    parser.add_argument('--keep', type=int, default=KEEP, help='number of backups to keep')
+    parser.add_argument(
+        '--every', type=float, default=None,
+        help='take a backup every EVERY seconds instead of just once')
+    parser.add_argument(
+        '--verify', metavar='BACKUP', default=None,
+        help='verify an existing backup instead of taking one')
+    args = parser.parse_args(argv)
+
+    if args.verify is not None:
+        verify(args.verify)
+        print(f'{args.verify} OK')
+        return
+
+    if args.every is None:
+        print(run_backup(args.db, args.dir, args.keep))
+        return
+
+    scheduler = BackupScheduler(args.db, args.dir, args.keep, args.every)
+    scheduler.start()
+    try:
+        while scheduler.is_alive():
+            scheduler.join(1)
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+Connections to the db, with settings that are safe for several processes
+(e.g. the worker processes of server.py) using the same db file at once.
+
+- The db is in WAL mode (see `enable_wal`), so readers don't block the writer and the
+  writer doesn't block readers. This is stored in the db file, so it only needs to be set once.
+- A connection waits up to `BUSY_TIMEOUT` seconds for another process' write lock
+  instead of failing straight away with "database is locked". Within a process, every
+  write is made by the same connection (see `database.writer`), so only processes wait.
+- Commits only sync the WAL at checkpoints (`synchronous = NORMAL`), which is still
+  safe from corruption in WAL mode, but may lose the last commits on a power failure.
+"""
+
+import sqlite3
+
+
+BUSY_TIMEOUT = 10.0  # seconds to wait for a lock held by another connection
+
+
+def connect(db_path: str, **kwargs) -> sqlite3.Connection:
+    """
+    Open a connection to the db at `db_path` (see `sqlite3.connect`, which takes `**kwargs`)
+    """
+    kwargs.setdefault('timeout', BUSY_TIMEOUT)
+    conn = sqlite3.connect(db_path, **kwargs)
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+
+def enable_wal(conn: sqlite3.Connection) -> None:
+    """Switch the db of `conn` to WAL mode, if it isn't already"""
+    mode = conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+    if mode.lower() != 'wal':
+        raise sqlite3.OperationalError(f'Unable to switch the db to WAL mode (mode: {mode})')
@@ -25,22 +25,60 @@ the expanded record looks something like
 ```
 """
 
+import logging
 import sqlite3  # for errors
+from typing import List, Optional, Sequence, TypedDict
 from . import colls
+from .writer import JobConnection
+
+
+logger = logging.getLogger(__name__)
+
+# the collections each junction table collection refers to, with the columns of their ids
+# e.g. a membership refers to a club by its `club_id` and a student by its `student_id`
+JT_REFERENCES = {
+    'membership': (('club', 'club_id'), ('student', 'student_id')),
+    'participation': (('activity', 'activity_id'), ('student', 'student_id')),
+}
+
+# the error of a change by key to a record changed (or deleted) by someone else since
+CONFLICT = 'The record was changed by someone else, please reload the page and try again.'
+
+
+class ResolvedChange(TypedDict):
+    """
+    A change to a junction table, with the expanded records resolved to ids
+    (see `resolve_jt_change`), e.g. for membership
+    ```
+    {
+        'method': 'UPDATE',
+        'filter': {'club_id': 1, 'student_id': 6, 'role': 'member'},  # the record(s) to change
+        'record': {'club_id': 1, 'student_id': 6, 'role': 'president'},  # the new record
+        'rows': None,  # the number of records it must change, 1 for the changes by key
+    }
+    ```
+    `filter` is empty for INSERTs and `record` is empty for DELETEs.
+    Only contains JSON types, so it can be stored (see `database.pending`).
+    """
+    method: str
+    filter: dict
+    record: dict
+    rows: Optional[int]
 
 
 class DBUtilsResult:
-    def __init__(self, msg: str, is_ok: bool) -> None:
+    def __init__(self, msg: str, is_ok: bool, change: Optional[ResolvedChange] = None) -> None:
         self.msg = msg
         self.is_ok = is_ok
+        self.change = change  # only for results of resolving a change
 
     @classmethod
     def error(cls, msg: str) -> None:
         return cls(msg, is_ok=False)
 
     @classmethod
-    def success(cls, msg: str = '') -> None:
-        return cls(msg, is_ok=True)
+    def success(cls, msg: str = '', change: Optional[ResolvedChange] = None) -> None:
+        return cls(msg, is_ok=True, change=change)
 
     def __str__(self) -> str:
         return self.msg
@@ -51,6 +89,39 @@ class DBUtilsResult:
 
 def insert_into_jt_coll(jt_coll_name: str, new_record: dict) -> DBUtilsResult:
     """Insert `new_record` into the junction table collection specified by `coll_name`"""
+    res = resolve_insert(jt_coll_name, new_record)
+    if not res.is_ok:
+        return res
+    return apply_jt_change(jt_coll_name, res.change)
+
+
+def update_jt_coll(jt_coll_name: str, old_record: dict, new_record: dict) -> DBUtilsResult:
+    """
+    Update the junction table collection specified by `jt_coll_name`,
+    replacing the records matching `old_record` with `new_record` (see `resolve_update`).
+    """
+    res = resolve_update(jt_coll_name, old_record, new_record)
+    if not res.is_ok:
+        return res
+    return apply_jt_change(jt_coll_name, res.change)
+
+
+def delete_from_jt_coll(jt_coll_name: str, record: dict) -> DBUtilsResult:
+    """
+    Delete from junction table collection specified by `jt_coll_name`,
+    deleting records matching `record` (see `resolve_delete`).
+    """
+    res = resolve_delete(jt_coll_name, record)
+    if not res.is_ok:
+        return res
+    return apply_jt_change(jt_coll_name, res.change)
+
+
+def resolve_insert(jt_coll_name: str, new_record: dict) -> DBUtilsResult:
+    """
+    Resolve the insertion of `new_record` into the junction table collection specified
+    by `coll_name` to a `ResolvedChange` (`DBUtilsResult.change`), without making it
+    """
     if jt_coll_name == 'membership':
         table_1 = 'club'
         table_2 = 'student'
@@ -106,7 +177,6 @@ def insert_into_jt_coll(jt_coll_name: str, new_record: dict) -> DBUtilsResult:
             f'ERROR WHILE INSERTING: No {table_2} records found. \
                 Matching against {coll_2_to_find}')
     coll_2_id = coll_2_records[0]['id']
-    print(coll_2_records, coll_2_id)
 
     # Find the other info to insert (e.g. 'role' field in membership table)
     record_to_insert = {
@@ -121,20 +191,18 @@ def insert_into_jt_coll(jt_coll_name: str, new_record: dict) -> DBUtilsResult:
         record_to_insert[column_name] = value
 
     # Insert the record containing the appropriate fields in membership table
-    print(record_to_insert)
-    try:
-        jt_coll.insert(record_to_insert)
-        return DBUtilsResult.success()
-    except sqlite3.IntegrityError as err:
-        return DBUtilsResult.error(str(err))
+    logger.debug('Resolved INSERT into %s', jt_coll_name, extra={'record': record_to_insert})
+    return DBUtilsResult.success(
+        change={'method': 'INSERT', 'filter': {}, 'record': record_to_insert, 'rows': None})
 
 
 # naming convention below considers jt_coll_name = 'membership' because brain too smol
 
-def update_jt_coll(jt_coll_name: str, old_record: dict, new_record: dict) -> DBUtilsResult:
+def resolve_update(jt_coll_name: str, old_record: dict, new_record: dict) -> DBUtilsResult:
     """
-    Update the junction table collection specified by `jt_coll_name`,
-    replacing the records matching `old_record` with `new_record`.
+    Resolve the update of the junction table collection specified by `jt_coll_name`,
+    replacing the records matching `old_record` with `new_record`, to a `ResolvedChange`
+    (`DBUtilsResult.change`), without making it.
 
     e.g. consider membership junction table, where OBAMA has student_id = 6,
     WHITE HOUSE club has club_id = 1 and OBAMA FOUNDATION club has club_id = 4
@@ -148,7 +216,7 @@ def update_jt_coll(jt_coll_name: str, old_record: dict, new_record: dict) -> DBU
         'student_club': 'OBAMA FOUNDATION',
     }
     ```
-    will execute:
+    will be resolved to execute:
     ```
     coll.update(
         {
@@ -260,19 +328,18 @@ def update_jt_coll(jt_coll_name: str, old_record: dict, new_record: dict) -> DBU
             continue
         new_jt_records[column_name] = new_value
 
-    print(old_jt_records)
-    print(new_jt_records)
-    try:
-        jt_coll.update(old_jt_records, new_jt_records)
-        return DBUtilsResult.success()
-    except sqlite3.IntegrityError as err:
-        return DBUtilsResult.error(str(err))
+    logger.debug(
+        'Resolved UPDATE of %s', jt_coll_name,
+        extra={'filter': old_jt_records, 'record': new_jt_records})
+    return DBUtilsResult.success(
+        change={'method': 'UPDATE', 'filter': old_jt_records, 'record': new_jt_records, 'rows': None})
 
 
-def delete_from_jt_coll(jt_coll_name: str, record: dict) -> DBUtilsResult:
+def resolve_delete(jt_coll_name: str, record: dict) -> DBUtilsResult:
     """
-    Delete from junction table collection specified by `jt_coll_name`,
-    deleting records matching `record`.
+    Resolve the deletion from the junction table collection specified by `jt_coll_name`
+    of the records matching `record` to a `ResolvedChange` (`DBUtilsResult.change`),
+    without making it.
 
     e.g. consider membership coll, where OBAMA student_id = 6 and WHITE HOUSE club_id = 1
     ```
@@ -282,7 +349,7 @@ def delete_from_jt_coll(jt_coll_name: str, record: dict) -> DBUtilsResult:
         'role': 'member',
     }
     ```
-    will execute
+    will be resolved to execute
     ```
     coll.delete({
         'student_id': 6,
@@ -354,9 +421,245 @@ def delete_from_jt_coll(jt_coll_name: str, record: dict) -> DBUtilsResult:
             continue
         jt_record_to_delete[column_name] = value
 
-    print(jt_record_to_delete)
+    logger.debug('Resolved DELETE from %s', jt_coll_name, extra={'filter': jt_record_to_delete})
+    return DBUtilsResult.success(
+        change={'method': 'DELETE', 'filter': jt_record_to_delete, 'record': {}, 'rows': None})
+
+
+def key_to_filter(jt_coll_name: str, key: Sequence) -> dict:
+    """
+    Return the filter matching the record of the junction table collection with the `key`
+    (see `Collection.key_sql`), e.g. `{'student_id': 6, 'club_id': 1}` for membership.
+    The key of a junction table is its primary key, so the filter matches 1 record at most.
+
+    Raises
+    ------
+    `ValueError`
+    - if `key` is not a key of the junction table collection
+    """
+    jt_coll = colls[jt_coll_name]
+    if len(key) != len(jt_coll.key_sql) or not all(isinstance(value, int) for value in key):
+        raise ValueError(f'Invalid key {list(key)}')
+    # e.g. Student_club.student_id -> student_id
+    return {sql.split('.')[-1]: value for sql, value in zip(jt_coll.key_sql, key)}
+
+
+def _old_filter(jt_coll_name: str, key_filter: dict, old_record: dict) -> Optional[dict]:
+    """
+    Return the filter matching the record with the key only if it is still `old_record`,
+    i.e. `key_filter` and the old values of the junction table's own columns (e.g. role),
+    so a change made from a stale `old_record` changes nothing (see `apply_jt_changes`).
+
+    Return None if the record with the key is not (or no longer) `old_record`,
+    e.g. a key given with the names of another student or club.
+    """
+    jt_coll = colls[jt_coll_name]
+    to_find = {
+        column_name: value for column_name, value in old_record.items()
+        if column_name in jt_coll.found_column_names and value not in ('', None)
+    }
+    to_find.update(key_filter)
+    if len(jt_coll.find(to_find)) != 1:  # by its primary key, with the names it refers to
+        return None
+    return {
+        column_name: value for column_name, value in to_find.items()
+        if column_name in jt_coll.column_names
+    }
+
+
+def resolve_update_by_key(
+    jt_coll_name: str,
+    key: Sequence,
+    old_record: dict,
+    new_record: dict,
+) -> DBUtilsResult:
+    """
+    Resolve the update of the record with the `key` (see `key_to_filter`) in the junction
+    table collection specified by `jt_coll_name` from `old_record` to `new_record`
+    to a `ResolvedChange` (`DBUtilsResult.change`), without making it.
+
+    Unlike `resolve_update`, the record is changed by its key, so only the records it refers
+    to that are changed are found by name, e.g. the new club of a membership moved to another
+    club. The record is only changed if it is still `old_record` (see `_old_filter`).
+    """
+    if jt_coll_name not in JT_REFERENCES:
+        return DBUtilsResult.error(f'ERROR WHILE UPDATING: Invalid jt_coll_name `{jt_coll_name}`')
     try:
-        jt_coll.delete(jt_record_to_delete)
-        return DBUtilsResult.success()
-    except sqlite3.IntegrityError as err:
-        return DBUtilsResult.error(str(err))
+        key_filter = key_to_filter(jt_coll_name, key)
+    except ValueError as err:
+        return DBUtilsResult.error(f'ERROR WHILE UPDATING: {err}')
+    old_filter = _old_filter(jt_coll_name, key_filter, old_record)
+    if old_filter is None:
+        return DBUtilsResult.error(f'ERROR WHILE UPDATING: {CONFLICT}')
+
+    new_jt_record = dict(key_filter)
+    for coll_name, id_name in JT_REFERENCES[jt_coll_name]:
+        coll = colls[coll_name]
+        to_update = {
+            column_name: new_record.get(column_name)
+            for column_name in coll.column_names
+            if old_record.get(column_name) is not None
+        }
+        if all(old_record[column_name] == value for column_name, value in to_update.items()):
+            continue  # still refers to the same record
+
+        records = coll.find(to_update)
+        if len(records) > 1:
+            return DBUtilsResult.error(
+                f'ERROR WHILE UPDATING: More than 1 {coll_name} records found. \
+                Matching against: {to_update}')
+        elif len(records) == 0:
+            return DBUtilsResult.error(
+                f'ERROR WHILE UPDATING: No {coll_name} records found. \
+                Matching against: {to_update}')
+        new_jt_record[id_name] = records[0]['id']
+
+    for column_name in colls[jt_coll_name].column_names:
+        new_value = new_record.get(column_name, '')
+        if column_name in key_filter or new_value in ('', None):
+            continue
+        new_jt_record[column_name] = new_value
+
+    logger.debug(
+        'Resolved UPDATE of %s by key', jt_coll_name,
+        extra={'filter': old_filter, 'record': new_jt_record})
+    return DBUtilsResult.success(
+        change={'method': 'UPDATE', 'filter': old_filter, 'record': new_jt_record, 'rows': 1})
+
+
+def resolve_delete_by_key(jt_coll_name: str, key: Sequence, record: dict) -> DBUtilsResult:
+    """
+    Resolve the deletion of the `record` with the `key` (see `key_to_filter`) from the
+    junction table collection specified by `jt_coll_name` to a `ResolvedChange`
+    (`DBUtilsResult.change`), without making it. Unlike `resolve_delete`, nothing is found
+    by name, and the record is only deleted if it is still `record` (see `_old_filter`).
+    """
+    if jt_coll_name not in JT_REFERENCES:
+        return DBUtilsResult.error(f'ERROR WHILE DELETING: Invalid jt_coll_name `{jt_coll_name}`')
+    try:
+        key_filter = key_to_filter(jt_coll_name, key)
+    except ValueError as err:
+        return DBUtilsResult.error(f'ERROR WHILE DELETING: {err}')
+    old_filter = _old_filter(jt_coll_name, key_filter, record)
+    if old_filter is None:
+        return DBUtilsResult.error(f'ERROR WHILE DELETING: {CONFLICT}')
+
+    logger.debug('Resolved DELETE from %s by key', jt_coll_name, extra={'filter': old_filter})
+    return DBUtilsResult.success(
+        change={'method': 'DELETE', 'filter': old_filter, 'record': {}, 'rows': 1})
+
+
+def resolve_jt_change(jt_coll_name: str, rec_delta: dict) -> DBUtilsResult:
+    """
+    Resolve a change to the junction table collection specified by `jt_coll_name`
+    to a `ResolvedChange` (`DBUtilsResult.change`) without making it,
+    where the change is in the format:
+    ```
+    {
+        "old": {...},  # expanded record (see above)
+        "new": {...},  # expanded record (see above)
+        "method": "INSERT" | "UPDATE" | "DELETE",
+        "key": [...]  # optional, the key of the old record (see `key_to_filter`)
+    }
+    ```
+    UPDATEs and DELETEs with a `key` change the record by its key, the others find
+    the records they change by the names in them (see `resolve_update`).
+    """
+    method = rec_delta['method']
+    old_rec = rec_delta['old']
+    new_rec = rec_delta['new']
+    key = rec_delta.get('key')
+
+    if method == 'INSERT':
+        return resolve_insert(jt_coll_name, new_rec)
+    elif method == 'UPDATE' and key is not None:
+        return resolve_update_by_key(jt_coll_name, key, old_rec, new_rec)
+    elif method == 'UPDATE':
+        return resolve_update(jt_coll_name, old_rec, new_rec)
+    elif method == 'DELETE' and key is not None:
+        return resolve_delete_by_key(jt_coll_name, key, old_rec)
+    elif method == 'DELETE':
+        return resolve_delete(jt_coll_name, old_rec)
+    return DBUtilsResult.error(f'Invalid method `{method}`')
+
+
+def apply_jt_change(jt_coll_name: str, change: ResolvedChange) -> DBUtilsResult:
+    """Make a change resolved by `resolve_jt_change` to the junction table collection"""
+    return apply_jt_changes(jt_coll_name, [change])[0]
+
+
+def apply_jt_changes(jt_coll_name: str, changes: List[ResolvedChange]) -> List[DBUtilsResult]:
+    """
+    Make the changes resolved by `resolve_jt_change` to the junction table collection,
+    all in 1 job of the db's writer (see `database.writer`), rolling back each change that
+    fails on its own, e.g. a change by key that doesn't change exactly 1 record (`CONFLICT`).
+    Return the result of each change, in the same order.
+    """
+    if not changes:
+        return []
+    jt_coll = colls[jt_coll_name]
+    change_jobs = []  # None for the changes with an invalid method
+    for change in changes:
+        method = change['method']
+        if method == 'INSERT':
+            change_jobs.append(jt_coll.insert_job(change['record']))
+        elif method == 'UPDATE':
+            change_jobs.append(jt_coll.update_job(change['filter'], change['record']))
+        elif method == 'DELETE':
+            change_jobs.append(jt_coll.delete_job(change['filter']))
+        else:
+            change_jobs.append(None)
+
+    def job(conn: JobConnection) -> List[Optional[str]]:
+        errors = []
+        for change, change_job in zip(changes, change_jobs):
+            if change_job is None:
+                errors.append(None)
+                continue
+            conn.execute('SAVEPOINT change')
+            try:
+                cursor = change_job(conn)
+                rows = change.get('rows')  # None for INSERTs and the changes by name
+                if rows is not None and cursor.rowcount != rows:  # changed since it was resolved
+                    conn.execute('ROLLBACK TO change')
+                    errors.append(CONFLICT)
+                else:
+                    errors.append(None)
+            except sqlite3.IntegrityError as err:
+                conn.execute('ROLLBACK TO change')
+                errors.append(str(err))
+            conn.execute('RELEASE change')
+        return errors
+    errors = jt_coll.write(job)
+
+    results = []
+    for change, change_job, err in zip(changes, change_jobs, errors):
+        method = change['method']
+        if change_job is None:
+            results.append(DBUtilsResult.error(f'Invalid method `{method}`'))
+        elif err is not None:
+            logger.warning(
+                'Failed to apply %s to %s: %s', method, jt_coll_name, err,
+                extra={'filter': change['filter'], 'record': change['record']})
+            results.append(DBUtilsResult.error(err))
+        else:
+            logger.info(
+                'Applied %s to %s', method, jt_coll_name,
+                extra={'filter': change['filter'], 'record': change['record']})
+            results.append(DBUtilsResult.success())
+    return results
+
+
+def edit_jt_coll(jt_coll_name: str, record_deltas: List[dict]) -> List[DBUtilsResult]:
+    """
+    Apply each change in `record_deltas` to the junction table collection specified
+    by `jt_coll_name` (see `resolve_jt_change` for the format of each change).
+    The changes resolved are all made together (see `apply_jt_changes`).
+    Return the result of each change, in the same order.
+    """
+    results = [resolve_jt_change(jt_coll_name, rec_delta) for rec_delta in record_deltas]
+    resolved = [idx for idx, res in enumerate(results) if res.is_ok]
+    applied = apply_jt_changes(jt_coll_name, [results[idx].change for idx in resolved])
+    for idx, res in zip(resolved, applied):
+        results[idx] = res
+    return results
@@ -0,0 +1,86 @@
+"""
+Migrations of the schema of existing dbs, so that they match `schema`.
+
+The version of a db's schema is kept in its `PRAGMA user_version`, which is the number
+of migrations applied to it. New dbs are created with the latest schema, so they start at
+the latest version (see `database.init_schema`).
+
+To change the schema, change the SQL in `schema` and append the migration
+which brings an existing db up to date to `MIGRATIONS`.
+"""
+
+import sqlite3
+from typing import List
+
+
+MIGRATIONS: List[str] = [
+    # 1: dates in Activity as YYYYMMDD integers (ending on their start date if they have no
+    # end date), Student_activity.hours as a number
+    # SQLite can't change the type of a column, so both tables are copied into new tables
+    """
+    CREATE TABLE Activity_v1(
+        id INTEGER,
+        start_date INTEGER,
+        end_date INTEGER,
+        desc TEXT,
+        PRIMARY KEY(id)
+    );
+    INSERT INTO Activity_v1 (id, start_date, end_date, desc)
+        SELECT
+            id,
+            CAST(REPLACE(NULLIF(start_date, ''), '-', '') AS INTEGER),
+            CAST(REPLACE(COALESCE(NULLIF(end_date, ''), NULLIF(start_date, '')), '-', '') AS INTEGER),
+            desc
+        FROM Activity;
+    DROP TABLE Activity;
+    ALTER TABLE Activity_v1 RENAME TO Activity;
+    CREATE INDEX IF NOT EXISTS Activity_dates ON Activity(end_date, start_date);
+
+    CREATE TABLE Student_activity_v1(
+        student_id INTEGER,
+        activity_id INTEGER,
+        category TEXT,
+        role TEXT,
+        award TEXT,
+        hours NUMERIC,
+        PRIMARY KEY(student_id, activity_id),
+        FOREIGN KEY(student_id) REFERENCES Student(id),
+        FOREIGN KEY(activity_id) REFERENCES Activity(id)
+    );
+    INSERT INTO Student_activity_v1 (student_id, activity_id, category, role, award, hours)
+        SELECT student_id, activity_id, category, role, award, CAST(NULLIF(hours, '') AS NUMERIC)
+        FROM Student_activity;
+    DROP TABLE Student_activity;
+    ALTER TABLE Student_activity_v1 RENAME TO Student_activity;
+    """,
+]
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def set_version(conn: sqlite3.Connection, version: int) -> None:
+    conn.execute(f'PRAGMA user_version = {int(version)}')
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Apply the migrations the db connected to by `conn` hasn't had yet, in order.
+    Each migration is applied in its own transaction together with its version,
+    so a failed migration leaves the db at the previous version.
+
+    Return
+    - the number of migrations applied
+    """
+    version = get_version(conn)
+    for idx in range(version, LATEST_VERSION):
+        try:
+            conn.executescript(
+                f'BEGIN;\n{MIGRATIONS[idx]}\nPRAGMA user_version = {idx + 1};\nCOMMIT;')
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+    return max(LATEST_VERSION - version, 0)
@@ -0,0 +1,89 @@
+"""
+Short-lived server-side store of pending changes, e.g. an edit that has been validated
+and resolved on the confirm page, waiting for the user to save it.
+
+Each pending change is stored in the db under a random token, which is all the client
+has to send back to make the change. Pending changes are kept in the db (not in memory)
+so that every worker process serving the app sees the same changes, and expire after
+`TTL` seconds.
+```
+token = pending_changes.put('membership', {'changes': [...]})
+...
+payload = pending_changes.pop('membership', token)  # None if expired or already popped
+```
+"""
+
+import json
+import secrets
+import time
+from typing import Any, Optional
+from . import schema as s
+from . import writer
+from .connection import connect
+from .writer import JobConnection
+
+
+TTL = 15 * 60  # seconds before a pending change expires
+
+
+class PendingChanges:
+    """Pending changes stored in the `Pending_change` table of the db at `db_path`"""
+
+    def __init__(self, db_path: str, ttl: float = TTL) -> None:
+        self.db_path = db_path
+        self.ttl = ttl
+
+    def create_table(self) -> None:
+        with connect(self.db_path) as conn:
+            conn.execute(s.pending_change_sql)
+        conn.close()
+
+    def put(self, kind: str, payload: Any) -> str:
+        """
+        Store the `payload` (JSON serializable) of a pending change of `kind`
+        (e.g. the collection changed), clearing out expired changes.
+
+        Return
+        - the token to `pop` the pending change with
+        """
+        token = secrets.token_urlsafe(16)
+        now = time.time()
+        payload = json.dumps(payload)
+
+        def job(conn: JobConnection) -> None:
+            conn.execute('DELETE FROM Pending_change WHERE expires < ?', (now,))
+            conn.execute(
+                'INSERT INTO Pending_change (token, kind, payload, expires) VALUES (?, ?, ?, ?)',
+                (token, kind, payload, now + self.ttl)
+            )
+        writer.get(self.db_path).submit(job)
+        return token
+
+    def pop(self, kind: str, token: Optional[str]) -> Optional[Any]:
+        """
+        Remove the pending change of `kind` stored under `token` and return its payload.
+        Each pending change can only be popped once, even by concurrent requests.
+
+        Return
+        - the payload, or None if there is no such pending change or it has expired
+        """
+        if not token:
+            return None
+
+        def job(conn: JobConnection) -> Optional[tuple]:
+            # in the writer's transaction, so nobody else can pop it in between
+            row = conn.execute(
+                'SELECT payload, expires FROM Pending_change WHERE token = ? AND kind = ?',
+                (token, kind)
+            ).fetchone()
+            if row is not None:
+                conn.execute('DELETE FROM Pending_change WHERE token = ?', (token,))
+            return row
+        row = writer.get(self.db_path).submit(job)
+
+        if row is None:
+            return None
+        payload, expires = row
+        if expires < time.time():
+            return None
+        return json.loads(payload)
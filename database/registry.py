@@ -0,0 +1,37 @@
+"""
+Registry of the collections used to interface with the db.
+"""
+
+from typing import Dict, Iterator, Mapping, Type
+from .storage import Collection
+
+
+class CollectionRegistry(Mapping):
+    """
+    Read-only mapping of collection names to `Collection`s interfacing with the db
+    specified by `db_path`. Each `Collection` is only created on first access.
+
+    Creating a `Collection` does not touch the db, so the tables must be created
+    beforehand (see `database.init_schema()`).
+    """
+
+    def __init__(self, db_path: str, collection_types: Mapping[str, Type[Collection]]) -> None:
+        self.db_path = db_path
+        self.__collection_types = collection_types
+        self.__colls: Dict[str, Collection] = {}
+
+    def __getitem__(self, name: str) -> Collection:
+        coll = self.__colls.get(name)
+        if coll is None:
+            coll = self.__collection_types[name](self.db_path)
+            self.__colls[name] = coll
+        return coll
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__collection_types)
+
+    def __len__(self) -> int:
+        return len(self.__collection_types)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(db_path="{self.db_path}")'
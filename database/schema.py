@@ -21,14 +21,19 @@ club_sql = """CREATE TABLE IF NOT EXISTS Club(
                     PRIMARY KEY(id)
                     )"""
 
+# dates are stored as YYYYMMDD integers (see `data.Date.to_db`), so they sort and compare as dates
 activity_sql = """CREATE TABLE IF NOT EXISTS Activity(
                     id INTEGER,
-                    start_date TEXT,
-                    end_date TEXT,
+                    start_date INTEGER,
+                    end_date INTEGER,
                     desc TEXT,
                     PRIMARY KEY(id)
                     )"""
 
+# for finding the activities active on/between dates (see `Activities.active_between_sql`)
+activity_dates_index_sql = """CREATE INDEX IF NOT EXISTS Activity_dates
+                    ON Activity(end_date, start_date)"""
+
 class_sql = """CREATE TABLE IF NOT EXISTS Class(
                     id INTEGER,
                     class_name TEXT,
@@ -59,8 +64,17 @@ student_activity_sql = """CREATE TABLE IF NOT EXISTS Student_activity(
                     category TEXT,
                     role TEXT,
                     award TEXT,
-                    hours TEXT,
+                    hours NUMERIC,
                     PRIMARY KEY(student_id, activity_id),
                     FOREIGN KEY(student_id) REFERENCES Student(id),
                     FOREIGN KEY(activity_id) REFERENCES Activity(id)
-                    )"""
\ No newline at end of file
+                    )"""
+
+# changes waiting to be confirmed (see `database.pending`), not a collection
+pending_change_sql = """CREATE TABLE IF NOT EXISTS Pending_change(
+                    token TEXT,
+                    kind TEXT,
+                    payload TEXT,
+                    expires REAL,
+                    PRIMARY KEY(token)
+                    )"""
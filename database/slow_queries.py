@@ -0,0 +1,193 @@
+"""
+Log of the slow queries made by the collections (see `storage.query_hooks`).
+
+Every query taking at least `threshold` seconds is kept in a ring buffer of the last
+`maxlen` slow queries, with its SQL normalized (whitespace collapsed, lists of `?` shortened),
+the shape of its parameters (e.g. `(str, int x 400)`), how long it took, the number of rows
+it returned, and its `EXPLAIN QUERY PLAN`, where full table scans are flagged.
+```
+slow_queries = SlowQueryLog(threshold=0.1)
+storage.query_hooks.append(slow_queries.on_query)
+...
+slow_queries.offenders()  # the slow queries grouped by their normalized SQL, worst first
+```
+
+When the app is served by several worker processes (see server.py), `share()` is called
+before the workers are forked, and each worker saves its slow queries to a file in the shared
+directory whenever it logs one, so that `entries()` in any worker returns those of all of them.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, TypedDict
+from .connection import connect
+
+
+THRESHOLD = 0.1  # seconds
+MAXLEN = 500  # slow queries kept in the ring buffer of each process
+
+
+class SlowQuery(TypedDict):
+    sql: str  # normalized
+    params: str  # shape of the parameters, e.g. (str, int x 400)
+    seconds: float
+    rows: int
+    plan: List[str]  # the lines of the query plan, indented by depth
+    full_scan: bool  # whether the plan scans any table without an index
+    table: str  # of the collection that made the query
+    at: float  # time.time() when it finished
+
+
+class Offender(TypedDict):
+    sql: str
+    table: str
+    count: int
+    total_seconds: float
+    max_seconds: float
+    max_rows: int
+    params: List[str]
+    plan: List[str]  # of the latest occurrence
+    full_scan: bool
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalize `sql` so the same query made with a different number of values
+    (e.g. `IN (?, ?, ?)` or `VALUES (?, ?), (?, ?)`) is the same
+    """
+    sql = ' '.join(sql.split())
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?, ...)', sql)
+    sql = re.sub(r'\(\?, \.\.\.\)(?:\s*,\s*\(\?, \.\.\.\))+', '(?, ...), ...', sql)
+    return sql
+
+
+def param_shape(values: Sequence[Any]) -> str:
+    """Return the types of the parameters `values`, with runs of the same type counted"""
+    runs: List[List[Any]] = []
+    for value in values:
+        name = type(value).__name__
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return '(' + ', '.join(name if count == 1 else f'{name} x {count}' for name, count in runs) + ')'
+
+
+def explain(db_path: str, sql: str, values: Sequence[Any]) -> List[str]:
+    """Return the lines of the `EXPLAIN QUERY PLAN` of `sql` with `values`, indented by depth"""
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', values).fetchall()
+    except sqlite3.Error as err:
+        return [f'(no query plan: {err})']
+    finally:
+        conn.close()
+
+    depths = {0: -1}
+    lines = []
+    for node_id, parent_id, _, detail in rows:
+        depth = depths.get(parent_id, -1) + 1
+        depths[node_id] = depth
+        lines.append('  ' * depth + detail)
+    return lines
+
+
+def is_full_scan(plan: List[str]) -> bool:
+    """Whether the `plan` scans a table without an index (e.g. `SCAN Student`)"""
+    return any(
+        line.strip().startswith('SCAN ') and ' USING ' not in line and 'CONSTANT ROW' not in line
+        for line in plan
+    )
+
+
+class SlowQueryLog:
+    """Ring buffer of the last `maxlen` queries taking at least `threshold` seconds"""
+
+    def __init__(self, threshold: float = THRESHOLD, maxlen: int = MAXLEN) -> None:
+        self.threshold = threshold
+        self.__lock = threading.Lock()
+        self.__entries: Deque[SlowQuery] = deque(maxlen=maxlen)
+        self.__shared_dir: Optional[str] = None
+
+    def share(self, directory: str) -> None:
+        """
+        Save the slow queries of each process into `directory`, for `entries()` to combine.
+        Must be called before forking the processes.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.__shared_dir = directory
+
+    def on_query(self, coll: Any, sql: str, values: Sequence[Any], seconds: float, rows: int) -> None:
+        """Log the query if it is slow (see `storage.query_hooks`)"""
+        if seconds < self.threshold:
+            return
+        plan = explain(coll.db_path, sql, values)
+        entry: SlowQuery = {
+            'sql': normalize_sql(sql),
+            'params': param_shape(values),
+            'seconds': seconds,
+            'rows': rows,
+            'plan': plan,
+            'full_scan': is_full_scan(plan),
+            'table': coll.table_name,
+            'at': time.time(),
+        }
+        with self.__lock:
+            self.__entries.append(entry)
+            if self.__shared_dir is not None:
+                self.__save()
+
+    def __save(self) -> None:
+        path = os.path.join(self.__shared_dir, f'{os.getpid()}.json')
+        with open(path + '.part', 'w', encoding='utf-8') as f:
+            json.dump(list(self.__entries), f)
+        os.replace(path + '.part', path)
+
+    def entries(self) -> List[SlowQuery]:
+        """Return the slow queries logged (by every process, see `share`), oldest first"""
+        if self.__shared_dir is None:
+            with self.__lock:
+                return list(self.__entries)
+
+        entries = []
+        for name in os.listdir(self.__shared_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.__shared_dir, name), encoding='utf-8') as f:
+                    entries += json.load(f)
+            except (OSError, ValueError):  # e.g. being replaced
+                continue
+        return sorted(entries, key=lambda entry: entry['at'])
+
+    def offenders(self) -> List[Offender]:
+        """Return the slow queries grouped by their normalized SQL, taking the most time first"""
+        offenders: Dict[str, Offender] = {}
+        for entry in self.entries():
+            offender = offenders.get(entry['sql'])
+            if offender is None:
+                offender = offenders[entry['sql']] = {
+                    'sql': entry['sql'],
+                    'table': entry['table'],
+                    'count': 0,
+                    'total_seconds': 0.0,
+                    'max_seconds': 0.0,
+                    'max_rows': 0,
+                    'params': [],
+                    'plan': [],
+                    'full_scan': False,
+                }
+            offender['count'] += 1
+            offender['total_seconds'] += entry['seconds']
+            offender['max_seconds'] = max(offender['max_seconds'], entry['seconds'])
+            offender['max_rows'] = max(offender['max_rows'], entry['rows'])
+            if entry['params'] not in offender['params']:
+                offender['params'].append(entry['params'])
+            offender['plan'] = entry['plan']
+            offender['full_scan'] = entry['full_scan']
+        return sorted(offenders.values(), key=lambda offender: -offender['total_seconds'])
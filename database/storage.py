@@ -3,8 +3,96 @@ Storage classes to interface with the db.
 """
 
 import sqlite3
-from typing import List
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
 from . import schema as s
+from .connection import connect
+from . import versions
+from . import writer
+from .writer import Job, JobConnection
+
+
+# functions called after every query made by a `Collection`, with
+# (collection, sql, values, seconds taken, number of rows returned), e.g. to collect metrics
+QueryHook = Callable[['Collection', str, Sequence, float, int], None]
+query_hooks: List[QueryHook] = []
+
+
+class Record(Mapping):
+    """
+    A row found in the db, which works like a dict of column names to values
+    e.g. `record['student_name']`, `record.get('role')`, `dict(record)`
+
+    Only the row's values are stored in each Record. The `index` of column names
+    to positions in the values is shared by all the rows found by the same query.
+    Like `sqlite3.Row`, duplicate column names (e.g. `id` in JOINs) refer to
+    the first column with that name.
+    """
+
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index: Dict[str, int], values: Sequence[Any]) -> None:
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key: str) -> Any:
+        return self._values[self._index[key]]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        """Change the value of an existing column. The values are only copied on the 1st change."""
+        if not isinstance(self._values, list):
+            self._values = list(self._values)
+        self._values[self._index[key]] = value
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        idx = self._index.get(key)
+        if idx is None:
+            return default
+        return self._values[idx]
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+def _qualified(*tables: Tuple[str, List[str]]) -> Dict[str, str]:
+    """
+    Return {column name: Table.column} of the columns of the `tables` ((table name, column names))
+    JOIN-ed in that order. A name in several tables is that of the first, as in the records found.
+    """
+    qualified = {}
+    for table_name, column_names in tables:
+        for name in column_names:
+            qualified.setdefault(name, f'{table_name}.{name}')
+    return qualified
+
+
+def _ending_on_start(record: dict) -> dict:
+    """
+    Return the activity `record` with its start date as its end date if it has none,
+    so the end date of every activity can be searched (see `Activities.active_between_sql`)
+    """
+    if record.get('end_date', '') in ('', None) and record.get('start_date') not in ('', None):
+        return {**record, 'end_date': record['start_date']}
+    return record
+
+
+def _records(cursor: sqlite3.Cursor, rows: List[tuple]) -> List[Record]:
+    """Wrap each of the `rows` found with `cursor` in a Record, all sharing the same column names"""
+    if rows == []:
+        return []
+    index = {}
+    for idx, column in enumerate(cursor.description):
+        index.setdefault(column[0], idx)
+    return [Record(index, row) for row in rows]
 
 
 class Collection:
@@ -22,52 +110,154 @@ class Collection:
     table_name: str
     - The name of the table
 
+    schema_sql: str
+    - The `CREATE TABLE IF NOT EXISTS` statement for the table (see `create_table`)
+
+    index_sql: Tuple[str]
+    - The `CREATE INDEX IF NOT EXISTS` statements for the indexes on the table
+
+    tables: Tuple[str]
+    - The names of the tables read by `find` (e.g. the tables JOIN-ed with the table)
+
+    from_sql: str
+    - The FROM part of the SELECT statement used by `find` (e.g. the table JOIN-ed with others)
+
+    found_column_names: List[str]
+    - The names of the columns in the records found by `find`
+
+    key_sql: Tuple[str]
+    - SQL expressions that uniquely identify each record found by `find` (see `find_page`)
+
+    qualified_columns: Dict[str, str]
+    - The found column names, qualified with their table (e.g. `id` -> `Student.id`), for filters
+
     Methods
     -------
+    create_table() -> None
+    - Creates the table if it doesn't exist yet
+
+    data_versions() -> Tuple[int]
+    - Returns the data versions of `tables`, which change whenever they are written to
+
     insert(record: dict) -> None
     - Inserts a record into the table
 
     find(filter: dict) -> dict
     - Returns the records matching the filter in the table
 
+    find_sql(filter: dict) -> Tuple[str, list]
+    - Returns the SELECT statement used by `find`, and its values
+
+    find_page(filter: dict, after: Sequence, limit: int) -> Tuple[List[Record], Optional[list]]
+    - Returns a page of the records matching the filter in the table, starting after the key `after`
+
+    find_keyed(filter: dict) -> Tuple[List[tuple], List[Record]]
+    - Returns the keys of the records matching the filter in the table, and the records
+
+    find_by_keys(keys: Iterable[Sequence]) -> Dict[tuple, Record]
+    - Returns the records with each of the keys
+
     update(filter: dict, new_record: dict) -> None
     - Update the old record(s) matching `filter` to the `new_record` in the table
 
     delete(filter: dict) -> None
     - Deletes all records matching `filter` from the table
+
+    write(job: Job) -> Any
+    - Makes the writes of `job` with the writer of the db (see `database.writer`)
+
+    insert_job(record: dict) -> Job, update_job(filter: dict, new_record: dict) -> Job,
+    delete_job(filter: dict) -> Job
+    - Return the jobs of `insert`, `update` and `delete`, e.g. to make several in 1 job
     """
 
     column_names: List[str] = NotImplemented
     table_name: str = NotImplemented
+    schema_sql: str = NotImplemented
+    index_sql: Tuple[str, ...] = ()
+    keys_per_query = 200  # keep the number of ? in each query of `find_by_keys` small
 
     def __init__(self, db_path: str) -> None:
-        """Initialise a Collection which interfaces with the db specified by `db_path`"""
+        """
+        Initialise a Collection which interfaces with the db specified by `db_path`.
+        Does not touch the db, the table must be created beforehand (see `create_table`).
+        """
         self.db_path = db_path
 
+    @property
+    def tables(self) -> Tuple[str, ...]:
+        return (self.table_name,)
+
+    @property
+    def from_sql(self) -> str:
+        return self.table_name
+
+    @property
+    def found_column_names(self) -> List[str]:
+        return self.column_names
+
+    @property
+    def key_sql(self) -> Tuple[str, ...]:
+        return (f'{self.table_name}.id',)
+
+    @property
+    def qualified_columns(self) -> Dict[str, str]:
+        return _qualified((self.table_name, self.column_names))
+
+    def create_table(self) -> None:
+        """Create the table (and its indexes) in the db if it doesn't exist yet"""
+        self.execute(self.schema_sql, ())
+        for sql in self.index_sql:
+            self.execute(sql, ())
+
+    def data_versions(self) -> Tuple[int, ...]:
+        """
+        Return the data versions of the tables read by `find` (see `database.versions`).
+        Records found are unchanged for as long as the data versions stay the same.
+        """
+        return versions.get(self.tables)
+
     def check_column(self, to_check: dict) -> None:
         # Check that filter keys are valid column names
         for key in to_check:
             if key not in self.column_names:
                 raise KeyError(f"{key} is not a valid column name")
 
-    def execute(self, sql: str, values: list) -> List[dict]:  # execute sql
-        with sqlite3.connect(self.db_path) as conn:
-            # make returned stuff from c.fetch a dict instead of tuple
-            conn.row_factory = sqlite3.Row
+    def execute(self, sql: str, values: list) -> List[Record]:  # execute sql
+        start = time.perf_counter()
+        with connect(self.db_path) as conn:
             c = conn.cursor()
             c.execute(sql, values)
             results = c.fetchall()
             conn.commit()
             # conn.close() is automatic
 
-            # results is empty (e.g. if doing SELECT ... and nothing found, [] returned)
-            if results == []:
-                return []
-            else:  # not empty, something returned
-                actually_dict = []  # initialise list of dicts
-                for record in results:  # convert each sqlite3.Row in the results to a dict
-                    actually_dict.append(dict(record))
-                return actually_dict
+            if query_hooks:
+                seconds = time.perf_counter() - start
+                for hook in query_hooks:
+                    hook(self, sql, values, seconds, len(results))
+
+            # each row wrapped in a Record ([] if e.g. doing SELECT ... and nothing found)
+            return _records(c, results)
+
+    def write(self, job: Job) -> Any:
+        """
+        Make the writes of `job` (called with the writer's connection) with the writer of
+        the db (see `database.writer`), which commits them with the writes of any other jobs
+        submitted at the same time. Bumps the version of the table once they are committed.
+
+        Return
+        - the value returned by `job`, or raise the error it raised (after rolling it back)
+        """
+        executed = []
+        try:
+            result = writer.get(self.db_path).submit(job, executed)
+        finally:
+            for sql, values, seconds, rows in executed:  # in this thread, e.g. for the request's metrics
+                for hook in query_hooks:
+                    hook(self, sql, values, seconds, rows)
+        versions.bump(self.table_name)
+        return result
 
     def insert(self, record: dict) -> None:
         """
@@ -88,13 +278,13 @@ class Collection:
         ```
         are both accepted as the id for table `club` is AUTOINCREMENT-ed
         """
+        self.write(self.insert_job(record))
 
-        self.check_column(record)
+    def insert_job(self, record: dict) -> Job:
+        """Return the job inserting `record` into the db (see `insert`)"""
 
-        # to check if the record alr exists
-        existing_records = self.find(record)
-        if len(existing_records) > 0:  # integrity error as records must be unique
-            raise sqlite3.IntegrityError(f'Record {record} already exists as {existing_records}')
+        self.check_column(record)
+        find_sql, find_values = self.find_sql(record)
 
         q_marks = ''
         columns = []
@@ -106,19 +296,31 @@ class Collection:
         q_marks = q_marks[:-2]
 
         columns = ', '.join(columns)
-        self.execute(
-            f"""INSERT INTO {self.table_name} ({columns})
-            VALUES ({q_marks})""", values)
-
-    def find(self, filter: dict) -> List[dict]:
+        insert_sql = f"""INSERT INTO {self.table_name} ({columns})
+            VALUES ({q_marks})"""
+
+        def job(conn: JobConnection) -> None:
+            # to check if the record alr exists, in the same transaction as the INSERT
+            cursor = conn.execute(find_sql, find_values)
+            existing_records = _records(cursor, cursor.fetchall())
+            if len(existing_records) > 0:  # integrity error as records must be unique
+                raise sqlite3.IntegrityError(f'Record {record} already exists as {existing_records}')
+            conn.execute(insert_sql, values)
+        return job
+
+    def find(self, filter: dict) -> List[Record]:
         """
         Return all rows matching the `filter` specifications.
-        Return all columns from each record in the format
+        Return all columns from each record as a `Record` (works like a dict) in the format
         {
             'column_1': ...,
             'column_2': ...,
         }
         """
+        return self.execute(*self.find_sql(filter))
+
+    def find_sql(self, filter: dict) -> Tuple[str, list]:
+        """Return the SELECT statement of `find(filter)`, and its values"""
 
         # Check that filter keys are valid column names
         self.check_column(filter)
@@ -132,18 +334,133 @@ class Collection:
         sql = sql[:-4]  # remove the final AND
 
         find_sql = f"""SELECT *
-                  FROM {self.table_name}
+                  FROM {self.from_sql}
                   """
 
         if sql != '':
             find_sql += f'WHERE {sql};'
 
-        return self.execute(find_sql, list(values))
+        return find_sql, list(values)
+
+    def find_page(
+        self,
+        filter: dict,
+        after: Optional[Sequence] = None,
+        limit: int = 100,
+    ) -> Tuple[List[Record], Optional[list]]:
+        """
+        Return a page of at most `limit` rows matching the `filter` specifications (see `find`),
+        ordered by their keys (see `key_sql`), and starting after the row with the key `after`
+        (or from the first row if `after` is None).
+
+        The rows before `after` are skipped using the keys instead of an OFFSET,
+        so every page is found just as fast no matter how far in it is.
+
+        Return
+        - (rows, key of the last row), or (rows, None) if it is the last page
+        """
+
+        conditions, values = self.__filter_conditions(filter)
+
+        keys = ', '.join(self.key_sql)
+        if after is not None:
+            if len(after) != len(self.key_sql):
+                raise ValueError(f'Invalid key {after}')
+            q_marks = ', '.join('?' * len(after))
+            conditions.append(f'({keys}) > ({q_marks})')
+            values.extend(after)
+
+        # 1 more row to know if there is a next page
+        row_keys, rows = self.__select_keyed(conditions, values, f'ORDER BY {keys} LIMIT {int(limit) + 1}')
+        if len(rows) <= limit:  # last page
+            return rows, None
+        return rows[:limit], list(row_keys[limit - 1])
+
+    def find_keyed(self, filter: dict) -> Tuple[List[tuple], List[Record]]:
+        """
+        Return the rows matching the `filter` specifications (see `find`),
+        and the key (see `key_sql`) of each row, e.g. to change the rows by their keys later.
+
+        Return
+        - (keys, rows)
+        """
+        conditions, values = self.__filter_conditions(filter)
+        return self.__select_keyed(conditions, values)
+
+    def find_by_keys(self, keys: Iterable[Sequence]) -> Dict[tuple, Record]:
+        """
+        Return the rows with each of the `keys` (see `key_sql`), in the format
+        `{key (tuple): row}`. Keys without a row are left out.
+        """
+        keys = [tuple(key) for key in keys]
+        for key in keys:
+            if len(key) != len(self.key_sql):
+                raise ValueError(f'Invalid key {list(key)}')
+
+        found = {}
+        # (a = ? AND b = ?) OR ..., which (unlike `(a, b) IN (VALUES ...)`)
+        # SQLite always looks up in the index on the key
+        key_condition = '(' + ' AND '.join(f'{sql} = ?' for sql in self.key_sql) + ')'
+        for start in range(0, len(keys), self.keys_per_query):
+            chunk = keys[start:start + self.keys_per_query]
+            condition = '(' + ' OR '.join([key_condition] * len(chunk)) + ')'
+            values = [value for key in chunk for value in key]
+            row_keys, rows = self.__select_keyed([condition], values)
+            found.update(zip(row_keys, rows))
+        return found
+
+    def __filter_conditions(self, filter: dict) -> Tuple[List[str], list]:
+        for key in filter:  # check column names
+            if key not in self.found_column_names:
+                raise KeyError(f'Invalid key {key}')
+        # qualified, as the tables JOIN-ed have columns of the same name (e.g. id)
+        qualified = self.qualified_columns
+        return [f'{qualified[key]} = ?' for key in filter], list(filter.values())
+
+    def __select_keyed(
+        self,
+        conditions: List[str],
+        values: list,
+        suffix_sql: str = '',
+    ) -> Tuple[List[tuple], List[Record]]:
+        """
+        SELECT the keys (see `key_sql`) and all the columns of the rows matching all the
+        `conditions`, followed by `suffix_sql` (e.g. ORDER BY)
+
+        Return
+        - (keys, rows), leaving the keys out of the rows
+        """
+        key_columns = ', '.join(f'{sql} AS _key_{i}' for i, sql in enumerate(self.key_sql))
+        select_sql = f"""SELECT {key_columns}, *
+                  FROM {self.from_sql}
+                  """
+        if conditions:
+            select_sql += f'WHERE {" AND ".join(conditions)} '
+        select_sql += f'{suffix_sql};'
+
+        rows = self.execute(select_sql, values)
+        if len(rows) == 0:
+            return [], rows
+
+        # the keys are the first columns, leave them out of the rows
+        key_count = len(self.key_sql)
+        index = {
+            name: idx for name, idx in rows[0]._index.items()  # pylint: disable=protected-access
+            if idx >= key_count
+        }
+        # pylint: disable=protected-access
+        keys = [tuple(row._values[:key_count]) for row in rows]
+        rows = [Record(index, row._values) for row in rows]
+        return keys, rows
 
     def update(self, filter: dict, new_record: dict) -> None:
         """
         Update the old record(s) specified by `filter` with the `new_record`.
         """
+        self.write(self.update_job(filter, new_record))
+
+    def update_job(self, filter: dict, new_record: dict) -> Job:
+        """Return the job updating the record(s) matching `filter` in the db (see `update`)"""
 
         #check the columns in both filter and new_record
         self.check_column(filter)
@@ -173,12 +490,17 @@ class Collection:
                   SET {new_sql}
                   WHERE {sql} """
 
-        return self.execute(sql, list(both))
+        both = list(both)
+        return lambda conn: conn.execute(sql, both)
 
     def delete(self, filter: dict) -> None:
         """
         Delete the records from the table matching the `filter`.
         """
+        self.write(self.delete_job(filter))
+
+    def delete_job(self, filter: dict) -> Job:
+        """Return the job deleting the records matching `filter` from the db (see `delete`)"""
 
         #check that keys in filter match the column names
         self.check_column(filter)
@@ -191,57 +513,87 @@ class Collection:
             sql += f"{condition} = ? AND "
         sql = sql[:-5]  # remove the final AND
 
-        self.execute(
-            f"""DELETE FROM {self.table_name} WHERE {sql}""", list(values))
+        sql = f"""DELETE FROM {self.table_name} WHERE {sql}"""
+        values = list(values)
+        return lambda conn: conn.execute(sql, values)
 
 
 class Students(Collection):
     table_name = 'Student'
+    schema_sql = s.student_sql
     column_names = ['id', 'student_name', 'age',
                     'year_enrolled', 'graduating_year', 'class_id']
-    # super.__init__(db_path)
-    # self.execute(s.student_sql, ())
-
-    def __init__(self, db_path):
-        super().__init__(db_path)
-        self.execute(s.student_sql, ())
 
 
 class Subjects(Collection):
     table_name = 'Subject'
+    schema_sql = s.subject_sql
     column_names = ['id', 'subject_name', 'subject_level']
 
-    def __init__(self, db_path):
-        super().__init__(db_path)
-        self.execute(s.subject_sql, ())
-
 
 class Clubs(Collection):
     table_name = 'Club'
+    schema_sql = s.club_sql
     column_names = ['id', 'club_name']
 
-    def __init__(self, db_path):
-        super().__init__(db_path)
-        self.execute(s.club_sql, ())
-
 
 class Activities(Collection):
+    """
+    Activities, with their dates stored as YYYYMMDD integers (e.g. 20220413 for 2022-04-13,
+    see `data.Date`). An activity without an end date only lasts for its `start_date`, and is
+    stored with it as its `end_date` too, so that every activity's dates can be searched.
+    """
+
     table_name = 'Activity'
+    schema_sql = s.activity_sql
+    index_sql = (s.activity_dates_index_sql,)
     column_names = ['id', 'start_date', 'end_date', 'desc']
 
-    def __init__(self, db_path):
-        super().__init__(db_path)
-        self.execute(s.activity_sql, ())
+    def insert_job(self, record: dict) -> Job:
+        return super().insert_job(_ending_on_start(record))
+
+    def update_job(self, filter: dict, new_record: dict) -> Job:
+        update = super().update_job(filter, _ending_on_start(new_record))
+        if new_record.get('end_date', '') not in ('', None) or 'start_date' in new_record:
+            return update
+
+        def job(conn: JobConnection) -> sqlite3.Cursor:  # ends on the start date it already has
+            cursor = update(conn)
+            conn.execute(f'UPDATE {self.table_name} SET end_date = start_date WHERE end_date IS NULL')
+            return cursor
+        return job
+
+    def find_active_on(self, date: int) -> List[Record]:
+        """Return the activities active on the `date` (YYYYMMDD), ordered by start date"""
+        return self.find_active_between(date, date)
+
+    def find_active_between(self, start: int, end: int) -> List[Record]:
+        """
+        Return the activities active on any day from the `start` date to the `end` date
+        (YYYYMMDD, inclusive), ordered by start date, e.g. all the activities in a term.
+        """
+        return self.execute(*self.active_between_sql(start, end))
+
+    def active_between_sql(self, start: int, end: int) -> Tuple[str, list]:
+        """
+        Return the SELECT statement of `find_active_between`, and its values.
+        Every activity has an end date, so it is a range search of the `Activity_dates`
+        index on (end_date, start_date), checking the start dates in the index.
+        """
+        return (
+            f"""SELECT *
+                FROM {self.table_name}
+                WHERE end_date >= ? AND start_date <= ?
+                ORDER BY start_date, end_date;""",
+            [start, end]
+        )
 
 
 class Classes(Collection):
     table_name = 'Class'
+    schema_sql = s.class_sql
     column_names = ['id', 'class_name', 'level']
 
-    def __init__(self, db_path):
-        super().__init__(db_path)
-        self.execute(s.class_sql, ())
-
 
 # ------------------------------
 # JUNCTION TABLES
@@ -252,20 +604,28 @@ class Membership(Collection):
     """Junction table for Student-Club membership many-to-many relationship"""
 
     table_name = 'Student_club'
+    schema_sql = s.student_club_sql
+    tables = ('Student', 'Student_club', 'Club')
     column_names = ['student_id', 'club_id', 'role']
     joined_column_names = [
         *Students.column_names,
         *Clubs.column_names,
         *column_names
     ]
+    found_column_names = joined_column_names
+    qualified_columns = _qualified(
+        ('Student', Students.column_names), ('Student_club', column_names), ('Club', Clubs.column_names))
+    from_sql = """Student
+                INNER JOIN Student_club
+                ON Student.id = Student_club.student_id
+                INNER JOIN Club
+                ON Club.id = Student_club.club_id"""
+    key_sql = ('Student_club.student_id', 'Student_club.club_id')
 
-    def __init__(self, db_path: str):
-        super().__init__(db_path)
-        self.execute(s.student_club_sql, ())
-
-    def find(self, filter: dict) -> dict:
+    def find_sql(self, filter: dict) -> Tuple[str, list]:
         """
-        Find all records in the membership/student-club table matching filter, returning
+        Return the SELECT statement (and its values) of `find`, which finds all records
+        in the membership/student-club table matching filter, returning
         records in student, club and student-club tables (LEFT JOIN-ed)
 
         e.g. consider the student OBAMA who is a member of WHITE HOUSE and OBAMA FOUNDATION
@@ -282,42 +642,50 @@ class Membership(Collection):
         sql = ''
 
         for condition in conditions:
-            sql += f"{condition} = ? AND "  # for the WHERE part
+            sql += f"{self.qualified_columns[condition]} = ? AND "  # for the WHERE part
         sql = sql[:-4]  # remove the final AND
 
         # execute sqlite INNER JOIN e.g.
-        join_sql = """SELECT *
-                FROM Student
-                INNER JOIN Student_club
-                ON Student.id = Student_club.student_id
-                INNER JOIN Club
-                ON Club.id = Student_club.club_id
+        join_sql = f"""SELECT *
+                FROM {self.from_sql}
                 """
 
         if sql != '':
             join_sql += f"WHERE {sql};"
 
-        return self.execute(join_sql, list(values))
+        return join_sql, list(values)
 
 
 class StudentSubject(Collection):  # not that impt
     """Junction table for Student-Subject many-to-many relationship"""
 
     table_name = 'Student_subject'
+    schema_sql = s.student_subject_sql
+    tables = ('Student', 'Class', 'Student_subject', 'Subject')
     column_names = ['student_id', 'subject_id']
     joined_column_names = [
         *Students.column_names,
         *Subjects.column_names,
         *column_names
     ]
+    found_column_names = joined_column_names
+    qualified_columns = _qualified(
+        ('Student', Students.column_names), ('Class', Classes.column_names),
+        ('Student_subject', column_names), ('Subject', Subjects.column_names))
+    from_sql = """Student
+                    LEFT JOIN Class
+                    ON Student.class_id = Class.id
+                    LEFT JOIN Student_subject
+                    ON Student.id = Student_subject.student_id
+                    LEFT JOIN Subject
+                    ON Subject.id = Student_subject.subject_id"""
+    # students without subjects have a NULL subject_id
+    key_sql = ('Student.id', 'IFNULL(Student_subject.subject_id, -1)')
 
-    def __init__(self, db_path: str):
-        super().__init__(db_path)
-        self.execute(s.student_subject_sql, ())
-
-    def find(self, filter: dict) -> dict:
+    def find_sql(self, filter: dict) -> Tuple[str, list]:
         """
-        Find all records in the student-subject table matching filter, returning
+        Return the SELECT statement (and its values) of `find`, which finds all records
+        in the student-subject table matching filter, returning
         records in student, subject and student-subject tables (INNER JOIN-ed) (see Membership)
         """
 
@@ -332,30 +700,26 @@ class StudentSubject(Collection):  # not that impt
         sql = ''
 
         for condition in conditions:
-            sql += f"{condition} = ? AND "  # for the WHERE part
+            sql += f"{self.qualified_columns[condition]} = ? AND "  # for the WHERE part
         sql = sql[:-4]  # remove the final AND
 
         # execute sqlite LEFT JOIN e.g.
-        join_sql = """SELECT *
-                    FROM Student
-                    LEFT JOIN Class
-                    ON Student.class_id = Class.id
-                    LEFT JOIN Student_subject
-                    ON Student.id = Student_subject.student_id
-                    LEFT JOIN Subject
-                    ON Subject.id = Student_subject.subject_id
+        join_sql = f"""SELECT *
+                    FROM {self.from_sql}
                     """
 
         if sql != '':
             join_sql += f'WHERE {sql}'
 
-        return self.execute(join_sql, list(values))
+        return join_sql, list(values)
 
 
 class Participation(Collection):
     """Junction table for Student-Activity participation many-to-many relationship"""
 
     table_name = 'Student_activity'
+    schema_sql = s.student_activity_sql
+    tables = ('Student', 'Student_activity', 'Activity')
     column_names = ['student_id', 'activity_id',
                     'category', 'role', 'award', 'hours']
     joined_column_names = [
@@ -363,14 +727,21 @@ class Participation(Collection):
         *Activities.column_names,
         *column_names
     ]
+    found_column_names = joined_column_names
+    qualified_columns = _qualified(
+        ('Student', Students.column_names), ('Student_activity', column_names),
+        ('Activity', Activities.column_names))
+    from_sql = """Student
+                    INNER JOIN Student_activity
+                    ON Student.id = Student_activity.student_id
+                    INNER JOIN Activity
+                    ON Activity.id = Student_activity.activity_id"""
+    key_sql = ('Student_activity.student_id', 'Student_activity.activity_id')
 
-    def __init__(self, db_path: str):
-        super().__init__(db_path)
-        self.execute(s.student_activity_sql, ())
-
-    def find(self, filter: dict) -> dict:
+    def find_sql(self, filter: dict) -> Tuple[str, list]:
         """
-        Find all records in the student-subject table matching filter, returning
+        Return the SELECT statement (and its values) of `find`, which finds all records
+        in the student-subject table matching filter, returning
         records in student, subject and student-subject tables (INNER JOIN-ed) (see Membership)
         """
 
@@ -385,19 +756,15 @@ class Participation(Collection):
         sql = ''
 
         for condition in conditions:
-            sql += f"{condition} = ? AND "  # for the WHERE part
+            sql += f"{self.qualified_columns[condition]} = ? AND "  # for the WHERE part
         sql = sql[:-4]  # remove the final AND
 
         # execute sqlite INNER JOIN e.g.
-        join_sql = """SELECT *
-                    FROM Student
-                    INNER JOIN Student_activity
-                    ON Student.id = Student_activity.student_id
-                    INNER JOIN Activity
-                    ON Activity.id = Student_activity.activity_id
+        join_sql = f"""SELECT *
+                    FROM {self.from_sql}
                     """
 
         if sql != '':
             join_sql += f'WHERE {sql};'
 
-        return self.execute(join_sql, list(values))
+        return join_sql, list(values)
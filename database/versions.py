@@ -0,0 +1,73 @@
+"""
+Data version counters for the tables in the db.
+
+The version of a table is bumped on every write to it through a `Collection`, so
+anything read (or rendered) from a set of tables can be tagged with their versions,
+and is stale once any of the versions change.
+
+The versions are kept in this process by default. When the app is served by several
+worker processes (see server.py), the versions of the tables are moved into shared memory
+with `share()` before the workers are forked, so that a write in 1 worker makes what
+every other worker read from the table stale too.
+"""
+
+import multiprocessing
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+# identifies this run of the app, as the versions restart from 0 whenever it is restarted
+# (inherited by forked workers, which share the versions)
+epoch = os.urandom(8).hex()
+
+__lock = threading.Lock()
+__versions: Dict[str, int] = defaultdict(int)
+
+# {table name: index of its version in __shared_versions}, once shared
+__shared_index: Dict[str, int] = {}
+__shared_versions: Optional[Any] = None  # synchronized array of unsigned 64-bit ints
+
+
+def share(table_names: Iterable[str]) -> None:
+    """
+    Keep the versions of the tables in `table_names` in shared memory, starting from their
+    current versions. Must be called before forking the processes to share them with.
+    """
+    global __shared_versions
+    table_names = list(dict.fromkeys(table_names))
+    shared_versions = multiprocessing.Array('Q', [__versions[name] for name in table_names])
+    __shared_index.clear()
+    __shared_index.update((name, idx) for idx, name in enumerate(table_names))
+    __shared_versions = shared_versions
+
+
+def bump(table_name: str) -> None:
+    """Bump the version of the table `table_name` after it is written to"""
+    idx = __shared_index.get(table_name)
+    if idx is not None:
+        with __shared_versions.get_lock():
+            __shared_versions[idx] += 1
+        return
+    with __lock:
+        __versions[table_name] += 1
+
+
+def get(table_names: Iterable[str]) -> Tuple[int, ...]:
+    """Return the current versions of the tables in `table_names`, in the same order"""
+    if __shared_versions is None:
+        with __lock:
+            return tuple(__versions[table_name] for table_name in table_names)
+
+    # each version is read atomically, and versions only ever go up, so no lock is needed
+    shared_versions = __shared_versions.get_obj()
+    versions = []
+    for table_name in table_names:
+        idx = __shared_index.get(table_name)
+        if idx is None:
+            with __lock:
+                versions.append(__versions[table_name])
+        else:
+            versions.append(shared_versions[idx])
+    return tuple(versions)
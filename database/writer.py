@@ -0,0 +1,238 @@
+"""
+The writer of the db: every write to the db made by this process goes through a single
+thread, which owns the only connection this process writes with.
+
+A write is a job, a function making its queries with the connection it is called with.
+`submit()` puts the job in the writer's queue, and waits until it is committed.
+```
+def job(conn: JobConnection) -> int:
+    return conn.execute('DELETE FROM Pending_change WHERE expires < ?', (now,)).rowcount
+
+deleted = writer.get(DB_PATH).submit(job)
+```
+The jobs waiting in the queue while the writer commits are all committed together in the
+next transaction (a group commit, of at most `MAX_BATCH` jobs), so the more requests write
+at once, the fewer commits (and waits for the write lock) each write costs. Each job runs
+in a savepoint of its own, so a job that raises is rolled back alone, and its error is
+raised by `submit()` instead of being committed.
+
+The write lock of the db is still shared with the other processes using it (e.g. the other
+workers of server.py), which wait for it for up to `connection.BUSY_TIMEOUT` seconds.
+Threads are not forked, so a forked process starts a writer of its own on its first write.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from .connection import connect
+
+
+MAX_BATCH = 64  # jobs committed in 1 transaction at most
+
+# (sql, values, seconds taken, number of rows changed) of each query made by a job
+Executed = Tuple[str, Sequence, float, int]
+
+logger = logging.getLogger(__name__)
+
+
+class JobConnection:
+    """The writer's connection, as given to a job, which records the queries made with it"""
+
+    def __init__(self, conn: sqlite3.Connection, executed: List[Executed]) -> None:
+        self.__conn = conn
+        self.__executed = executed
+
+    def execute(self, sql: str, values: Sequence = ()) -> sqlite3.Cursor:
+        start = time.perf_counter()
+        cursor = self.__conn.execute(sql, values)
+        self.__executed.append((sql, values, time.perf_counter() - start, max(cursor.rowcount, 0)))
+        return cursor
+
+
+Job = Callable[[JobConnection], Any]
+
+
+class _Queued:
+    """A job in the writer's queue, with the future its result is set on once committed"""
+
+    __slots__ = ('job', 'executed', 'future', 'result', 'error')
+
+    def __init__(self, job: Job, executed: List[Executed]) -> None:
+        self.job = job
+        self.executed = executed
+        self.future: Future = Future()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class Writer:
+    """
+    Makes the writes to the db at `db_path` with a thread of its own (see `database.writer`).
+
+    Each thread has a queue of its own. If the thread dies (e.g. it fails to connect to the db),
+    the jobs in its queue fail with its error, and the next job submitted starts a new thread.
+    So does a job submitted after `close()`.
+    """
+
+    def __init__(self, db_path: str, max_batch: int = MAX_BATCH) -> None:
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.__lock = threading.Lock()
+        self.__thread: Optional[threading.Thread] = None
+        self.__queue: Optional[queue.SimpleQueue] = None  # of the thread
+
+    def submit(self, job: Job, executed: Optional[List[Executed]] = None) -> Any:
+        """
+        Run `job` with the writer's connection, in a transaction, and wait for it to be committed.
+        The queries it makes are appended to `executed`, if given.
+
+        Return
+        - the value returned by `job`, or raise the error it raised (after rolling it back)
+        """
+        if threading.current_thread() is self.__thread:
+            raise RuntimeError('A job of the writer cannot submit another job')
+        queued = _Queued(job, executed if executed is not None else [])
+        with self.__lock:  # so the job is put in the queue of a thread that is running
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__queue = queue.SimpleQueue()
+                self.__thread = threading.Thread(
+                    target=self.__run, args=(self.__queue,),
+                    name=f'writer:{os.path.basename(self.db_path)}', daemon=True)
+                self.__thread.start()
+            self.__queue.put(queued)
+        return queued.future.result()
+
+    def close(self) -> None:
+        """Commit the jobs already submitted, stop the thread and close its connection"""
+        with self.__lock:
+            thread, jobs = self.__thread, self.__queue
+            self.__thread = self.__queue = None
+            if thread is None:
+                return
+            jobs.put(None)  # after every job already submitted to the thread
+        thread.join()
+
+    def __run(self, jobs: queue.SimpleQueue) -> None:
+        batch: List[_Queued] = []
+        try:
+            conn = connect(self.db_path, isolation_level=None)  # transactions are begun by __commit
+            try:
+                while True:
+                    batch = [jobs.get()]
+                    # with every job submitted while the last batch was committed
+                    while batch[-1] is not None and len(batch) < self.max_batch:
+                        try:
+                            batch.append(jobs.get_nowait())
+                        except queue.Empty:
+                            break
+                    stop = batch[-1] is None
+                    if stop:
+                        batch.pop()
+                    if batch:
+                        self.__commit(conn, batch)
+                    if stop:
+                        return
+            finally:
+                conn.close()
+        except BaseException as err:  # pylint: disable=broad-except
+            logger.exception('The writer of %s stopped', self.db_path)
+            self.__stopped(jobs, batch, err)
+
+    def __stopped(self, jobs: queue.SimpleQueue, batch: List[_Queued], err: BaseException) -> None:
+        """Fail the jobs of a thread that died with `err`, so the next job starts a new thread"""
+        with self.__lock:  # no more jobs are put in its queue
+            if self.__queue is jobs:
+                self.__thread = self.__queue = None
+        while True:
+            try:
+                queued = jobs.get_nowait()
+            except queue.Empty:
+                break
+            if queued is not None:
+                batch.append(queued)
+        for queued in batch:
+            if not queued.future.done():
+                queued.future.set_exception(err)
+
+    def __commit(self, conn: sqlite3.Connection, batch: List[_Queued]) -> None:
+        """Run the jobs in `batch` in 1 transaction, each in a savepoint of its own"""
+        start = time.perf_counter()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for queued in batch:
+                conn.execute('SAVEPOINT job')
+                try:
+                    queued.result = queued.job(JobConnection(conn, queued.executed))
+                except Exception as err:  # pylint: disable=broad-except
+                    conn.execute('ROLLBACK TO job')
+                    queued.error = err
+                conn.execute('RELEASE job')
+            conn.execute('COMMIT')
+        except sqlite3.Error as err:  # e.g. locked by another process for longer than the busy timeout
+            logger.warning('Failed to commit %d jobs: %s', len(batch), err, extra={'jobs': len(batch)})
+            for queued in batch:
+                queued.future.set_exception(queued.error or err)
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')  # if this fails too, the thread is replaced
+            return
+
+        logger.debug(
+            'Committed %d jobs', len(batch),
+            extra={'jobs': len(batch), 'seconds': time.perf_counter() - start})
+        for queued in batch:
+            if queued.error is not None:
+                queued.future.set_exception(queued.error)
+            else:
+                queued.future.set_result(queued.result)
+
+
+_lock = threading.Lock()
+_writers: Dict[str, Writer] = {}  # by the absolute path of their db
+
+
+def get(db_path: str) -> Writer:
+    """Return the writer of the db at `db_path`, creating it on first use"""
+    path = os.path.abspath(db_path)
+    writer = _writers.get(path)
+    if writer is None:
+        with _lock:
+            writer = _writers.setdefault(path, Writer(path))
+    return writer
+
+
+def close(db_path: str) -> None:
+    """
+    Close the writer of the db at `db_path`, if any, e.g. before the db file is replaced.
+    A new writer is started on the next write.
+    """
+    with _lock:
+        writer = _writers.pop(os.path.abspath(db_path), None)
+    if writer is not None:
+        writer.close()
+
+
+def close_all() -> None:
+    """Close the writers of every db, committing the jobs already submitted"""
+    with _lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+def _after_fork() -> None:
+    """Start a new writer in a forked process, on its first write"""
+    global _lock
+    _lock = threading.Lock()  # may have been held by another thread of the parent when it forked
+    _writers.clear()  # their threads (and connections) were left in the parent
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+atexit.register(close_all)
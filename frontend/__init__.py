@@ -2,3 +2,4 @@ from .add import *
 from .view import *
 from .edit import *
 from .errors import *
+from .admin import *
@@ -0,0 +1,74 @@
+"""
+Cache of rendered HTML fragments (e.g. the table of results on a view page).
+
+Each fragment is tagged with the data versions of the tables it was rendered from
+(see `Collection.data_versions()`), and is only served while those versions are unchanged.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Hashable, Iterable, Iterator, Optional, Tuple
+
+
+class FragmentCache:
+    """
+    LRU cache of rendered HTML fragments, holding at most `maxsize` fragments.
+
+    e.g.
+    ```
+    data_versions = coll.data_versions()  # before reading anything from the db
+    table = cache.get(key, data_versions)
+    if table is None:
+        records = coll.find(...)
+        table = cache.tee(key, data_versions, render(records))
+    ```
+    """
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__fragments: 'OrderedDict[Hashable, Tuple[Tuple[int, ...], str]]' = OrderedDict()
+
+    def get(self, key: Hashable, data_versions: Tuple[int, ...]) -> Optional[str]:
+        """
+        Return the fragment cached under `key` if it was rendered from data with
+        `data_versions`, otherwise None
+        """
+        with self.__lock:
+            entry = self.__fragments.get(key)
+            if entry is None or entry[0] != data_versions:
+                self.misses += 1
+                return None
+            self.__fragments.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, data_versions: Tuple[int, ...], fragment: str) -> None:
+        """Cache `fragment` rendered from data with `data_versions` under `key`"""
+        with self.__lock:
+            self.__fragments[key] = (data_versions, fragment)
+            self.__fragments.move_to_end(key)
+            while len(self.__fragments) > self.maxsize:
+                self.__fragments.popitem(last=False)
+
+    def tee(
+        self,
+        key: Hashable,
+        data_versions: Tuple[int, ...],
+        chunks: Iterable[str],
+    ) -> Iterator[str]:
+        """
+        Yield the `chunks` of a fragment as they are rendered (e.g. while streaming),
+        caching the whole fragment under `key` once all of it has been rendered.
+        """
+        rendered = []
+        for chunk in chunks:
+            rendered.append(chunk)
+            yield chunk
+        self.set(key, data_versions, ''.join(rendered))
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__fragments.clear()
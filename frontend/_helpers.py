@@ -3,15 +3,31 @@ Utils to remove empty keys from the search filter
 
 AND
 
+Utils to stream rendered templates
+
+AND
+
+Utils for conditional GET requests (`ETag`/`If-None-Match` -> 304 Not Modified)
+
+AND
+
 Utils to handle record changes (`RecordDeltas`)
 The http post data in `request.form` contains the old records to be changed
 and the new records to be changed to. `post_data_to_records()` does this
 conversion and returns a list of records represented as dicts containing
 this information. These are aliased as `RecordDeltas` for convenience.
+Edit tables that only submit their changed rows (see static/js/edit_table.js)
+post them as JSON instead, which `changes_to_record_deltas()` converts to the same format.
 """
 
 
-from typing import Any, Dict, Iterable, List, Tuple, TypedDict
+import hashlib
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple, TypedDict
+from flask import Response, current_app, request, stream_with_context
+from database import versions
+from database.storage import Collection
+import metrics
 import myhtml as html
 import model
 import data
@@ -26,6 +42,53 @@ def remove_empty_keys_from_filter(record_filter: dict) -> None:
         record_filter.pop(key)
 
 
+def stream_template(template_name: str, **context) -> Response:
+    """
+    Render the template `template_name` with `context` as a streamed response,
+    sending the HTML to the client as it is rendered instead of all at once.
+
+    Iterables in `context` (e.g. `RecordTable.iter_html()`) are only consumed as
+    the template is rendered, so templates should loop over them instead of
+    embedding them as a whole.
+    """
+    app = current_app._get_current_object()  # pylint: disable=protected-access
+    app.update_template_context(context)
+    template = app.jinja_env.get_or_select_template(template_name)
+    return Response(stream_with_context(metrics.timed_render(template.generate(context))))
+
+
+def data_etag(*parts: Any) -> str:
+    """
+    Return the ETag of a page rendered from data in the db, where `parts` identify
+    the page, e.g. its name, the normalized query and the data versions of the tables read.
+    """
+    # the data versions restart from 0 whenever the app restarts
+    key = repr((versions.epoch, parts)).encode()
+    return hashlib.sha1(key).hexdigest()
+
+
+def with_cache_headers(response: Response, etag: str) -> Response:
+    """
+    Set the `ETag` of the `response`, and let browsers cache it as long as
+    they revalidate it (with `If-None-Match`) every time.
+    """
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag: str) -> Optional[Response]:
+    """
+    Return a `304 Not Modified` response if the page cached by the browser
+    has the ETag `etag` (GET requests only), otherwise None.
+    """
+    # compared weakly, as compressed responses have the weak version of the ETag (see `compression`)
+    if request.method not in ('GET', 'HEAD') or not request.if_none_match.contains_weak(etag):
+        return None
+    return with_cache_headers(Response(status=304), etag)
+
+
 class InvalidPostDataError(Exception):
     pass
 
@@ -37,13 +100,17 @@ class RecordDelta(TypedDict):
     {
         "old": {...},
         "new": {...},
-        "method": "UPDATE" | "DELETE" | "INSERT"
+        "method": "UPDATE" | "DELETE" | "INSERT",
+        "key": [...] | None
     }
     ```
+    where "key" is the key of the old record in the collection (see `Collection.key_sql`),
+    if known, so the change can be made by its key (see `db_utils.resolve_jt_change`).
     """
     old: Dict[str, Any]
     new: Dict[str, Any]
     method: str
+    key: Optional[List[Any]]
 
 
 RecordDeltas = List[RecordDelta]
@@ -86,54 +153,201 @@ def post_data_to_record_deltas(
             "old": {},
             "new": {},
             "method": method,
+            "key": None,
         })
 
+    columns = {}
     for key in post_data:
         values = post_data.get(key)
         if len(values) != len(record_deltas):
             raise InvalidPostDataError(
                 f'Inconsistent number of records 🤡. \
                 length `{values}` != length `{record_deltas}`')
+        if key.startswith('old:') or key.startswith('new:'):
+            columns[key] = values
+
+    # values submitted in post_data are converted by each field's parser (e.g. numbers),
+    # 1 column at a time. Fields with nothing to convert are skipped
+    is_insert = [rec_delta['method'] == 'INSERT' for rec_delta in record_deltas]
+    for field, parse in zip(entity.fields, entity.field_parsers):
+        if parse is data.parse_as_submitted:
+            continue
+        for key, skip in (('old:' + field.name, is_insert), ('new:' + field.name, None)):
+            values = columns.get(key, [None] * len(record_deltas))
+            try:
+                columns[key] = [
+                    value if skip is not None and skip[idx] else parse(field, value)
+                    for idx, value in enumerate(values)
+                ]
+            except ValueError as err:
+                raise InvalidPostDataError(f'field `{field.name}`: {err}') from err
+
+    for key, values in columns.items():
+        side, _key = key[:3], key[4:]
+        for rec_delta, value in zip(record_deltas, values):
+            rec_delta[side][_key] = value
 
-        _key = key[4:]
-        for idx, value in enumerate(values):
-            if key.startswith('old:'):
-                record_deltas[idx]['old'][_key] = value
-            elif key.startswith('new:'):
-                record_deltas[idx]['new'][_key] = value
+    return record_deltas
 
-    for field in entity.fields:
-        for rec_delta in record_deltas:
-            value_old = rec_delta['old'].get(field.name)
-            value_new = rec_delta['new'].get(field.name)
-            method = rec_delta['method']
-
-            if isinstance(field, data.Number) and not isinstance(field, data.OptionalNumber):
-                # numeric values submitted in post_data must be valid numbers
-                if not value_old.isdecimal() and method != 'INSERT':
-                    raise InvalidPostDataError(
-                        f'field `{field.name}`: `{value_old}` is not a number.')
-                if not value_new.isdecimal():
-                    raise InvalidPostDataError(
-                        f'field `{field.name}`: `{value_new}` is not a number.')
-
-                if rec_delta['method'] != 'INSERT':
-                    rec_delta['old'][field.name] = int(value_old)
-                rec_delta['new'][field.name] = int(value_new)
 
+def changes_to_record_deltas(
+    changes_json: str,
+    accepted_methods: Iterable[str],
+    entity: model.Entity,
+    coll: Collection,
+) -> RecordDeltas:
+    """
+    Convert the changed rows of an edit table, posted as JSON in the format
+    ```
+    [
+        {"method": "UPDATE", "key": [...], "new": {...changed fields}},
+        {"method": "DELETE", "key": [...]},
+        {"method": "INSERT", "new": {...}}
+    ]
+    ```
+    to `RecordDeltas`, where "key" is the key of the row in `coll` (see `Collection.key_sql`).
+    The old records are read from `coll`, the same as they were shown in the edit table.
+
+    Raises
+    ------
+    `InvalidPostDataError`
+    - if `changes_json` is not in the format above, or any "method" is not in `accepted_methods`
+    - if a changed row no longer exists in `coll`
+
+    Return
+    ------
+    `RecordDeltas` (see `post_data_to_record_deltas`), with the key of each UPDATE and DELETE
+    """
+    try:
+        changes = json.loads(changes_json)
+    except ValueError as err:
+        raise InvalidPostDataError('field `changes` must be JSON 🤡') from err
+    if not isinstance(changes, list) or not all(isinstance(c, dict) for c in changes):
+        raise InvalidPostDataError('field `changes` must be a list of changes 🤡')
+
+    for change in changes:
+        if change.get('method') not in accepted_methods:
+            raise InvalidPostDataError(
+                'field `method` must be string literal "UPDATE" or "DELETE" 🤡')
+        if not isinstance(change.get('new', {}), dict):
+            raise InvalidPostDataError('field `new` of a change must be an object 🤡')
+        if change['method'] != 'INSERT' and not (
+            isinstance(change.get('key'), list)
+            and all(isinstance(value, int) for value in change['key'])
+        ):
+            raise InvalidPostDataError('field `key` of a change must be a list of ids 🤡')
+
+    keys = [change['key'] for change in changes if change['method'] != 'INSERT']
+    try:
+        old_records = coll.find_by_keys(keys)
+    except ValueError as err:  # keys of the wrong length
+        raise InvalidPostDataError(f'Invalid key 🤡: {err}') from err
+    entity.from_db(list(old_records.values()))
+
+    def as_str(value: Any) -> str:  # the same as the value of the table's inputs
+        return '' if value is None else str(value)
+
+    post_data: Dict[str, List[str]] = {'method': []}
+    for field in entity.fields:
+        post_data['old:' + field.name] = []
+        post_data['new:' + field.name] = []
+
+    for change in changes:
+        new_values = change.get('new', {})
+        if change['method'] == 'INSERT':
+            old = {field.name: '' for field in entity.fields}
+            new = {field.name: as_str(new_values.get(field.name)) for field in entity.fields}
+        else:
+            old_record = old_records.get(tuple(change['key']))
+            if old_record is None:
+                raise InvalidPostDataError(
+                    'A record was changed by someone else, please reload the page and try again.')
+            old = {field.name: as_str(old_record.get(field.name)) for field in entity.fields}
+            new = old.copy()
+            if change['method'] == 'UPDATE':
+                new.update(
+                    (field.name, as_str(new_values[field.name]))
+                    for field in entity.fields if field.name in new_values
+                )
+        post_data['method'].append(change['method'])
+        for field in entity.fields:
+            post_data['old:' + field.name].append(old[field.name])
+            post_data['new:' + field.name].append(new[field.name])
+
+    record_deltas = post_data_to_record_deltas(post_data, accepted_methods, entity)
+    for rec_delta, change in zip(record_deltas, changes):
+        if change['method'] != 'INSERT':
+            rec_delta['key'] = change['key']
     return record_deltas
 
 
+def validate_record_deltas(
+    record_deltas: RecordDeltas,
+    entity: model.Entity,
+) -> List[Tuple[Optional[dict], dict]]:
+    """
+    Validate the old (except for INSERTs) and new records of all the `record_deltas`
+    in 1 pass per field (see `data.validate_columns`), and convert them to the format
+    of `Entity.as_dict` (only the entity's fields, empty fields are NULL (None)).
+
+    Raises
+    ------
+    `ValidationFailedError`
+    - with the error of the first invalid record
+    `KeyError`
+    - if a record is missing any of the entity's fields
+
+    Return
+    ------
+    The `(old_record, new_record)` of each record delta, `old_record` is None for INSERTs
+    """
+    fields = entity.fields
+    old_idxs = [
+        idx for idx, rec_delta in enumerate(record_deltas)
+        if rec_delta['method'] != 'INSERT'
+    ]
+    old_columns = {
+        field.name: [record_deltas[idx]['old'][field.name] for idx in old_idxs]
+        for field in fields
+    }
+    new_columns = {
+        field.name: [rec_delta['new'][field.name] for rec_delta in record_deltas]
+        for field in fields
+    }
+
+    old_errors = data.validate_columns(fields, old_columns)
+    new_errors = data.validate_columns(fields, new_columns)
+    if old_errors or new_errors:
+        # report the 1st error in the same order as validating each record delta in turn
+        first_errors = [(old_idxs[pos], 0, errors) for pos, errors in old_errors.items()]
+        first_errors += [(idx, 1, errors) for idx, errors in new_errors.items()]
+        _, _, errors = min(first_errors, key=lambda error: error[:2])
+        raise data.ValidationFailedError(next(iter(errors.values())))
+
+    def to_records(columns: Dict[str, List[Any]]) -> List[dict]:
+        names = list(columns)
+        values = [
+            [None if value == '' else value for value in column]
+            for column in columns.values()
+        ]
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+    old_records: List[Optional[dict]] = [None] * len(record_deltas)
+    for idx, old_record in zip(old_idxs, to_records(old_columns)):
+        old_records[idx] = old_record
+    return list(zip(old_records, to_records(new_columns)))
+
+
 def record_deltas_to_tables(
     record_deltas: RecordDeltas,
     entity: model.Entity,
     headers: List[str],
     **kwargs,
-) -> Tuple[html.RecordTable, html.RecordDeltaTable]:
+) -> Tuple[html.RecordTable, html.RecordDeltaTable, RecordDeltas]:
     """
     Converts the `record_deltas` to a normal `RecordTable` and a
     `SubmittableRecordTable` which encapsulates the `RecordDeltas`
-    to be submitted in a post request.
+    to be submitted in a post request. UPDATEs which don't change anything are left out.
 
     Params
     ------
@@ -147,25 +361,24 @@ def record_deltas_to_tables(
 
     Return
     ------
-    A tuple in the format: `(record_table, record_delta_table)`
+    A tuple in the format: `(record_table, record_delta_table, changed_record_deltas)`
     """
     table_old = html.RecordTable(headers=headers)
     table_new_submit = html.RecordDeltaTable(headers=headers, **kwargs)
+    changed_record_deltas = []
 
-    for rec_delta in record_deltas:
-        old_record = rec_delta['old']
-        new_record = rec_delta['new']
+    # validate the records & convert empty fields to NULL (None)
+    records = validate_record_deltas(record_deltas, entity)
+    for rec_delta, (old_record, new_record) in zip(record_deltas, records):
         method = rec_delta['method']
-
-        # validate the records & convert empty fields to NULL (None)
-        if method != 'INSERT':
-            old_record = entity.from_dict(old_record).as_dict()
-        new_record = entity.from_dict(new_record).as_dict()
+        if method == 'INSERT':
+            old_record = rec_delta['old']
 
         if method == 'UPDATE' and new_record == old_record:
             continue
         # only add records with changes
         table_old.add_row(old_record)
         table_new_submit.add_row(rec_delta)
+        changed_record_deltas.append(rec_delta)
 
-    return table_old, table_new_submit
+    return table_old, table_new_submit, changed_record_deltas
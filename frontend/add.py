@@ -27,14 +27,13 @@ def add(page_name: str) -> str:
         except data.ValidationFailedError as err:
             return __failure(_entity.entity, str(err))
         form = html.RecordForm(f'/dashboard/add/{page_name}/result', 'post')
-        form = convert.entity_to_hidden_form(entity, form)
+        form = convert.entity_to_hidden_form(entity, form).html()
         table = convert.entity_to_table(entity)
         confirm = True
     else:
-        form = html.RecordForm(f'/dashboard/add/{page_name}?confirm', 'post')
-        form = convert.entity_to_new_form(_entity, form)
+        form = convert.new_form_html(_entity, f'/dashboard/add/{page_name}?confirm', 'post')
 
-    form = f'<div class="center-form">{form.html()}</div>'
+    form = f'<div class="center-form">{form}</div>'
     table = f'<div class="outline">{table.html()}</div>' if table else ''
 
     return render_template(
@@ -55,7 +54,7 @@ def add_res(page_name: str):
         return __failure(_entity.entity, str(err))
 
     try:  # handle insert errors
-        colls[page_name].insert(entity.as_dict())
+        colls[page_name].insert(_entity.to_db(entity.as_dict()))
     except sqlite3.Error as err:
         return __failure(_entity.entity, str(err))
     table = convert.entity_to_table(entity)
@@ -0,0 +1,61 @@
+from flask import Response, render_template
+import metrics
+from database import slow_queries
+
+
+def admin():
+    """Per route latencies, SQL & render times, and cache hit rates of every worker"""
+    collected = metrics.collect()
+    requests_per_route = {}
+    for route, _method, _status, count in collected['requests']:
+        requests_per_route[route] = requests_per_route.get(route, 0) + count
+
+    def ms(seconds):
+        return '' if seconds is None else f'{seconds * 1000:.1f}'
+
+    routes = []
+    for route, latency in sorted(collected['latency'].items()):
+        count = latency[2]
+        queries, query_seconds, rows = collected['queries'].get(route, [0, 0.0, 0])
+        renders, render_seconds = collected['renders'].get(route, [0, 0.0])
+        routes.append({
+            'route': route,
+            'requests': requests_per_route.get(route, count),
+            'p50': ms(metrics.quantile(latency, 0.5)),
+            'p95': ms(metrics.quantile(latency, 0.95)),
+            'p99': ms(metrics.quantile(latency, 0.99)),
+            'queries': f'{queries / count:.1f}',
+            'query_ms': ms(query_seconds / count),
+            'rows': f'{rows / count:.0f}',
+            'render_ms': ms(render_seconds / renders if renders else None),
+        })
+
+    caches = []
+    for name, (hits, misses) in sorted(collected['caches'].items()):
+        total = hits + misses
+        caches.append({
+            'name': name,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': f'{hits / total:.0%}' if total else '',
+        })
+
+    return render_template('admin/index.html', routes=routes, caches=caches)
+
+
+def admin_metrics():
+    """The metrics of every worker, in the Prometheus text format"""
+    return Response(
+        metrics.to_prometheus(metrics.collect()),
+        mimetype='text/plain; version=0.0.4',
+    )
+
+
+def admin_slow_queries():
+    """The slow queries logged by every worker, grouped by their SQL"""
+    offenders = slow_queries.offenders()
+    return render_template(
+        'admin/slow_queries.html',
+        offenders=offenders,
+        threshold_ms=f'{slow_queries.threshold * 1000:g}',
+    )
@@ -1,13 +1,10 @@
+from itertools import chain
 from flask import render_template, request
 import convert
 import data
 import myhtml as html
-from database import colls
-from database.db_utils import (
-    delete_from_jt_coll,
-    insert_into_jt_coll,
-    update_jt_coll
-)
+from database import colls, pending_changes
+from database.db_utils import apply_jt_changes, resolve_jt_change
 from model import ENTITIES
 
 from .errors import invalid_post_data
@@ -15,10 +12,17 @@ from ._helpers import (
     remove_empty_keys_from_filter,
     record_deltas_to_tables,
     post_data_to_record_deltas,
+    changes_to_record_deltas,
+    data_etag,
+    not_modified,
+    stream_template,
+    with_cache_headers,
     InvalidPostDataError
 )
 
 ACCEPTED_METHODS = ('UPDATE', 'DELETE', 'INSERT')
+# tables with at least this many rows are only rendered in view by the browser
+VIRTUAL_TABLE_MIN_ROWS = 200
 
 
 def edit(page_name: str):
@@ -26,26 +30,33 @@ def edit(page_name: str):
     remove_empty_keys_from_filter(record_filter)
     coll = colls[page_name]  # e.g. membership coll for /membership
 
+    # the same filter renders the same page until the data changes
+    etag = data_etag('edit', page_name, tuple(sorted(record_filter.items())), coll.data_versions())
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
     # construct form to search for records
     # entity representing the many-to-many relationship
     entity = ENTITIES[page_name]
-    form = html.RecordForm(action='', method='get')
-    form = convert.entity_to_form_with_values(
-        entity, form, record_filter)
-    form = f'<div class="center-form">{form.html()}</div>'
+    form = convert.form_with_values_html(entity, action='', method='get', values=record_filter)
+    form = f'<div class="center-form">{form}</div>'
 
     # find record(s) corresponding to the filter specifying JOIN condition
     try:  # handle error when filter has invalid keys
-        all_records_to_edit = coll.find(record_filter)
+        keys, all_records_to_edit = coll.find_keyed(record_filter)
     except KeyError:
-        all_records_to_edit = []
+        keys, all_records_to_edit = [], []
 
-    records_to_edit = []
-    for rec in all_records_to_edit:
-        rec_to_edit = {}
-        for field in entity.fields:
-            rec_to_edit[field.name] = rec.get(field.name, '')
-        records_to_edit.append(rec_to_edit)
+    if all(field.name in coll.found_column_names for field in entity.fields):
+        records_to_edit = all_records_to_edit  # the table reads the found rows directly
+    else:
+        records_to_edit = []
+        for rec in all_records_to_edit:
+            rec_to_edit = {}
+            for field in entity.fields:
+                rec_to_edit[field.name] = rec.get(field.name, '')
+            records_to_edit.append(rec_to_edit)
 
     headers = entity.fields
     if len(records_to_edit) == 0:
@@ -54,27 +65,36 @@ def edit(page_name: str):
         msg = f'✍️ Edit {entity.entity}s'
 
     # display table of members of the club
+    virtual = len(records_to_edit) >= VIRTUAL_TABLE_MIN_ROWS
     table = convert.records_to_editable_table(
-        records_to_edit, headers=headers, action='?confirm', method='post')
-    table = f'''<div class="outline">
-        <h3>{msg}</h3>
-        {table.html()}
-    </div>'''
+        records_to_edit, headers=headers, virtual=virtual, keys=keys,
+        action='?confirm', method='post')
+    table = chain(
+        [f'<div class="outline"><h3>{msg}</h3>'],
+        table.iter_html(),
+        ['</div>'],
+    )
 
-    return render_template(
+    response = stream_template(
         'dashboard/edit/edit_entity.html',
         entity=page_name.title(),
         form=form,
         table=table,
+        virtual=virtual,
     )
+    return with_cache_headers(response, etag)
 
 
 def edit_confirm(page_name: str):
-    post_data = request.form.to_dict(flat=False)
     entity = ENTITIES[page_name]
     try:
-        record_deltas = post_data_to_record_deltas(
-            post_data, ACCEPTED_METHODS, entity)
+        if 'changes' in request.form:  # only the changed rows, keyed by their ids
+            record_deltas = changes_to_record_deltas(
+                request.form['changes'], ACCEPTED_METHODS, entity, colls[page_name])
+        else:
+            post_data = request.form.to_dict(flat=False)
+            record_deltas = post_data_to_record_deltas(
+                post_data, ACCEPTED_METHODS, entity)
     except InvalidPostDataError as err:
         return invalid_post_data(str(err))
 
@@ -82,60 +102,55 @@ def edit_confirm(page_name: str):
 
     # confirming changes, display changes in old and new table
     try:
-        action = f'/dashboard/edit/{page_name}/result'
-        table_old, table_new = record_deltas_to_tables(
-            record_deltas, entity, headers, action=action, method='post', submittable=True)
+        table_old, table_new, record_deltas = record_deltas_to_tables(
+            record_deltas, entity, headers)
     except data.ValidationFailedError as err:
         return render_template(
             'dashboard/edit/failure.html', entity=page_name.title(), error=str(err)), 400
 
-    if len(table_new.rows()) == 0:
+    if len(record_deltas) == 0:
         return render_template(
             'dashboard/edit/failure.html', entity=page_name.title(), error='No changes made!'), 400
 
+    # resolve the changes to ids now, so saving them only needs to make them
+    results = [resolve_jt_change(page_name, rec_delta) for rec_delta in record_deltas]
+    errors = [res.msg for res in results if not res.is_ok]
+    if len(errors) > 0:
+        return render_template(
+            'dashboard/edit/failure.html', entity=page_name.title(), error='<br>'.join(errors)), 400
+
+    table_old, table_new = table_old.html(), table_new.html()
+    token = pending_changes.put(page_name, {
+        'changes': [res.change for res in results],
+        'table_old': table_old,
+        'table_new': table_new,
+    })
+    form = html.RecordForm(f'/dashboard/edit/{page_name}/result', 'post')
+    form.hidden_input('token', token)
+    form.submit_input('Save Changes')
+
     return render_template(
         'dashboard/edit/edit_entity.html',
         entity=entity.entity,
         confirm=True,
-        table_old=table_old.html(),
-        table_new=table_new.html(),
+        table_old=table_old,
+        table_new=table_new + form.html(),
     )
 
 
 def edit_res(page_name: str):
-    post_data = request.form.to_dict(flat=False)
-    entity = ENTITIES[page_name]
-    try:
-        record_deltas = post_data_to_record_deltas(
-            post_data, ACCEPTED_METHODS, entity)
-    except InvalidPostDataError as err:
-        return invalid_post_data(str(err))
-
-    headers = entity.fields
-
-    try:  # html table conversion includes data validation
-        table_old, table_new = record_deltas_to_tables(record_deltas, entity, headers)
-    except data.ValidationFailedError as err:
+    # the changes confirmed in `edit_confirm`, already validated & resolved
+    pending = pending_changes.pop(page_name, request.form.get('token'))
+    if pending is None:
         return render_template(
-            'dashboard/edit/failure.html', entity=page_name.title(), error=str(err)), 400
-
-    errors = []
-    total_edits = 0
-    for rec_delta in record_deltas:  # save changes to db
-        method = rec_delta['method']
-        old_rec = rec_delta['old']
-        new_rec = rec_delta['new']
-
-        if method == 'INSERT':
-            res = insert_into_jt_coll(page_name, new_rec)
-        elif method == 'UPDATE':
-            res = update_jt_coll(page_name, old_rec, new_rec)
-        elif method == 'DELETE':
-            res = delete_from_jt_coll(page_name, old_rec)
+            'dashboard/edit/failure.html',
+            entity=page_name.title(),
+            error='These changes have expired or were already saved, please make them again.'
+        ), 400
 
-        total_edits += 1
-        if not res.is_ok:
-            errors.append(res.msg)
+    results = apply_jt_changes(page_name, pending['changes'])
+    errors = [res.msg for res in results if not res.is_ok]
+    total_edits = len(results)
 
     error_count = len(errors)
     if error_count > 0:
@@ -147,6 +162,6 @@ def edit_res(page_name: str):
     return render_template(
         'dashboard/edit/success.html',
         entity=page_name.title(),
-        table_old=table_old.html(),
-        table_new=table_new.html()
+        table_old=pending['table_old'],
+        table_new=pending['table_new'],
     )
@@ -1,9 +1,27 @@
+import sqlite3
 from flask import render_template
 
 
+RETRY_AFTER = 1  # seconds the browser should wait before retrying when the db is busy
+
+
 def not_found(e: str):
     return render_template('errors.html', title='Page Not Found', error=e), 404
 
 
 def invalid_post_data(e: str) -> str:
     return render_template('errors.html', title='Invalid Post Data', error=e), 409
+
+
+def database_busy(e: sqlite3.OperationalError):
+    """
+    Tell the user to retry when the db stayed locked by other writers for longer than the
+    busy timeout (see `database.connection`), instead of failing with a generic 500
+    """
+    if 'database is locked' not in str(e):
+        raise e
+    return render_template(
+        'errors.html',
+        title='Database Busy',
+        error='The database is busy with other changes, please try again in a moment.',
+    ), 503, {'Retry-After': str(RETRY_AFTER)}
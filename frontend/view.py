@@ -1,9 +1,21 @@
-from flask import render_template, request
+from itertools import chain
+from flask import request
 from model import ENTITIES
 from database import colls
-import myhtml as html
 import convert
-from ._helpers import remove_empty_keys_from_filter
+import metrics
+from ._cache import FragmentCache
+from ._helpers import (
+    data_etag,
+    not_modified,
+    remove_empty_keys_from_filter,
+    stream_template,
+    with_cache_headers
+)
+
+# tables of results rendered for each (page, filter)
+view_cache = FragmentCache()
+metrics.register_cache('view', view_cache)
 
 
 def view(page_name: str):
@@ -15,27 +27,46 @@ def view(page_name: str):
 
     record_filter = request.args.to_dict()
     remove_empty_keys_from_filter(record_filter)
-    records = coll.find(record_filter)
-    table = '<div class="outline">🦧can\'t find anything</div>'
+    normalized_filter = tuple(sorted(record_filter.items()))
 
-    form = html.RecordForm(f'/dashboard/view/{page_name}')
-    form = convert.entity_to_form_with_values(entity, form, record_filter)
-    form = f'<div class="center-form">{form.html()}</div>'
+    # the same filter renders the same page until the data changes
+    data_versions = coll.data_versions()  # before finding the records
+    etag = data_etag('view', page_name, normalized_filter, data_versions)
+    response = not_modified(etag)
+    if response is not None:
+        return response
 
-    # LEFT JOIN-ed with student-subject, but SOME PPL didnt put subject_id
-    # so subject_id becomes None (NULL) cause not in table
-    for rec in records:
-        id_ = rec.get('id')
-        if 'student_id' in rec.keys():
-            rec['student_id'] = id_
+    form = convert.form_with_values_html(entity, f'/dashboard/view/{page_name}', 'get', record_filter)
+    form = f'<div class="center-form">{form}</div>'
 
-    if records:
-        table = convert.records_to_table(records, headers=entity.fields)
-        table = f'<div class="outline">{table.html()}</div>'
+    cache_key = (page_name, normalized_filter)
+    table = view_cache.get(cache_key, data_versions)
+    if table is not None:
+        table = [table]
+    else:
+        records = coll.find(record_filter)
+        table = view_cache.tee(cache_key, data_versions, __render_table(records, entity))
 
-    return render_template(
+    response = stream_template(
         'dashboard/view/view_entity.html',
         entity=page_name.title(),
         form=form,
         table=table,
     )
+    return with_cache_headers(response, etag)
+
+
+def __render_table(records, entity):
+    if not records:
+        return ['<div class="outline">🦧can\'t find anything</div>']
+
+    # LEFT JOIN-ed with student-subject, but SOME PPL didnt put subject_id
+    # so subject_id becomes None (NULL) cause not in table
+    for rec in records:
+        id_ = rec.get('id')
+        if 'student_id' in rec.keys():
+            rec['student_id'] = id_
+
+    entity.from_db(records)  # e.g. dates
+    table = convert.records_to_table(records, headers=entity.fields)
+    return chain(['<div class="outline">'], table.iter_html(), ['</div>'])
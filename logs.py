@@ -0,0 +1,242 @@
+"""
+Structured logging for the app, which never makes a request wait on writing its logs.
+
+Modules log to their own logger as usual, e.g. for database/db_utils.py
+```
+logger = logging.getLogger(__name__)
+logger.debug('Resolved update of %s', jt_coll_name, extra={'filter': ..., 'record': ...})
+```
+`setup()` sends the records of every logger to a queue, which a background thread writes
+to stderr, one JSON object per line (or as text, for development), e.g.
+```
+{"time": "2022-04-01T12:00:00.123", "level": "INFO", "logger": "database.db_utils",
+ "message": "Applied UPDATE to membership", "request_id": "3f9c2a7e1b0d4c58", "pid": 4242,
+ "thread": "request_0", "filter": {...}, "record": {...}}
+```
+where the fields passed in `extra` are added to the object. Records are formatted by the
+background thread, so the values in `extra` must not be changed after they are logged.
+
+`init_app(app)` gives every request to the app a request id (the `X-Request-ID` header of the
+request if it has a valid one), added to the records logged while handling it and sent back
+in the `X-Request-ID` header of its response.
+
+Threads are not forked, so a forked process (e.g. a worker of server.py) writes its logs
+with a thread of its own, and must call `shutdown()` before exiting with `os._exit`.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Mapping, Optional, TextIO
+from flask import Flask
+
+
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+LEVEL = 'INFO'
+FORMATS = ('json', 'text')
+REQUEST_ID_HEADER = 'X-Request-ID'
+VALID_REQUEST_ID = re.compile(r'[A-Za-z0-9._-]{1,64}')
+NO_REQUEST_ID = '-'  # of the records logged outside of requests
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'
+
+# the attributes of every LogRecord, any others were passed in `extra`
+_RECORD_ATTRS = frozenset(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {
+    'message', 'asctime', 'request_id'}
+
+_request_id: contextvars.ContextVar[str] = contextvars.ContextVar('request_id', default=NO_REQUEST_ID)
+
+_lock = threading.Lock()
+_handler: Optional[QueueHandler] = None  # on the root logger, puts the records in the queue
+_listener: Optional[QueueListener] = None  # writes the records in the queue, in a thread
+_output: Optional[logging.Handler] = None  # used by the listener to write the records
+
+
+def request_id() -> str:
+    """Return the id of the request being handled, or `NO_REQUEST_ID` outside of requests"""
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Add the id of the request being handled to each record, as `request_id`"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    Puts the records in an unbounded queue, only merging their messages with their args
+    and formatting their exceptions, so the rest of the formatting is done by the listener
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, Mapping):  # e.g. a `database.storage.Record`
+        return dict(value)
+    return repr(value)
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats each record as a JSON object on a single line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', NO_REQUEST_ID),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=_to_json, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Formats each record as a line of text, followed by the fields passed in `extra`"""
+
+    def __init__(self) -> None:
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extra = {key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRS}
+        if extra:
+            line += ' ' + json.dumps(extra, default=_to_json, ensure_ascii=False)
+        return line
+
+
+def setup(level: Optional[str] = None, fmt: Optional[str] = None, stream: Optional[TextIO] = None) -> None:
+    """
+    Send the records of every logger at `level` or above (default: $LOG_LEVEL or `LEVEL`)
+    to `stream` (default: stderr) through a queue, formatted as `fmt` (one of `FORMATS`,
+    default: $LOG_FORMAT or json). Replaces the previous setup, if any.
+    """
+    global _handler, _listener, _output
+    level = (level or os.environ.get('LOG_LEVEL') or LEVEL).upper()
+    fmt = fmt or os.environ.get('LOG_FORMAT') or FORMATS[0]
+    if fmt not in FORMATS:
+        raise ValueError(f'Invalid log format {fmt!r}, must be one of {FORMATS}')
+
+    shutdown()
+    with _lock:
+        _output = logging.StreamHandler(stream if stream is not None else sys.stderr)
+        _output.setFormatter(JSONFormatter() if fmt == 'json' else TextFormatter())
+        _handler = _NonBlockingQueueHandler(queue.SimpleQueue())
+        _handler.addFilter(RequestIdFilter())  # in the thread logging, which knows the request
+
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(level)
+        _start_listener()
+
+
+def is_setup() -> bool:
+    return _handler is not None
+
+
+def _start_listener() -> None:
+    global _listener
+    _listener = QueueListener(_handler.queue, _output)
+    _listener.start()
+
+
+def _after_fork() -> None:
+    """Start writing the logs of a forked process with a thread (and a queue) of its own"""
+    if _handler is None:
+        return
+    _handler.queue = queue.SimpleQueue()  # the parent's may have been in use when it forked
+    _start_listener()
+
+
+def shutdown() -> None:
+    """Write the records still in the queue, and stop logging through it"""
+    global _handler, _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()  # after writing the records already in the queue
+            _listener = None
+        if _handler is not None:
+            logging.getLogger().removeHandler(_handler)
+            _handler = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+atexit.register(shutdown)
+
+
+class RequestIdMiddleware:
+    """
+    WSGI middleware giving every request to `wsgi_app` a request id, set while handling it
+    (including while streaming its response) and sent back in its `X-Request-ID` header
+    """
+
+    def __init__(self, wsgi_app) -> None:
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        id_ = environ.get('HTTP_' + REQUEST_ID_HEADER.upper().replace('-', '_'), '')
+        if not VALID_REQUEST_ID.fullmatch(id_):
+            id_ = secrets.token_hex(8)
+
+        def _start_response(status_line, headers, exc_info=None):
+            headers = [(name, value) for name, value in headers if name.lower() != REQUEST_ID_HEADER.lower()]
+            headers.append((REQUEST_ID_HEADER, id_))
+            return start_response(status_line, headers, exc_info)
+
+        token = _request_id.set(id_)
+        try:
+            body = self.wsgi_app(environ, _start_response)
+        finally:
+            _request_id.reset(token)
+        return _RequestIdBody(body, id_)
+
+
+class _RequestIdBody:
+    """The body of a response, streamed with the id of its request set"""
+
+    def __init__(self, body, id_: str) -> None:
+        self.body = body
+        self.id = id_
+
+    def __iter__(self):
+        token = _request_id.set(self.id)
+        try:
+            yield from self.body
+        finally:
+            _request_id.reset(token)
+
+    def close(self) -> None:
+        if hasattr(self.body, 'close'):
+            self.body.close()
+
+
+def init_app(app: Flask) -> None:
+    """Log the requests made to `app` with their request ids (setting up logging if it isn't)"""
+    if not is_setup():
+        setup()
+    app.wsgi_app = RequestIdMiddleware(app.wsgi_app)
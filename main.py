@@ -1,9 +1,36 @@
+import sqlite3
 from functools import wraps
 from typing import Callable, Iterable
-from flask import Flask, render_template, request
+from flask import Blueprint, Flask, render_template, request
+import api
+import assets
+import compression
+import database
 import frontend
+import logs
+import metrics
 
-app = Flask(__name__)
+routes = Blueprint('routes', __name__)
+
+
+def create_app() -> Flask:
+    """
+    Create the app, after creating the tables in the db (or migrating them)
+    so that they exist before any collection is used.
+
+    Serve it with server.py in production, or `flask --app main run --debug` for development.
+    """
+    database.init_schema()
+    app = Flask(__name__)
+    app.register_error_handler(404, not_found)
+    app.register_error_handler(409, invalid_post_data)
+    app.register_error_handler(sqlite3.OperationalError, database_busy)
+    app.register_blueprint(routes)
+    assets.init_app(app)
+    compression.init_app(app)  # inside metrics, so compressing counts towards the request's time
+    metrics.init_app(app)
+    logs.init_app(app)  # outermost, so the request id is set for everything else
+    return app
 
 
 # ------------------------------
@@ -15,16 +42,18 @@ DEFAULT_404_ERR_MSG = (
 )
 
 
-@app.errorhandler(404)
 def not_found(e=DEFAULT_404_ERR_MSG):
     return frontend.not_found(e)
 
 
-@app.errorhandler(409)
 def invalid_post_data(e):
     return frontend.invalid_post_data(e)
 
 
+def database_busy(e):
+    return frontend.database_busy(e)
+
+
 def for_existing_pages(pages: Iterable):
     """Decorator to accept generic flask routes for specific page names"""
     def decorator(callback: Callable):
@@ -43,19 +72,19 @@ def for_existing_pages(pages: Iterable):
 DASHBOARD_ACTIONS = ('add', 'view', 'edit')
 
 
-@app.route('/')
+@routes.route('/')
 def index():
     """Splash page"""
     return render_template('index.html')
 
 
-@app.route('/dashboard')
+@routes.route('/dashboard')
 def dashboard():
     """Dashboard containing the allowed actions (e.g. Add, View, etc.)"""
     return render_template('dashboard/index.html')
 
 
-@app.route('/dashboard/<action>')
+@routes.route('/dashboard/<action>')
 def dashboard_action(action: str):
     if action not in DASHBOARD_ACTIONS:
         return not_found()
@@ -68,13 +97,13 @@ def dashboard_action(action: str):
 DASHBOARD_ADD_EXISTING_PAGES = ('club', 'activity')
 
 
-@app.route('/dashboard/add/<page_name>', methods=['GET', 'POST'])
+@routes.route('/dashboard/add/<page_name>', methods=['GET', 'POST'])
 @for_existing_pages(DASHBOARD_ADD_EXISTING_PAGES)
 def add_entity(page_name: str):
     return frontend.add(page_name)
 
 
-@app.route('/dashboard/add/<page_name>/result', methods=['POST'])
+@routes.route('/dashboard/add/<page_name>/result', methods=['POST'])
 @for_existing_pages(DASHBOARD_ADD_EXISTING_PAGES)
 def add_entity_result(page_name: str):
     return frontend.add_res(page_name)
@@ -86,7 +115,7 @@ def add_entity_result(page_name: str):
 DASHBOARD_VIEW_EXISTING_PAGES = ('student', 'class', 'club', 'activity')
 
 
-@app.route('/dashboard/view/<page_name>', methods=['GET'])
+@routes.route('/dashboard/view/<page_name>', methods=['GET'])
 @for_existing_pages(DASHBOARD_VIEW_EXISTING_PAGES)
 def view_entity(page_name: str):
     return frontend.view(page_name)
@@ -98,7 +127,7 @@ def view_entity(page_name: str):
 ACCEPTED_METHODS = ('UPDATE', 'DELETE', 'INSERT')
 
 
-@app.route('/dashboard/edit/<page_name>', methods=['GET', 'POST'])
+@routes.route('/dashboard/edit/<page_name>', methods=['GET', 'POST'])
 @for_existing_pages(('membership', 'participation'))
 def edit_relationship(page_name: str):
     if 'confirm' in request.args:
@@ -106,32 +135,62 @@ def edit_relationship(page_name: str):
     return frontend.edit(page_name)
 
 
-@app.route('/dashboard/edit/<page_name>/result', methods=['POST'])
+@routes.route('/dashboard/edit/<page_name>/result', methods=['POST'])
+@for_existing_pages(('membership', 'participation'))
 def edit_relationship_result(page_name: str):
     return frontend.edit_res(page_name)
 
 
-@app.route('/login')
+# ------------------------------
+# JSON API for the collections (see api.py)
+# ------------------------------
+@routes.route('/api/<coll_name>', methods=['GET'])
+def api_read(coll_name: str):
+    return api.read(coll_name)
+
+
+@routes.route('/api/<coll_name>', methods=['POST'])
+def api_write(coll_name: str):
+    return api.write(coll_name)
+
+
+@routes.route('/login')
 def login():
     return 'Under Construction'
 
 
-@app.route('/profile')
+@routes.route('/profile')
 def profile():
     return 'Under Construction'
 
 
-@app.route('/admin')
+# ------------------------------
+# Admin pages
+# ------------------------------
+@routes.route('/admin')
 def admin():
-    return 'Under Construction'
+    """Performance metrics of the app"""
+    return frontend.admin()
+
+
+@routes.route('/admin/metrics')
+def admin_metrics():
+    """Performance metrics of the app, in the Prometheus text format"""
+    return frontend.admin_metrics()
+
+
+@routes.route('/admin/slow-queries')
+def admin_slow_queries():
+    """Slow queries made by the app, with their query plans"""
+    return frontend.admin_slow_queries()
 
 
 if __name__ == '__main__':
-    # import database
+    import server
     # database.init_db_from_csvs()
 
-    # for production server:
-    app.run('0.0.0.0')
+    # for production server (see server.py for its options), with online backups of the db:
+    server.main()
 
     # for dev server:
-    #app.run('localhost', port=3000, debug=True)
+    #create_app().run('localhost', port=3000, debug=True)
@@ -0,0 +1,409 @@
+"""
+Performance metrics of the requests served by the app, per route:
+- latency histograms of the requests (including the time to stream their responses)
+- number of requests by method and status
+- SQL queries made (see `database.storage.query_hooks`), the time taken and the rows fetched
+- time taken to render templates (including the tables rendered by `myhtml` in them)
+- hits and misses of the caches registered with `register_cache`
+
+e.g.
+```
+app = Flask(__name__)
+metrics.init_app(app)
+...
+metrics.to_prometheus(metrics.collect())  # the metrics in the Prometheus text format
+```
+
+The metrics are kept in each process. When the app is served by several worker processes
+(see server.py), `share()` is called before the workers are forked, and each worker saves its
+metrics to a file in the shared directory at most every `FLUSH_INTERVAL` seconds, so that
+`collect()` in any worker returns the metrics of all of them (including workers which have
+since been restarted, so the counters never go down).
+"""
+
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from flask import Flask, before_render_template, request, template_rendered
+
+from database.storage import Collection, query_hooks
+
+
+# upper bounds (seconds) of the buckets of the request latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_INTERVAL = 1.0  # seconds between saves of the metrics of a worker, when shared
+# route of queries made outside of requests (e.g. when the app is started)
+NO_ROUTE = ''
+
+Snapshot = Dict[str, Any]
+
+
+class RequestStats:
+    """What a request has done so far"""
+
+    __slots__ = ('rule', 'route', 'queries', 'query_seconds', 'rows', 'render_seconds', 'render_start')
+
+    def __init__(self) -> None:
+        self.rule = None
+        self.route = None
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.rows = 0
+        self.render_seconds = 0.0
+        self.render_start = None
+
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    'request_stats', default=None)
+
+_lock = threading.Lock()
+_requests: Dict[Tuple[str, str, str], int] = {}  # {(route, method, status): count}
+# {route: [count per bucket of LATENCY_BUCKETS (and 1 for +Inf), sum, count]}
+_latency: Dict[str, list] = {}
+_queries: Dict[str, List[float]] = {}  # {route: [queries, seconds, rows]}
+_renders: Dict[str, List[float]] = {}  # {route: [renders, seconds]}
+_caches: Dict[str, Any] = {}  # {name: cache with `hits` & `misses`}
+
+_shared_dir: Optional[str] = None
+_dirty = False  # whether the metrics changed since they were last saved
+_flusher_pid: Optional[int] = None  # the process whose flusher thread is running
+
+
+def register_cache(name: str, cache: Any) -> None:
+    """Report the `hits` and `misses` of `cache` (e.g. a `FragmentCache`) under `name`"""
+    _caches[name] = cache
+
+
+def share(directory: str) -> None:
+    """
+    Save the metrics of each process into `directory` (which must be empty at first),
+    for `collect()` to combine. Must be called before forking the processes.
+    """
+    global _shared_dir
+    os.makedirs(directory, exist_ok=True)
+    _shared_dir = directory
+
+
+# ------------------------------
+# Recording
+# ------------------------------
+def _on_query(coll: Collection, sql: str, values: Sequence, seconds: float, rows: int) -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += seconds
+        stats.rows += rows
+        return
+    with _lock:
+        totals = _queries.setdefault(NO_ROUTE, [0, 0.0, 0])
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] += rows
+
+
+def _on_render_start(app: Flask, template: Any, context: dict, **kwargs) -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.render_start = time.perf_counter()
+
+
+def _on_render_end(app: Flask, template: Any, context: dict, **kwargs) -> None:
+    stats = _current.get()
+    if stats is not None and stats.render_start is not None:
+        stats.render_seconds += time.perf_counter() - stats.render_start
+        stats.render_start = None
+
+
+def timed_render(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Yield the `chunks` of a streamed template, adding the time taken to render them
+    (but not to send them) to the render time of the current request
+    """
+    stats = _current.get()
+    chunks = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            if stats is not None:
+                stats.render_seconds += time.perf_counter() - start
+        yield chunk
+
+
+def _set_route() -> None:
+    """Set the route of the current request, e.g. /dashboard/view/student for /dashboard/view/<page_name>"""
+    stats = _current.get()
+    if stats is None or request.url_rule is None:
+        return
+    stats.rule = stats.route = request.url_rule.rule
+    for name, value in (request.view_args or {}).items():
+        stats.route = re.sub(f'<(?:[^:<>]+:)?{name}>', str(value), stats.route)
+
+
+def _observe(stats: RequestStats, method: str, status: str, seconds: float) -> None:
+    # only the view args of successful requests are in their route, so that requests
+    # with made up page names (4xx, 5xx) can't add routes without limit
+    route = (stats.route if status[:1] in ('2', '3') else stats.rule) or 'unmatched'
+    with _lock:
+        key = (route, method, status)
+        _requests[key] = _requests.get(key, 0) + 1
+
+        latency = _latency.get(route)
+        if latency is None:
+            latency = _latency[route] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+        bucket = next(
+            (idx for idx, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound),
+            len(LATENCY_BUCKETS))
+        latency[0][bucket] += 1
+        latency[1] += seconds
+        latency[2] += 1
+
+        queries = _queries.setdefault(route, [0, 0.0, 0])
+        queries[0] += stats.queries
+        queries[1] += stats.query_seconds
+        queries[2] += stats.rows
+
+        renders = _renders.setdefault(route, [0, 0.0])
+        if stats.render_seconds > 0:
+            renders[0] += 1
+            renders[1] += stats.render_seconds
+    _schedule_flush()
+
+
+class MetricsMiddleware:
+    """
+    WSGI middleware recording the metrics of every request made to `wsgi_app`,
+    until its response has been sent
+    """
+
+    def __init__(self, wsgi_app) -> None:
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = ['500']
+
+        def _start_response(status_line, headers, exc_info=None):
+            status[0] = status_line.split(' ', 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, _start_response)
+        except BaseException:
+            _current.reset(token)
+            _observe(stats, environ.get('REQUEST_METHOD', ''), status[0], time.perf_counter() - start)
+            raise
+        _current.reset(token)
+        return _ObservedBody(body, stats, environ.get('REQUEST_METHOD', ''), status, start)
+
+
+class _ObservedBody:
+    """The body of a response, recording the request's metrics once it has been sent"""
+
+    def __init__(self, body, stats: RequestStats, method: str, status: list, start: float) -> None:
+        self.body = body
+        self.stats = stats
+        self.method = method
+        self.status = status
+        self.start = start
+
+    def __iter__(self):
+        token = _current.set(self.stats)  # for the queries made while streaming
+        try:
+            yield from self.body
+        finally:
+            _current.reset(token)
+
+    def close(self) -> None:
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            _observe(self.stats, self.method, self.status[0], time.perf_counter() - self.start)
+
+
+def init_app(app: Flask) -> None:
+    """Record the metrics of the requests made to `app`, and of the queries they make"""
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app)
+    app.before_request(_set_route)
+    before_render_template.connect(_on_render_start, app)
+    template_rendered.connect(_on_render_end, app)
+    if _on_query not in query_hooks:
+        query_hooks.append(_on_query)
+
+
+# ------------------------------
+# Collecting
+# ------------------------------
+def snapshot() -> Snapshot:
+    """Return the metrics of this process (JSON serializable)"""
+    with _lock:
+        return {
+            'requests': [[*key, count] for key, count in _requests.items()],
+            'latency': {route: [list(buckets), total, count] for route, (buckets, total, count) in _latency.items()},
+            'queries': {route: list(totals) for route, totals in _queries.items()},
+            'renders': {route: list(totals) for route, totals in _renders.items()},
+            'caches': {name: [cache.hits, cache.misses] for name, cache in _caches.items()},
+        }
+
+
+def flush() -> None:
+    """Save the metrics of this process to the shared directory, if any (see `share`)"""
+    global _dirty
+    if _shared_dir is None:
+        return
+    _dirty = False
+    path = os.path.join(_shared_dir, f'{os.getpid()}.json')
+    with open(path + '.part', 'w', encoding='utf-8') as f:
+        json.dump(snapshot(), f)
+    os.replace(path + '.part', path)
+
+
+def _schedule_flush() -> None:
+    """
+    Have the metrics of this process saved within `FLUSH_INTERVAL` seconds (if shared),
+    by a thread of this process, so requests never wait for it
+    """
+    global _dirty, _flusher_pid
+    if _shared_dir is None:
+        return
+    _dirty = True
+    if _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()  # threads are not forked, so each process starts its own
+
+    def flush_forever() -> None:
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            if _dirty:
+                flush()
+
+    threading.Thread(target=flush_forever, name='metrics-flusher', daemon=True).start()
+
+
+def merge(snapshots: Iterable[Snapshot]) -> Snapshot:
+    """Add up the metrics in `snapshots` (e.g. of several processes)"""
+    def add(totals: list, values: list) -> list:
+        if not totals:
+            return [list(value) if isinstance(value, list) else value for value in values]
+        return [
+            add(total, value) if isinstance(value, list) else total + value
+            for total, value in zip(totals, values)
+        ]
+
+    merged: Snapshot = {'requests': {}, 'latency': {}, 'queries': {}, 'renders': {}, 'caches': {}}
+    for snap in snapshots:
+        for *key, count in snap['requests']:
+            merged['requests'][tuple(key)] = merged['requests'].get(tuple(key), 0) + count
+        for name in ('latency', 'queries', 'renders', 'caches'):
+            for key, values in snap[name].items():
+                merged[name][key] = add(merged[name].get(key, []), values)
+    merged['requests'] = [[*key, count] for key, count in merged['requests'].items()]
+    return merged
+
+
+def collect() -> Snapshot:
+    """Return the metrics of every process serving the app (see `share`), or just this one"""
+    if _shared_dir is None:
+        return snapshot()
+
+    flush()
+    snapshots = []
+    for name in os.listdir(_shared_dir):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(_shared_dir, name), encoding='utf-8') as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):  # e.g. removed in between
+            continue
+    return merge(snapshots)
+
+
+def quantile(latency: list, q: float) -> Optional[float]:
+    """
+    Estimate the `q` quantile (e.g. 0.95) of the latencies in a histogram of `snapshot()['latency']`,
+    interpolating within the bucket it falls in (like Prometheus' `histogram_quantile`)
+    """
+    buckets, _, count = latency
+    if count == 0:
+        return None
+    rank = q * count
+    cumulative = 0
+    for idx, bucket_count in enumerate(buckets):
+        if cumulative + bucket_count >= rank and bucket_count > 0:
+            if idx == len(LATENCY_BUCKETS):  # +Inf bucket
+                return LATENCY_BUCKETS[-1]
+            lower = LATENCY_BUCKETS[idx - 1] if idx > 0 else 0.0
+            return lower + (LATENCY_BUCKETS[idx] - lower) * (rank - cumulative) / bucket_count
+        cumulative += bucket_count
+    return LATENCY_BUCKETS[-1]
+
+
+def to_prometheus(metrics: Snapshot) -> str:
+    """Format the `metrics` (see `collect`) in the Prometheus text exposition format"""
+    def labels(**kwargs) -> str:
+        pairs = (
+            f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+            for name, value in kwargs.items()
+        )
+        return '{' + ','.join(pairs) + '}'
+
+    lines = [
+        '# HELP http_requests_total Requests served, by route, method and status.',
+        '# TYPE http_requests_total counter',
+    ]
+    for route, method, status, count in sorted(metrics['requests']):
+        lines.append(f'http_requests_total{labels(route=route, method=method, status=status)} {count}')
+
+    lines += [
+        '# HELP http_request_duration_seconds Time taken to serve requests (and stream their responses), by route.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for route, (buckets, total, count) in sorted(metrics['latency'].items()):
+        cumulative = 0
+        for bound, bucket_count in zip((*LATENCY_BUCKETS, '+Inf'), buckets):
+            cumulative += bucket_count
+            lines.append(
+                f'http_request_duration_seconds_bucket{labels(route=route, le=bound)} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{labels(route=route)} {total}')
+        lines.append(f'http_request_duration_seconds_count{labels(route=route)} {count}')
+
+    for name, idx, kind, help_ in (
+        ('sql_queries_total', 0, 'counter', 'SQL queries made, by route.'),
+        ('sql_query_seconds_total', 1, 'counter', 'Time taken by SQL queries, by route.'),
+        ('sql_rows_fetched_total', 2, 'counter', 'Rows returned by SQL queries, by route.'),
+    ):
+        lines += [f'# HELP {name} {help_}', f'# TYPE {name} {kind}']
+        for route, totals in sorted(metrics['queries'].items()):
+            lines.append(f'{name}{labels(route=route)} {totals[idx]}')
+
+    for name, idx, help_ in (
+        ('template_renders_total', 0, 'Requests rendering templates, by route.'),
+        ('template_render_seconds_total', 1, 'Time taken to render templates (and the tables in them), by route.'),
+    ):
+        lines += [f'# HELP {name} {help_}', f'# TYPE {name} counter']
+        for route, totals in sorted(metrics['renders'].items()):
+            lines.append(f'{name}{labels(route=route)} {totals[idx]}')
+
+    for name, idx, help_ in (
+        ('cache_hits_total', 0, 'Hits of the caches of rendered pages, by cache.'),
+        ('cache_misses_total', 1, 'Misses of the caches of rendered pages, by cache.'),
+    ):
+        lines += [f'# HELP {name} {help_}', f'# TYPE {name} counter']
+        for cache, totals in sorted(metrics['caches'].items()):
+            lines.append(f'{name}{labels(cache=cache)} {totals[idx]}')
+
+    return '\n'.join(lines) + '\n'
@@ -1,7 +1,10 @@
-from typing import Dict, List
+import keyword
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Mapping, MutableMapping, Tuple
 from data import (
     ConstrainedString,
     Field,
+    invalid_field_msg,
     Number,
     OptionalDate,
     OptionalNumber,
@@ -9,21 +12,100 @@ from data import (
     ValidationFailedError,
     String,
     Date,
-    Year
+    Year,
+    parsers,
+    validators,
 )
 # pylint: disable=not-an-iterable, no-member
 
 
-class Entity:
+def _generate_methods(class_name: str, fields: List[Field]) -> Dict[str, Callable]:
+    """
+    Generate the `__init__`, `as_dict` and `as_tuple` of an Entity with `fields`,
+    with the loops over the fields unrolled, e.g. for `Club`
+    ```
+    def __init__(self, **kwargs):
+        value = kwargs['club_name']
+        if not validate_0(value):
+            raise ValidationFailedError(invalid_field_msg(field_0, value))
+        self.club_name = value
+
+    def as_dict(self):
+        return {'club_name': None if self.club_name == '' else self.club_name}
+    ```
+    """
+    namespace: Dict[str, Any] = {
+        'ValidationFailedError': ValidationFailedError,
+        'invalid_field_msg': invalid_field_msg,
+    }
+    init_lines = ['def __init__(self, **kwargs):']
+    dict_items = []
+    tuple_items = []
+    for idx, field in enumerate(fields):
+        name = field.name
+        if not name.isidentifier() or keyword.iskeyword(name):
+            raise TypeError(f'Field name `{name}` must be a valid attribute name')
+        namespace[f'field_{idx}'] = field
+        namespace[f'validate_{idx}'] = partial(validators.resolve(field), field)
+        init_lines += [
+            f'    value = kwargs[{name!r}]',
+            f'    if not validate_{idx}(value):',
+            f'        raise ValidationFailedError(invalid_field_msg(field_{idx}, value))',
+            f'    self.{name} = value',
+        ]
+        # Empty fields should be NULL (None)
+        value = f"None if self.{name} == '' else self.{name}"
+        dict_items.append(f'{name!r}: {value}')
+        tuple_items.append(f'{value},')
+    if len(fields) == 0:
+        init_lines.append('    pass')
+
+    source = '\n'.join([
+        *init_lines,
+        'def as_dict(self):',
+        f'    return {{{", ".join(dict_items)}}}',
+        'def as_tuple(self):',
+        f'    return ({" ".join(tuple_items)})',
+    ])
+    exec(compile(source, '<entity>', 'exec'), namespace)  # pylint: disable=exec-used
+    methods = {name: namespace[name] for name in ('__init__', 'as_dict', 'as_tuple')}
+    for method in methods.values():
+        method.__qualname__ = f'{class_name}.{method.__name__}'
+    return methods
+
+
+class EntityMeta(type):
+    """
+    Metaclass of `Entity`, which generates `__slots__`, `__init__`, `as_dict`
+    and `as_tuple` for the `fields` of each Entity subclass when it is created,
+    and resolves the parser of each field (`field_parsers`, see `data.parsers`).
+    Entities are created for every record validated, so they don't have a `__dict__`,
+    and their methods don't loop over their fields.
+    """
+
+    def __new__(mcs, name: str, bases: Tuple[type, ...], namespace: Dict[str, Any]):
+        fields = namespace.get('fields', NotImplemented)
+        if fields is NotImplemented:  # e.g. `Entity`
+            namespace.setdefault('__slots__', ())
+        else:
+            namespace['__slots__'] = tuple(field.name for field in fields)
+            namespace['field_parsers'] = parsers.resolve_all(fields)
+            for method_name, method in _generate_methods(name, fields).items():
+                namespace.setdefault(method_name, method)
+        return super().__new__(mcs, name, bases, namespace)
+
+
+class Entity(metaclass=EntityMeta):
     """
     Base class that all Entity subclasses must inherit from.
 
     Subclasses must have a `fields` attribute consisting of
-    a list of fields.
+    a list of fields. (see `EntityMeta` for the methods generated from them)
     """
     entity: str = NotImplemented
     fields: List[Field] = NotImplemented
     search_fields: List[Field] = NotImplemented
+    field_parsers: List[Callable] = NotImplemented  # of each of the `fields`, in the same order
 
     def __init__(self, **kwargs):
         for field in self.fields:
@@ -31,8 +113,7 @@ class Entity:
             if field.validate(value):
                 setattr(self, field.name, value)
             else:
-                raise ValidationFailedError(
-                    f'Invalid field, `{field.name}`: `{value}`')
+                raise ValidationFailedError(invalid_field_msg(field, value))
 
     def __repr__(self):
         return f'{self.__class__.__name__}("{self.name}")'
@@ -60,9 +141,67 @@ class Entity:
             rec[field.name] = value
         return rec
 
+    def as_tuple(self):
+        """Returns the values of the record, in the same order as `fields`. See `as_dict`"""
+        return tuple(self.as_dict().values())
+
     def get(self, key):
         return getattr(self, key)
 
+    @classmethod
+    def to_db(cls, record: Mapping[str, Any]) -> dict:
+        """Convert the fields of the entity in `record` to the values stored in the db (see `to_db`)"""
+        return to_db(record, cls.fields)
+
+    @classmethod
+    def from_db(cls, records: List[MutableMapping[str, Any]]) -> list:
+        """Convert the fields of the entity in `records` found in the db (see `from_db`)"""
+        return from_db(records, cls.fields)
+
+
+def db_fields(column_names: Iterable[str]) -> List[Field]:
+    """
+    Return the fields of any entity named in `column_names` (e.g. the columns of
+    records found by a collection) which are stored as different values in the db
+    """
+    column_names = set(column_names)
+    fields = {}
+    for entity in ENTITIES.values():
+        for field in entity.fields:
+            if field.name in column_names and type(field).from_db is not Field.from_db:
+                fields.setdefault(field.name, field)
+    return list(fields.values())
+
+
+def to_db(record: Mapping[str, Any], fields: List[Field]) -> dict:
+    """
+    Return a copy of `record` with the values of the `fields` in it converted
+    to the values stored in the db (e.g. dates as YYYYMMDD integers, see `Field.to_db`)
+    """
+    db_record = dict(record)
+    for field in fields:
+        if field.name in db_record:
+            db_record[field.name] = field.to_db(db_record[field.name])
+    return db_record
+
+
+def from_db(records: List[MutableMapping[str, Any]], fields: List[Field]) -> list:
+    """
+    Convert the values of the `fields` in the `records` found in the db
+    back to the values of the fields (see `Field.from_db`), in place.
+
+    Return
+    - `records`
+    """
+    fields = [field for field in fields if type(field).from_db is not Field.from_db]
+    if len(records) == 0 or len(fields) == 0:
+        return records
+    fields = [field for field in fields if field.name in records[0]]
+    for record in records:
+        for field in fields:
+            record[field.name] = field.from_db(record[field.name])
+    return records
+
 
 class Student(Entity):
     """
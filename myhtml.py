@@ -2,8 +2,12 @@
 HTML module to generate HTML forms, tables and editable tables that act as forms.
 """
 
-from typing import Any, List
-from data import ConstrainedString, Field
+import json
+from functools import lru_cache
+from html import escape
+from operator import itemgetter
+from typing import Any, Callable, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+from data import ConstrainedString, Field, FieldRegistry
 
 
 def input_tag(**kwargs):
@@ -24,6 +28,167 @@ def table_input(**kwargs):
     return input_tag(**{'class': 'table-input'}, **kwargs)
 
 
+def value_attr(value: Any) -> str:
+    """
+    Generate the ` value="..."` attribute of an input tag, following the same rules as `input_tag`
+    """
+    if value is False or value is None:
+        return ''
+    if value is True:
+        return ' value'
+    return f' value="{value}"'
+
+
+def options_html(options: Iterable[Any]) -> str:
+    """Generate the `<option>` elements of a select element"""
+    return ''.join([f'<option value="{option}">{option}</option>' for option in options])
+
+
+def label_tag(label: str, for_: str) -> str:
+    return f'<label for="{for_}">{label}</label>'
+
+
+def select_tag(name: str, options_html_: str) -> str:
+    """Generate a select element (dropdown) containing the `<option>` elements `options_html_`"""
+    return f'<select name="{name}" id="{name}">{options_html_}</select>'
+
+
+# ------------------------------
+# Row templates
+# Each table row template is compiled once per (table class, headers) and
+# then filled with 1 join per row, instead of rebuilding every cell's markup
+# ------------------------------
+RowTemplate = Callable[[list], str]
+
+
+@lru_cache(maxsize=None)
+def _row_values_getter(headers: Tuple[Field, ...]) -> Callable[[Mapping], Sequence]:
+    """Compile a function returning the values of a row's data (a dict) under each of the headers"""
+    getter = itemgetter(*[header.name for header in headers])
+    if len(headers) == 1:  # itemgetter returns the value itself instead of a tuple
+        return lambda data: (getter(data),)
+    return getter
+
+
+@lru_cache(maxsize=None)
+def _record_row_template(headers: Tuple[Field, ...]) -> RowTemplate:
+    """Compile the row template of a `RecordTable`"""
+    template = '<tr>' + '<td>{}</td>' * len(headers) + '</tr>'
+    return lambda row: template.format(*row)
+
+
+# functions compiling the template of a cell in an `EditableRecordTable`
+# (filled by the cell's value) for a header, by field type
+editable_cells = FieldRegistry('editable cell')
+
+# functions rendering the cell of a header in a row inserted into an `EditableRecordTable`,
+# by field type
+new_row_cells = FieldRegistry('new row cell')
+
+
+@editable_cells.register(Field)
+def _editable_cell_template(header: Field, form_id: str) -> Callable[[Any], str]:
+    """Compile the template of a cell with a regular input"""
+    old_input = f'<td><input class="table-input" type="hidden" name="old:{header.name}"'
+    new_input = (
+        f' form="{form_id}">'
+        f'<input class="table-input" type="{header.html_input_type}" name="new:{header.name}"'
+    )
+    end = f' form="{form_id}"></td>'
+
+    def cell(item: Any) -> str:
+        value = value_attr(item)
+        return f'{old_input}{value}{new_input}{value}{end}'
+    return cell
+
+
+@editable_cells.register(ConstrainedString)
+def _editable_dropdown_template(header: Field, form_id: str) -> Callable[[Any], str]:
+    """
+    Compile the template of a cell with a dropdown,
+    precomputing the options with each constraint selected (listed first)
+    """
+    old_input = f'<td><input class="table-input" type="hidden" name="old:{header.name}"'
+    select = f' form="{form_id}"><select name="new:{header.name}" form="{form_id}">'
+    constraints = header.constraints
+    all_options = options_html(constraints)
+    selected_options = {
+        selected: options_html([selected, *(c for c in constraints if c != selected)])
+        for selected in constraints
+    }
+
+    def dropdown_cell(item: Any) -> str:
+        options = selected_options.get(item)
+        if options is None:
+            options = f'<option value="{item}">{item}</option>{all_options}'
+        return f'{old_input}{value_attr(item)}{select}{options}</select></td>'
+    return dropdown_cell
+
+
+@lru_cache(maxsize=None)
+def _editable_row_template(headers: Tuple[Field, ...], form_id: str) -> RowTemplate:
+    """Compile the row template of an `EditableRecordTable`"""
+    cells = [
+        compile_cell(header, form_id)
+        for compile_cell, header in zip(editable_cells.resolve_all(headers), headers)
+    ]
+    end = (
+        f'<td><select id="method" name="method" form="{form_id}">'
+        '<option value="UPDATE">Update</option>'
+        '<option value="DELETE">Delete</option>'
+        '</select></td></tr>'
+    )
+
+    def row_template(row: list, key: Any = None) -> str:
+        tr = '<tr>' if key is None else f'<tr data-key="{key_attr(key)}">'
+        return ''.join([tr, *[cell(item) for cell, item in zip(cells, row)], end])
+    return row_template
+
+
+def key_attr(key: Sequence[Any]) -> str:
+    """The key of a row (see `Collection.key_sql`) as JSON, escaped for an attribute"""
+    return escape(json.dumps(list(key), separators=(',', ':')))
+
+
+@lru_cache(maxsize=None)
+def _delta_row_template(headers: Tuple[Field, ...], form_id: str) -> Callable[[dict], str]:
+    """Compile the row template of a submittable `RecordDeltaTable`"""
+    cells = [
+        (
+            f'<td><input class="table-input" type="hidden" name="old:{header.name}"',
+            f' form="{form_id}"><input class="table-input" type="hidden" name="new:{header.name}"',
+            f' form="{form_id}">',
+        )
+        for header in headers
+    ]
+
+    def row_template(row: dict) -> str:
+        method = row['method']
+        deleted = method == 'DELETE'
+        html = [f'<tr class="tr-{method.lower()}">']
+        for (old_input, new_input, end), old_item, new_item in zip(cells, row['old'], row['new']):
+            # strikethrough to show deleted
+            display = f'🗑️<s>{old_item}</s>' if deleted else new_item
+            html.append(
+                f'{old_input}{value_attr(old_item)}{new_input}{value_attr(new_item)}{end}{display}</td>')
+        html.append(
+            f'<td class="td-hide"><input class="table-input" type="hidden" name="method"'
+            f'{value_attr(method)} form="{form_id}"></td></tr>'
+        )
+        return ''.join(html)
+    return row_template
+
+
+def _delta_row_no_submit(row: dict) -> str:
+    """Fill the row of a `RecordDeltaTable` that is not submittable"""
+    method = row['method']
+    if method == 'DELETE':  # strikethrough to show deleted
+        cells = [f'<td>🗑️<s>{old_item}</s></td>' for old_item in row['old']]
+    else:
+        cells = [f'<td>{new_item}</td>' for new_item in row['new']]
+    return ''.join([f'<tr class="tr-{method.lower()}">', *cells, '</tr>'])
+
+
 class RecordForm:
     """
     Encapsulates data for a form, and contains methods for
@@ -66,9 +231,7 @@ class RecordForm:
         Return
         - None
         """
-        self.__inputs.append(
-            f'<label for="{kwargs.get("for_")}">{label}</label>'
-        )
+        self.__inputs.append(label_tag(label, kwargs.get("for_")))
 
     def __add_input(self, type: str, name: str, value: str):
         """
@@ -94,13 +257,7 @@ class RecordForm:
         Add a labelled select element to the form. Works as a dropdown menu.
         """
         self.__add_label(label, for_=name)
-        html = f'<select name="{name}" id="{name}">'
-        for option in options:
-            html += f'<option value="{option}">{option}</option>'
-        # for key, value in options.items():
-        #     html += f'<option value="{key}">{value}</option>'
-        html += '</select>'
-        self.__inputs.append(html)
+        self.__inputs.append(select_tag(name, options_html(options)))
 
     def text_input(self, label: str, name: str, value: str = ''):
         """
@@ -168,11 +325,11 @@ class RecordForm:
         Return:
         - str (HTML format)
         """
-        html = f'<form action="{self.action()}" method="{self.method()}">'
-        for elem_html in self.__inputs:  # elem_html is str
-            html += elem_html
-        html += '</form>'
-        return html
+        return ''.join([
+            f'<form action="{self.action()}" method="{self.method()}">',
+            *self.__inputs,  # each is a str
+            '</form>',
+        ])
 
 
 class RecordTable:
@@ -197,38 +354,56 @@ class RecordTable:
             f'(headers="{self.headers}")'
         )
 
-    def rows(self):
-        return self._rows
+    def rows(self) -> List[Sequence]:
+        """Return the values of each row, in the same order as the headers"""
+        row_values = _row_values_getter(tuple(self.headers))
+        return [row_values(data) for data in self._rows]
 
-    def add_row(self, data: dict):
+    def add_row(self, data: Mapping):
         """
         Add a row to the table from data.
         Data keys must match table headers.
+        The data is not copied, the values under each header are only read when rendering.
 
         Arguments
-        - data: dict
+        - data: dict (or a `Record` found in the db)
           The row to be added to the table.
 
         Return
         - None
         """
-        row = []
-        for header in self.headers:
-            row.append(data[header.name])
-        self._rows.append(row)
+        self._rows.append(data)
+
+    def _iter_row_values(self) -> Iterator[Sequence]:
+        """Yield the values of each row, in the same order as the headers"""
+        return map(_row_values_getter(tuple(self.headers)), self._rows)
 
     def _table_headers_html(self) -> str:
         """Generate the headers of the table within a `<tr>` tag"""
-        html = '<tr>'
-        for header in self.headers:
-            html += f'<th>{header.label}</th>'
-        html += '</tr>'
-        return html
+        return ''.join(['<tr>', *[f'<th>{header.label}</th>' for header in self.headers], '</tr>'])
+
+    def _row_template(self) -> RowTemplate:
+        """Return the compiled template used to fill each row of the table"""
+        return _record_row_template(tuple(self.headers))
+
+    def iter_html(self) -> Iterator[str]:
+        """
+        Generate HTML for the table one row at a time, so that the table
+        can be streamed without building it as a whole first.
+
+        Arguments:
+        - None
+
+        Return:
+        - Iterator[str] (HTML format)
+        """
+        yield '<table>' + self._table_headers_html()
+        yield from map(self._row_template(), self._iter_row_values())
+        yield '</table>'
 
     def html(self) -> str:
         """
-        Generate HTML for the form.
-        Each input element has an id that is the same as its name.
+        Generate HTML for the table.
 
         Arguments:
         - None
@@ -236,16 +411,7 @@ class RecordTable:
         Return:
         - str (HTML format)
         """
-        html = '<table>'
-        html += self._table_headers_html()
-        for row in self._rows:
-            html += '<tr>'
-            for item in row:
-                html += f'<td>{item}</td>'
-            html += '</tr>'
-        html += '</table>'
-
-        return html
+        return ''.join(self.iter_html())
 
 
 class RecordTableForm(RecordTable):
@@ -282,89 +448,136 @@ class RecordTableForm(RecordTable):
 class EditableRecordTable(RecordTableForm):
     """
     Display an html RecordTable with the ability to edit each rows/record's fields.
+
+    Rows added with their key (see `Collection.key_sql`) are marked with it, so that
+    static/js/edit_table.js (if included in the page) can submit only the changed rows
+    as JSON keyed by the rows' keys. Otherwise every row's `old:`, `new:` and `method`
+    fields are submitted.
     """
 
-    def __dropdown(self, options: list, header_name: str, item: Any) -> str:
-        html = f'<select name="new:{header_name}" form="{self.form_id}">'
-        html += f'<option value="{item}">{item}</option>'
-        if item in options:
-            options.remove(item)
-        for option in options:
-            html += f'<option value="{option}">{option}</option>'
-        html += '</select>'
-        html += '</td>'
-        return html
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._keys = []
 
-    def html(self) -> str:
-        html = self._form_html()
-        html += '<table id="edit-table">'
-        html += self._table_headers_html()
-        for row in self.rows():
-            html += '<tr>'
-            for idx, item in enumerate(row):
-                header = self.headers[idx]
-                header_type = header.html_input_type
-                if isinstance(header, ConstrainedString):  # is dropdown
-                    constraints = header.constraints.copy()
-                    html += '<td>'
-                    html += table_input(type="hidden", name="old:"+header.name, value=item, form=self.form_id)
-                    html += self.__dropdown(constraints, header.name, item)
-                    html += '</td>'
-                else:  # not dropdown, just regular input
-                    html += f'''<td>
-                        {table_input(type="hidden", name="old:"+header.name, value=item, form=self.form_id)}
-                        {table_input(type=header_type, name="new:"+header.name, value=item, form=self.form_id)}
-                        </td>'''
-            html += f'''<td>
-                <select id="method" name="method" form="{self.form_id}">
-                    <option value="UPDATE">Update</option>
-                    <option value="DELETE">Delete</option>
-                </select>
-                </td>'''
-            html += '</tr>'
-        html += '</table>'
+    def add_row(self, data: Mapping, key: Optional[Sequence[Any]] = None):
+        """
+        Add a row to the table from data (see `RecordTable.add_row`),
+        with the `key` identifying the row in the db
+        """
+        super().add_row(data)
+        self._keys.append(key)
 
+    def _row_template(self) -> RowTemplate:
+        return _editable_row_template(tuple(self.headers), self.form_id)
+
+    def iter_html(self) -> Iterator[str]:
+        yield (
+            self._form_html()
+            + f'<table id="edit-table" data-form-id="{self.form_id}">'
+            + self._table_headers_html()
+        )
+        yield from map(self._row_template(), self._iter_row_values(), self._keys)
         # Inject js to dynamically add/insert <tr> with <inputs> & appropriate data
-        html += self.__js_insert_row_button()
-        html += table_input(type="submit", value="Save Changes", form=self.form_id)
-        return html
+        yield (
+            '</table>'
+            + _js_insert_row_button(tuple(self.headers), self.form_id)
+            + table_input(type="submit", value="Save Changes", form=self.form_id)
+        )
+
+    def html(self) -> str:
+        return ''.join(self.iter_html())
 
-    def __js_insert_row_button(self) -> str:
-        """Generate the html/js for the button to add a new row of records"""
-        _new_inputs = []
+
+class VirtualEditableRecordTable(EditableRecordTable):
+    """
+    Display an `EditableRecordTable` whose rows are sent as JSON, and only rendered
+    as inputs in the browser when scrolled into view (see static/js/virtual_table.js,
+    which the page must include). Submits the same fields as an `EditableRecordTable`.
+
+    Used for big tables, which would otherwise need an input for every field of every row.
+    """
+
+    rows_per_chunk = 500  # rows serialised at a time when streaming
+
+    def __headers_json(self) -> str:
+        headers = []
         for header in self.headers:
-            header_type = header.html_input_type
-            if isinstance(header, ConstrainedString):  # is dropdown
-                _new_td = f'''<td>
-                    {table_input(type="hidden", name="old:"+header.name, value="", form=self.form_id)}
-                    <select name="new:{header.name}" form="{self.form_id}">'''
-                dropdown_options = header.constraints
-                for option in dropdown_options:
-                    _new_td += f'<option value="{option}">{option}</option>'
-                _new_td += '</select></td>'
-                _new_inputs.append(_new_td)
-            else:
-                _new_inputs.append(
-                    '<td>' +
-                    table_input(type="hidden", name="old:"+header.name, value="", form=self.form_id) +
-                    table_input(type=header_type, name="new:"+header.name, form=self.form_id) +
-                    '</td>'
-                )
-        _new_inputs = ''.join(_new_inputs)
-
-        return f'''<script>
-            function insertRow() {{
-                const tr = document.createElement("tr");
-                tr.className = "tr-insert";
-                tr.innerHTML = `{_new_inputs}` + 
-                    `<td>
-                    <input type="hidden" name="method" value="INSERT" form="{self.form_id}">
-                    <button onclick="event.target.parentNode.parentNode.remove();">Remove</button>
-                    </td>`;
-                document.getElementById("edit-table").appendChild(tr);
-            }}
-            </script>
-            <button onclick="insertRow()">+</button>'''
+            headers.append({
+                'name': header.name,
+                'type': header.html_input_type,
+                'options': header.constraints,  # null if not a dropdown
+            })
+        return json.dumps(headers, separators=(',', ':'))
+
+    def iter_html(self) -> Iterator[str]:
+        rows_id = f'{self.form_id}-rows'
+        insert_id = f'{self.form_id}-insert'
+        yield (
+            self._form_html()
+            + f'<div class="virtual-table" data-form-id="{self.form_id}" '
+            + f'data-rows-id="{rows_id}" data-insert-id="{insert_id}">'
+            + '<table id="edit-table"><thead>' + self._table_headers_html() + '</thead>'
+            + '<tbody></tbody></table></div>'
+            + f'<script type="application/json" id="{rows_id}">'
+            + '{"headers":' + self.__headers_json() + ',"rows":['
+        )
+        rows = self._rows
+        row_values = _row_values_getter(tuple(self.headers))
+        for start in range(0, len(rows), self.rows_per_chunk):
+            chunk = [row_values(data) for data in rows[start:start + self.rows_per_chunk]]
+            chunk = json.dumps(chunk, separators=(',', ':'))
+            chunk = chunk[1:-1].replace('</', '<\\/')  # strip [], and don't end the <script>
+            yield (',' if start > 0 else '') + chunk
+        keys = json.dumps(self._keys, separators=(',', ':')).replace('</', '<\\/')
+        yield (
+            '],"keys":' + keys + '}</script>'
+            + f'<button type="button" id="{insert_id}">+</button>'
+            + table_input(type="submit", value="Save Changes", form=self.form_id)
+        )
+
+
+@new_row_cells.register(Field)
+def _new_row_input(header: Field, form_id: str) -> str:
+    return (
+        '<td>' +
+        table_input(type="hidden", name="old:"+header.name, value="", form=form_id) +
+        table_input(type=header.html_input_type, name="new:"+header.name, form=form_id) +
+        '</td>'
+    )
+
+
+@new_row_cells.register(ConstrainedString)
+def _new_row_dropdown(header: Field, form_id: str) -> str:
+    return (
+        '<td>' +
+        table_input(type="hidden", name="old:"+header.name, value="", form=form_id) +
+        f'<select name="new:{header.name}" form="{form_id}">' +
+        options_html(header.constraints) +
+        '</select></td>'
+    )
+
+
+@lru_cache(maxsize=None)
+def _js_insert_row_button(headers: Tuple[Field, ...], form_id: str) -> str:
+    """Generate the html/js for the button to add a new row of records to an `EditableRecordTable`"""
+    _new_inputs = ''.join([
+        render_cell(header, form_id)
+        for render_cell, header in zip(new_row_cells.resolve_all(headers), headers)
+    ])
+
+    return f'''<script>
+        function insertRow() {{
+            const tr = document.createElement("tr");
+            tr.className = "tr-insert";
+            tr.innerHTML = `{_new_inputs}` + 
+                `<td>
+                <input type="hidden" name="method" value="INSERT" form="{form_id}">
+                <button onclick="event.target.parentNode.parentNode.remove();">Remove</button>
+                </td>`;
+            document.getElementById("edit-table").appendChild(tr);
+        }}
+        </script>
+        <button onclick="insertRow()">+</button>'''
 
 
 class RecordDeltaTable(RecordTableForm):
@@ -382,57 +595,28 @@ class RecordDeltaTable(RecordTableForm):
         return self.__add_row(data['old'], data['new'], data['method'])
 
     def __add_row(self, old_data: dict, new_data: dict, method: str):
-        old_rows = []
-        new_rows = []
-        for header in self.headers:
-            old_rows.append(old_data[header.name])
-            new_rows.append(new_data[header.name])
+        old_rows = [old_data[header.name] for header in self.headers]
+        new_rows = [new_data[header.name] for header in self.headers]
         self._rows.append({'old': old_rows, 'new': new_rows, 'method': method})
 
-    def html(self) -> str:
+    def rows(self) -> List[dict]:
+        return self._rows
+
+    def _row_template(self) -> Callable[[dict], str]:
         if not self.submittable:
-            return self.__html_no_submit()
-
-        html = self._form_html()
-        html += '<table>'
-        html += self._table_headers_html()
-        for row in self.rows():
-            method = row['method']
-            html += f'<tr class="tr-{method.lower()}">'
-            for i, new_item in enumerate(row['new']):
-                old_item = row['old'][i]
-                header = self.headers[i]
-                if method == 'DELETE':  # strikethrough to show deleted
-                    new_item_display = f'🗑️<s>{old_item}</s>'
-                else:
-                    new_item_display = new_item
-
-                html += f'''<td>
-                    {table_input(type="hidden", name="old:"+header.name, value=old_item, form=self.form_id)}
-                    {table_input(type="hidden", name="new:"+header.name, value=new_item, form=self.form_id)}
-                    {new_item_display}
-                    </td>'''
-            html += f'''<td class="td-hide">
-                {table_input(type="hidden", name="method", value=method, form=self.form_id)}
-                </td>'''
-            html += '</tr>'
-        html += '</table>'
-        html += table_input(type="submit", value="Save Changes", form=self.form_id)
-        return html
-
-    def __html_no_submit(self) -> str:
-        html = '<table>'
-        html += self._table_headers_html()
-        for row in self.rows():
-            method = row['method']
-            html += f'<tr class="tr-{method.lower()}">'
-            for i, new_item in enumerate(row['new']):
-                old_item = row['old'][i]
-                if method == 'DELETE':  # strikethrough to show deleted
-                    new_item_display = f'🗑️<s>{old_item}</s>'
-                else:
-                    new_item_display = new_item
-                html += f'<td>{new_item_display}</td>'
-            html += '</tr>'
-        html += '</table>'
-        return html
+            return _delta_row_no_submit
+        return _delta_row_template(tuple(self.headers), self.form_id)
+
+    def iter_html(self) -> Iterator[str]:
+        if not self.submittable:
+            yield '<table>' + self._table_headers_html()
+            yield from map(self._row_template(), self.rows())
+            yield '</table>'
+            return
+
+        yield self._form_html() + '<table>' + self._table_headers_html()
+        yield from map(self._row_template(), self.rows())
+        yield '</table>' + table_input(type="submit", value="Save Changes", form=self.form_id)
+
+    def html(self) -> str:
+        return ''.join(self.iter_html())
@@ -0,0 +1,364 @@
+"""
+Production server for the app, using every core of the machine.
+
+The app (and its templates) is loaded once in a master process, which then forks
+`--workers` worker processes sharing its memory copy-on-write. Every worker accepts
+connections from the same listening socket, and serves them with a pool of `--threads`
+threads. A worker with every thread busy stops accepting, leaving new connections to the
+other workers. The master restarts workers that die, and takes backups of the db in a
+separate process (see `database.backup`). Each worker makes its writes to the db with a
+single writer thread, which commits the writes of concurrent requests together (see
+`database.writer`). Every process logs to stderr through a queue, as JSON lines by default
+(see `logs`).
+
+```
+python server.py                           # 1 worker per core, 8 threads each, on port 5000
+python server.py --workers 4 --threads 16 --port 8000
+python server.py --no-build-assets         # serve static/dist as it is (see `assets`)
+kill -HUP <master pid>                     # replace the workers, finishing their requests first
+kill -TERM <master pid>                    # (or Ctrl+C) stop, finishing all requests first
+```
+
+Needs `os.fork`, so it only runs on Linux/macOS. For development, use Flask's server:
+```
+flask --app main run --debug
+```
+"""
+
+import argparse
+import gc
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from flask import Flask
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+import assets
+import database
+import logs
+import metrics
+from database import versions
+from database.backup import BackupScheduler
+
+
+HOST = '0.0.0.0'
+PORT = 5000
+WORKERS = os.cpu_count() or 1
+THREADS = 8
+GRACEFUL_TIMEOUT = 30.0  # seconds a stopped worker has to finish its requests
+POLL_INTERVAL = 0.5  # seconds between checks of the workers by the master
+BACKLOG = 2048  # connections waiting to be accepted by any worker
+MIN_UPTIME = 1.0  # seconds, workers exiting sooner are restarted after this long
+
+logger = logging.getLogger('server')  # not __main__ when run as a script
+
+
+class RequestHandler(WSGIRequestHandler):
+    # close each connection after its response, so idle keep-alive connections
+    # never tie up a thread
+    protocol_version = 'HTTP/1.0'
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    WSGI server serving the `app` from the (non-blocking) listening socket `sock`,
+    handling up to `threads` requests at a time in a pool of threads.
+    """
+
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, app: Flask, sock: socket.socket, threads: int) -> None:
+        self.__idle = threading.BoundedSemaphore(threads)
+        self.__pool = ThreadPoolExecutor(threads, thread_name_prefix='request')
+        host, port = sock.getsockname()[:2]
+        super().__init__(host, port, app, handler=RequestHandler, fd=sock.fileno())
+
+    def process_request(self, request, client_address) -> None:
+        self.__pool.submit(self.__process_request, request, client_address)
+
+    def __process_request(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:  # pylint: disable=broad-except
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.__idle.release()
+
+    def _handle_request_noblock(self) -> None:
+        # only accept a connection once a thread is free to handle it
+        self.__idle.acquire()
+        handled = False
+        try:
+            handled = self.__accept()
+        finally:
+            if not handled:
+                self.__idle.release()
+
+    def __accept(self) -> bool:
+        """Accept a connection and hand it to a thread, return whether it was handed off"""
+        try:
+            request, client_address = self.get_request()
+        except OSError:  # e.g. another worker accepted the connection first
+            return False
+        request.setblocking(True)
+        if not self.verify_request(request, client_address):
+            self.shutdown_request(request)
+            return False
+        self.process_request(request, client_address)
+        return True
+
+    def close(self) -> None:
+        """Close the server, after finishing the requests being handled"""
+        self.__pool.shutdown(wait=True)
+        self.server_close()
+
+
+def preload(app: Flask, shared_dir: str) -> None:
+    """
+    Load everything the workers share before they are forked, so it is only loaded once
+    and shared copy-on-write: the templates, and the data versions of the tables
+    (moved into shared memory, see `database.versions`). The workers' metrics and slow
+    queries are combined through the empty directory `shared_dir` (see `metrics.share`).
+    """
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    versions.share(coll_type.table_name for coll_type in database.COLLECTION_TYPES.values())
+    metrics.share(os.path.join(shared_dir, 'metrics'))
+    database.slow_queries.share(os.path.join(shared_dir, 'slow_queries'))
+
+    # keep the garbage collector from touching (and so copying) the preloaded objects
+    gc.collect()
+    gc.freeze()
+
+
+def _spawn(target: Callable[[], None]) -> int:
+    """Fork a child process running `target`, return its pid"""
+    pid = os.fork()
+    if pid != 0:
+        return pid
+
+    # the master stops its children, e.g. when Ctrl+C is sent to all of them
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    status = 0
+    try:
+        target()
+    except BaseException:  # pylint: disable=broad-except
+        sys.excepthook(*sys.exc_info())
+        status = 1
+    finally:
+        database.writer.close_all()  # os._exit skips atexit
+        logs.shutdown()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)  # never return into the master's code
+
+
+def _run_worker(app: Flask, sock: socket.socket, threads: int) -> None:
+    """Serve the `app` until SIGTERM-ed, then finish the requests being handled"""
+    server = PooledWSGIServer(app, sock, threads)
+
+    def stop(signum, frame) -> None:
+        # shutdown() waits for serve_forever() to return, so it can't be called from it
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever(POLL_INTERVAL)
+    finally:
+        server.close()
+        metrics.flush()
+
+
+class Master:
+    """
+    Forks and keeps `workers` worker processes serving the `app` from the socket `sock`,
+    and a process taking backups of the db if `backups`, until stopped.
+
+    Signals
+    - SIGHUP: start new workers, and gracefully stop the old ones
+    - SIGTERM, SIGINT: gracefully stop all workers, then return from `run`
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        sock: socket.socket,
+        workers: int,
+        threads: int,
+        backups: bool = True,
+        graceful_timeout: float = GRACEFUL_TIMEOUT,
+    ) -> None:
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.threads = threads
+        self.backups = backups
+        self.graceful_timeout = graceful_timeout
+        self.__workers: Dict[int, float] = {}  # {pid: time started}
+        self.__backup_pid: Optional[int] = None
+        self.__signals: List[int] = []
+
+    def run(self) -> None:
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda signum, frame: self.__signals.append(signum))
+
+        self.__spawn_workers(self.workers)
+        if self.backups:
+            self.__backup_pid = _spawn(BackupScheduler(database.DB_PATH).run)
+        logger.info(
+            'Serving on %s with %d workers of %d threads (master pid %d)',
+            self.sock.getsockname(), self.workers, self.threads, os.getpid())
+
+        while True:
+            while self.__signals:
+                signum = self.__signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.__restart()
+                else:
+                    self.__stop()
+                    return
+            self.__reap()
+            time.sleep(POLL_INTERVAL)
+
+    def __spawn_workers(self, count: int) -> None:
+        for _ in range(count):
+            pid = _spawn(lambda: _run_worker(self.app, self.sock, self.threads))
+            self.__workers[pid] = time.monotonic()
+
+    def __reap(self) -> None:
+        """Collect the children that exited, replacing any that died"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            if pid == self.__backup_pid:
+                logger.warning('Backup process %d exited (%d), restarting it', pid, status)
+                self.__backup_pid = _spawn(BackupScheduler(database.DB_PATH).run)
+            elif pid in self.__workers:
+                started = self.__workers.pop(pid)
+                logger.warning('Worker %d exited (%d), restarting it', pid, status)
+                if time.monotonic() - started < MIN_UPTIME:  # e.g. failing on start
+                    time.sleep(MIN_UPTIME)
+                self.__spawn_workers(1)
+
+    def __restart(self) -> None:
+        """Replace all the workers, starting the new ones before stopping the old ones"""
+        old_workers = list(self.__workers)
+        self.__workers.clear()
+        self.__spawn_workers(self.workers)
+        self.__terminate(old_workers)
+        logger.info('Restarted %d workers', len(old_workers))
+
+    def __stop(self) -> None:
+        workers = list(self.__workers)
+        self.__workers.clear()
+        if self.__backup_pid is not None:
+            workers.append(self.__backup_pid)
+            self.__backup_pid = None
+        self.__terminate(workers)
+
+    def __terminate(self, pids: List[int]) -> None:
+        """
+        SIGTERM the processes `pids`, and wait for them to exit,
+        SIGKILL-ing those still running after `graceful_timeout` seconds
+        """
+        for pid in pids:
+            self.__kill(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.graceful_timeout
+        remaining = set(pids)
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0] != 0:
+                        remaining.discard(pid)
+                except ChildProcessError:  # already reaped
+                    remaining.discard(pid)
+            time.sleep(0.1)
+
+        for pid in remaining:
+            self.__kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+
+    @staticmethod
+    def __kill(pid: int, signum: int) -> None:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:  # already exited
+            pass
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    if not hasattr(os, 'fork'):
+        sys.exit('server.py needs os.fork, use `flask --app main run` on this platform')
+
+    parser = argparse.ArgumentParser(description='Serve the app with pre-forked worker processes.')
+    parser.add_argument('--host', default=HOST, help='host to listen on')
+    parser.add_argument('--port', type=int, default=PORT, help='port to listen on')
+    parser.add_argument(
+        '--workers', type=int, default=WORKERS, help='number of worker processes (default: 1 per core)')
+    parser.add_argument(
+        '--threads', type=int, default=THREADS, help='number of request threads per worker')
+    parser.add_argument(
+        '--graceful-timeout', type=float, default=GRACEFUL_TIMEOUT,
+        help='seconds a stopped worker has to finish its requests')
+    parser.add_argument(
+        '--backups', action=argparse.BooleanOptionalAction, default=True,
+        help='take online backups of the db in the background')
+    parser.add_argument(
+        '--build-assets', action=argparse.BooleanOptionalAction, default=True,
+        help='fingerprint the static files before starting (see assets.py)')
+    parser.add_argument(
+        '--log-level', type=str.upper, choices=logs.LEVELS, default=None,
+        help=f'level of the logs (default: $LOG_LEVEL or {logs.LEVEL})')
+    parser.add_argument(
+        '--log-format', choices=logs.FORMATS, default=None,
+        help='format of the logs written to stderr (default: $LOG_FORMAT or json)')
+    parser.add_argument(
+        '--slow-query-ms', type=float, default=database.slow_queries.threshold * 1000,
+        help='log queries taking at least this long (see /admin/slow-queries)')
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.threads < 1:
+        parser.error('--workers and --threads must be at least 1')
+    database.slow_queries.threshold = args.slow_query_ms / 1000
+    logs.setup(args.log_level, args.log_format)
+    if args.build_assets:
+        try:
+            assets.build()
+        except OSError as err:  # e.g. read only, the last build (if any) is served
+            logger.warning('Failed to build the static files: %s', err)
+
+    from main import create_app
+    app = create_app()
+    shared_dir = tempfile.mkdtemp(prefix='nyjc-')
+    preload(app, shared_dir)
+
+    sock = socket.create_server((args.host, args.port), backlog=BACKLOG)
+    sock.setblocking(False)  # every worker waits for connections, but only 1 gets each
+    try:
+        Master(
+            app, sock, args.workers, args.threads, args.backups, args.graceful_timeout,
+        ).run()
+    finally:
+        sock.close()
+        shutil.rmtree(shared_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
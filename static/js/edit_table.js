@@ -0,0 +1,62 @@
+/*
+ * Submit only the changed rows of an editable table (see `EditableRecordTable` in myhtml.py).
+ *
+ * Every row of the table has hidden `old:<field>` inputs, `new:<field>` inputs and
+ * a `method` input, and rows found in the db are marked with their key (`data-key`).
+ * When the form is submitted, its fields are replaced by a single `changes` field with
+ * the rows that were changed, inserted or deleted as JSON, in the format
+ * ```
+ * [
+ *     {"method": "UPDATE", "key": [...], "new": {...changed fields}},
+ *     {"method": "DELETE", "key": [...]},
+ *     {"method": "INSERT", "new": {...}}
+ * ]
+ * ```
+ * If any row is missing its key, every row is submitted as usual.
+ */
+
+function rowChange(tr) {
+    const method = tr.querySelector('[name="method"]').value;
+    const change = { method };
+    if (method !== 'INSERT') {
+        change.key = JSON.parse(tr.dataset.key);
+    }
+    if (method === 'DELETE') {
+        return change;
+    }
+
+    change.new = {};
+    for (const input of tr.querySelectorAll('[name^="new:"]')) {
+        const field = input.name.slice('new:'.length);
+        const old = tr.querySelector(`[name="old:${field}"]`);
+        if (method === 'INSERT' || old === null || input.value !== old.value) {
+            change.new[field] = input.value;
+        }
+    }
+    if (method === 'UPDATE' && Object.keys(change.new).length === 0) {
+        return null;  // unchanged
+    }
+    return change;
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    const table = document.getElementById('edit-table');
+    if (table === null) {
+        return;
+    }
+    const form = document.getElementById(table.dataset.formId);
+
+    form.addEventListener('formdata', (e) => {
+        const rows = [...table.querySelectorAll('tr')].filter((tr) => tr.querySelector('[name="method"]'));
+        const keyed = rows.every((tr) => tr.dataset.key !== undefined || tr.querySelector('[name="method"]').value === 'INSERT');
+        if (!keyed) {
+            return;
+        }
+
+        const changes = rows.map(rowChange).filter((change) => change !== null);
+        for (const name of new Set(e.formData.keys())) {
+            e.formData.delete(name);
+        }
+        e.formData.set('changes', JSON.stringify(changes));
+    });
+});
@@ -0,0 +1,197 @@
+/*
+ * Virtualized editable tables (see `VirtualEditableRecordTable` in myhtml.py).
+ *
+ * The rows of the table are sent as JSON, and only the rows scrolled into view
+ * are rendered as inputs. Edits are kept in memory, and when the form is submitted
+ * only the changed rows are added to it as a `changes` field, keyed by the rows' keys
+ * (see static/js/edit_table.js). If any row is missing its key, every row is added to it
+ * as hidden `old:<field>`, `new:<field>` and `method` inputs instead.
+ */
+
+class VirtualEditTable {
+    constructor(container) {
+        const data = JSON.parse(document.getElementById(container.dataset.rowsId).textContent);
+        this.headers = data.headers;  // [{name, type, options}], options is null if not a dropdown
+        this.rows = data.rows.map((values, idx) => ({
+            key: data.keys[idx],
+            old: values,
+            new: values.slice(),
+            method: 'UPDATE',
+        }));
+
+        this.container = container;
+        this.tbody = container.querySelector('tbody');
+        this.form = document.getElementById(container.dataset.formId);
+        this.rowHeight = 0;  // measured after the first render
+        this.overscan = 10;  // rows rendered above & below the ones in view
+        this.renderPending = false;
+
+        container.addEventListener('scroll', () => this.scheduleRender());
+        window.addEventListener('resize', () => this.scheduleRender());
+        if (this.rows.every((row) => row.key !== null)) {
+            this.form.addEventListener('formdata', (e) => e.formData.set('changes', this.changes()));
+        } else {
+            this.form.addEventListener('submit', () => this.addRowsToForm());
+        }
+        this.render();
+    }
+
+    scheduleRender() {
+        if (this.renderPending) {
+            return;
+        }
+        this.renderPending = true;
+        window.requestAnimationFrame(() => {
+            this.renderPending = false;
+            this.render();
+        });
+    }
+
+    render() {
+        const rowHeight = this.rowHeight || 40;
+        const inView = Math.ceil(this.container.clientHeight / rowHeight);
+        const first = Math.max(0, Math.floor(this.container.scrollTop / rowHeight) - this.overscan);
+        const last = Math.min(this.rows.length, first + inView + 2 * this.overscan);
+
+        const fragment = document.createDocumentFragment();
+        fragment.appendChild(this.spacer(first * rowHeight));
+        for (let idx = first; idx < last; idx++) {
+            fragment.appendChild(this.renderRow(idx));
+        }
+        fragment.appendChild(this.spacer((this.rows.length - last) * rowHeight));
+        this.tbody.replaceChildren(fragment);
+
+        if (!this.rowHeight && last > first) {
+            this.rowHeight = this.tbody.children[1].getBoundingClientRect().height;
+            if (this.rowHeight) {
+                this.render();
+            }
+        }
+    }
+
+    spacer(height) {
+        const tr = document.createElement('tr');
+        tr.style.height = `${height}px`;
+        return tr;
+    }
+
+    renderRow(idx) {
+        const row = this.rows[idx];
+        const tr = document.createElement('tr');
+        if (row.method !== 'UPDATE') {
+            tr.className = `tr-${row.method.toLowerCase()}`;
+        }
+
+        this.headers.forEach((header, col) => {
+            const value = row.new[col] ?? '';
+            let input;
+            if (header.options) {  // is dropdown
+                input = document.createElement('select');
+                const options = header.options.includes(value) ? header.options : [value, ...header.options];
+                for (const option of options) {
+                    input.add(new Option(option, option));
+                }
+            } else {
+                input = document.createElement('input');
+                input.className = 'table-input';
+                input.type = header.type;
+            }
+            input.value = value;
+            // no name, so only the hidden inputs added on submit are submitted
+            input.addEventListener('change', (e) => {
+                e.target.value = e.target.value.trim();
+                row.new[col] = e.target.value;
+            });
+
+            const td = document.createElement('td');
+            td.appendChild(input);
+            tr.appendChild(td);
+        });
+
+        const td = document.createElement('td');
+        if (row.method === 'INSERT') {
+            const remove = document.createElement('button');
+            remove.type = 'button';
+            remove.textContent = 'Remove';
+            remove.addEventListener('click', () => {
+                this.rows.splice(idx, 1);
+                this.render();
+            });
+            td.appendChild(remove);
+        } else {
+            const method = document.createElement('select');
+            method.add(new Option('Update', 'UPDATE'));
+            method.add(new Option('Delete', 'DELETE'));
+            method.value = row.method;
+            method.addEventListener('change', (e) => {
+                row.method = e.target.value;
+                tr.className = row.method === 'DELETE' ? 'tr-delete' : '';
+            });
+            td.appendChild(method);
+        }
+        tr.appendChild(td);
+        return tr;
+    }
+
+    insertRow() {
+        this.rows.push({
+            key: null,
+            old: this.headers.map(() => ''),
+            new: this.headers.map((header) => (header.options ? header.options[0] : '')),
+            method: 'INSERT',
+        });
+        this.render();
+        this.container.scrollTop = this.container.scrollHeight;
+    }
+
+    changes() {
+        const changes = [];
+        for (const row of this.rows) {
+            if (row.method === 'DELETE') {
+                changes.push({ method: row.method, key: row.key });
+                continue;
+            }
+            const changed = {};
+            this.headers.forEach((header, col) => {
+                const value = String(row.new[col] ?? '');
+                if (row.method === 'INSERT' || value !== String(row.old[col] ?? '')) {
+                    changed[header.name] = value;
+                }
+            });
+            if (row.method === 'INSERT') {
+                changes.push({ method: row.method, new: changed });
+            } else if (Object.keys(changed).length > 0) {
+                changes.push({ method: row.method, key: row.key, new: changed });
+            }
+        }
+        return JSON.stringify(changes);
+    }
+
+    addRowsToForm() {
+        const fragment = document.createDocumentFragment();
+        const addHidden = (name, value) => {
+            const input = document.createElement('input');
+            input.type = 'hidden';
+            input.name = name;
+            input.value = value ?? '';
+            fragment.appendChild(input);
+        };
+
+        for (const row of this.rows) {
+            this.headers.forEach((header, col) => {
+                addHidden(`old:${header.name}`, row.method === 'INSERT' ? '' : row.old[col]);
+                addHidden(`new:${header.name}`, row.new[col]);
+            });
+            addHidden('method', row.method);
+        }
+        this.form.replaceChildren(fragment);
+    }
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    for (const container of document.querySelectorAll('.virtual-table')) {
+        const table = new VirtualEditTable(container);
+        const insertButton = document.getElementById(container.dataset.insertId);
+        insertButton.addEventListener('click', () => table.insertRow());
+    }
+});